@@ -0,0 +1,356 @@
+"""
+Benchmarks of the dataset readers, transforms and generators on synthetic files.
+
+Usage (from the repository root):
+
+    python -m benchmarks.run_benchmarks --output results.json
+    python -m benchmarks.run_benchmarks --output new.json --compare results.json
+
+Every case runs in a fresh process such that its peak RSS can be reported.
+The exit code is non-zero if a check fails, e.g. the import of the package
+pulls in h5py or exceeds IMPORT_TIME_BUDGET_S.
+"""
+import argparse
+import json
+import multiprocessing
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import h5py
+import numpy as np
+
+from pathlib import Path
+
+from . import synthetic
+
+
+REPO_ROOT = Path(__file__).parents[1]
+GENERATION_CODE_PATH = REPO_ROOT.joinpath('generation_code')
+
+CASES = {}
+
+# importing the package must stay cheap, checked on every run of import_package
+IMPORT_TIME_BUDGET_S = 0.25
+
+
+def case(name):
+    def register(fn):
+        CASES[name] = fn
+        return fn
+    return register
+
+
+def _peak_rss_mb():
+    # ru_maxrss is in KB on linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 ** 2) if sys.platform == 'darwin' else peak / 1024
+
+
+def _samples_per_s(dataset, indices):
+    t = time.perf_counter()
+    for i in indices:
+        dataset[i]
+    return len(indices) / (time.perf_counter() - t)
+
+
+def _bench_reader(make_dataset, n_samples, batch_size, seed=0):
+    from chofer_tda_datasets.utils.collate import collate_padded
+
+    t = time.perf_counter()
+    dataset = make_dataset()
+    len(dataset)
+    dataset[0]
+    open_s = time.perf_counter() - t
+
+    n = min(n_samples, len(dataset))
+    rng = np.random.RandomState(seed)
+    random_indices = rng.randint(len(dataset), size=n)
+
+    result = {
+        'n_samples': n,
+        'open_s': open_s,
+        'sequential_samples_per_s': _samples_per_s(dataset, range(n)),
+        'random_samples_per_s': _samples_per_s(dataset, random_indices),
+    }
+
+    t = time.perf_counter()
+    for start in range(0, n, batch_size):
+        collate_padded([dataset[i] for i in random_indices[start:start + batch_size]])
+    result['batched_samples_per_s'] = n / (time.perf_counter() - t)
+
+    return result
+
+
+@case('reader_nips_provider')
+def bench_nips_provider(folder, n_samples, batch_size):
+    from chofer_tda_datasets import Animal
+    return _bench_reader(lambda: Animal(folder, download=False), n_samples, batch_size)
+
+
+@case('reader_one_file')
+def bench_one_file(folder, n_samples, batch_size):
+    from chofer_tda_datasets import Reddit12kJmlr
+    from chofer_tda_datasets.transforms import Hdf5GroupToDict
+    return _bench_reader(lambda: Reddit12kJmlr(folder, data_transforms=[Hdf5GroupToDict()]),
+                         n_samples, batch_size)
+
+
+@case('reader_sciNe01')
+def bench_sciNe01(folder, n_samples, batch_size):
+    from chofer_tda_datasets import SciNe01EEGBottomTopFiltration
+    from chofer_tda_datasets.transforms import Hdf5GroupToDict
+    return _bench_reader(lambda: SciNe01EEGBottomTopFiltration(folder, data_transforms=[Hdf5GroupToDict()]),
+                         n_samples, batch_size)
+
+
+@case('reader_reininghaus')
+def bench_reininghaus(folder, n_samples, batch_size):
+    from chofer_tda_datasets import Reininghaus2014ShrecReal
+    from chofer_tda_datasets.transforms import Hdf5GroupToDict
+    return _bench_reader(lambda: Reininghaus2014ShrecReal(folder, data_transforms=[Hdf5GroupToDict()]),
+                         n_samples, batch_size)
+
+
+@case('transforms_one_file')
+def bench_transforms(folder, n_samples, batch_size):
+    from chofer_tda_datasets import Reddit12kJmlr
+    from chofer_tda_datasets.transforms import Hdf5GroupToDict, Hdf5GroupListSelector, Hdf5GroupToDictSelector
+
+    transforms = {
+        'Hdf5GroupToDict': Hdf5GroupToDict(),
+        'Hdf5GroupListSelector': Hdf5GroupListSelector(['dim_0', 'dim_1_ess']),
+        'Hdf5GroupToDictSelector': Hdf5GroupToDictSelector(['dim_0', 'dim_1_ess']),
+    }
+
+    dataset = Reddit12kJmlr(folder)
+    n = min(n_samples, len(dataset))
+    groups = [dataset[i][0] for i in range(n)]
+
+    result = {'n_samples': n}
+    for name, transform in transforms.items():
+        t = time.perf_counter()
+        for grp in groups:
+            transform(grp)
+        result[name + '_samples_per_s'] = n / (time.perf_counter() - t)
+
+    return result
+
+
+@case('ragged_store')
+def bench_ragged_store(folder, n_samples, batch_size):
+    from chofer_tda_datasets import Animal, Reddit12kJmlr
+
+    result = {}
+    for name, make_dataset in (('nips_provider', lambda: Animal(folder, download=False)),
+                               ('one_file', lambda: Reddit12kJmlr(folder))):
+        t = time.perf_counter()
+        dataset = make_dataset()
+        dataset.get_batch([0])
+        result[name + '_open_s'] = time.perf_counter() - t
+
+        n = min(n_samples, len(dataset))
+        indices = np.random.RandomState(0).permutation(len(dataset))[:n]
+        t = time.perf_counter()
+        for start in range(0, n, batch_size):
+            dataset.get_batch(indices[start:start + batch_size])
+        result[name + '_batched_samples_per_s'] = n / (time.perf_counter() - t)
+
+    return result
+
+
+@case('tar_shards')
+def bench_tar_shards(folder, n_samples, batch_size):
+    from chofer_tda_datasets import Reddit12kJmlr
+    from chofer_tda_datasets.utils.tar_shards import export_tar_shards, TarShardDataset
+
+    dataset = Reddit12kJmlr(folder)
+    n = min(n_samples, len(dataset))
+    shards_folder = Path(folder).joinpath('tar_shards')
+
+    t = time.perf_counter()
+    export_tar_shards(dataset, str(shards_folder), shard_size=1 << 20, indices=range(n))
+    result = {'n_samples': n, 'export_samples_per_s': n / (time.perf_counter() - t)}
+
+    t = time.perf_counter()
+    for _ in TarShardDataset(str(shards_folder.joinpath('shard.index.json')), buffer_size=batch_size * 10):
+        pass
+    result['stream_samples_per_s'] = n / (time.perf_counter() - t)
+
+    return result
+
+
+def _metis_files(folder, graphs):
+    paths = []
+    for graph_id, graph_dict in graphs.items():
+        path = Path(folder).joinpath('{}.metis'.format(graph_id))
+        edges = {tuple(sorted((u, v))) for u, d in graph_dict.items() for v in d['neighbors']}
+        with open(str(path), 'w') as f:
+            f.write('{} {}\n'.format(len(graph_dict), len(edges)))
+            for u in range(len(graph_dict)):
+                f.write(' '.join(str(v) for v in graph_dict[u]['neighbors']) + '\n')
+        paths.append(path)
+
+    return paths
+
+
+@case('generator_graph')
+def bench_generator_graph(folder, n_samples, batch_size):
+    sys.path.insert(0, str(GENERATION_CODE_PATH))
+    from generation.utils.graph import read_graph_from_metis_file, read_csr_from_metis_file
+
+    graphs, labels = synthetic.write_reddit_graphs(n_graphs=min(n_samples, 200))
+    metis_paths = _metis_files(folder, graphs)
+
+    t = time.perf_counter()
+    for path in metis_paths:
+        read_graph_from_metis_file(str(path))
+    result = {'n_jobs': len(graphs),
+              'metis_read_jobs_per_s': len(graphs) / (time.perf_counter() - t)}
+
+    t = time.perf_counter()
+    for path in metis_paths:
+        read_csr_from_metis_file(str(path))
+    result['metis_csr_read_jobs_per_s'] = len(graphs) / (time.perf_counter() - t)
+
+    try:
+        # the generators need pershombox
+        from generation import reddit_graph
+    except ImportError:
+        result['job_jobs_per_s'] = None
+        return result
+
+    store_dir = Path(folder).joinpath('reddit_graphs.store')
+    reddit_graph.GraphStore.write(store_dir,
+                                  ((i, int(labels[i]), list(g.keys()), [g[v]['neighbors'] for v in g])
+                                   for i, g in graphs.items()))
+    job_args = list(reddit_graph.job_args_iter(store_dir))
+    t = time.perf_counter()
+    for args in job_args:
+        reddit_graph.job(args)
+    result['job_jobs_per_s'] = len(job_args) / (time.perf_counter() - t)
+
+    return result
+
+
+_IMPORT_SCRIPT = """
+import sys, time
+t = time.perf_counter()
+import chofer_tda_datasets
+print(time.perf_counter() - t, 'h5py' in sys.modules, 'requests' in sys.modules)
+"""
+
+
+@case('import_package')
+def bench_import_package(folder, n_samples, batch_size):
+    # a fresh interpreter, this process has h5py imported already
+    times = []
+    for _ in range(5):
+        output = subprocess.check_output([sys.executable, '-c', _IMPORT_SCRIPT], cwd=str(REPO_ROOT)).decode().split()
+        times.append(float(output[0]))
+
+    # importing the package must not import h5py or requests, the
+    # dataset modules are imported on first access of a class
+    return {'import_s': min(times),
+            'imports_h5py': output[1] == 'True',
+            'imports_requests': output[2] == 'True'}
+
+
+def _run_case(args):
+    name, folder, n_samples, batch_size = args
+    result = CASES[name](folder, n_samples, batch_size)
+    result['peak_rss_mb'] = _peak_rss_mb()
+    return result
+
+
+def run(folder, cases=None, n_samples=1000, batch_size=32):
+    cases = list(CASES) if cases is None else cases
+    ctx = multiprocessing.get_context('spawn')
+
+    results = {}
+    for name in cases:
+        with ctx.Pool(1) as p:
+            results[name] = p.apply(_run_case, ((name, str(folder), n_samples, batch_size),))
+        print(name, json.dumps(results[name]))
+
+    return results
+
+
+def _meta():
+    try:
+        revision = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=str(REPO_ROOT)).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+
+    return {'git_revision': revision,
+            'time': time.time(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'numpy': np.__version__,
+            'h5py': h5py.__version__}
+
+
+def compare(new, old):
+    """
+    Prints new / old for every numeric entry present in both results.
+    """
+    for name, new_result in new['results'].items():
+        old_result = old['results'].get(name, {})
+        for k, v in new_result.items():
+            v_old = old_result.get(k)
+            if isinstance(v, (int, float)) and isinstance(v_old, (int, float)) and v_old != 0:
+                print('{:30} {:40} {:10.3f}'.format(name, k, v / v_old))
+
+
+def check(results):
+    """
+    Returns the failed checks of the results, empty if all passed.
+    """
+    failures = []
+    result = results['results'].get('import_package')
+    if result is not None:
+        for module in ('h5py', 'requests'):
+            if result['imports_' + module]:
+                failures.append('import chofer_tda_datasets imports {}'.format(module))
+        if result['import_s'] > IMPORT_TIME_BUDGET_S:
+            failures.append('import chofer_tda_datasets takes {:.3f}s > {}s'.format(result['import_s'],
+                                                                                  IMPORT_TIME_BUDGET_S))
+
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', default=None, help='path of the json result file')
+    parser.add_argument('--compare', default=None, help='json result file of a previous run')
+    parser.add_argument('--folder', default=None, help='folder for the synthetic files, temporary if not given')
+    parser.add_argument('--cases', nargs='*', default=None, choices=sorted(CASES))
+    parser.add_argument('--n-samples', type=int, default=1000)
+    parser.add_argument('--batch-size', type=int, default=32)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        folder = synthetic.build_all(args.folder if args.folder is not None else tmp_dir)
+        results = {'meta': _meta(),
+                   'results': run(folder, args.cases, args.n_samples, args.batch_size)}
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare is not None:
+        with open(args.compare, 'r') as f:
+            compare(results, json.load(f))
+
+    failures = check(results)
+    if len(failures) > 0:
+        sys.exit('FAILED: ' + '; '.join(failures))
+
+    return results
+
+
+if __name__ == '__main__':
+    main()
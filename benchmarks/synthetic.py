@@ -0,0 +1,159 @@
+"""
+Builders of synthetic files in the layouts of the datasets of this package. The
+files are named like the files of the real datasets such that the dataset
+classes can be pointed to the folder they are written to.
+"""
+import h5py
+import numpy as np
+
+from pathlib import Path
+
+from chofer_tda_datasets.nips_2017 import Provider
+
+
+def random_diagram(rng, n_points, essential=False):
+    births = rng.rand(n_points)
+    if essential:
+        return births
+    deaths = births + rng.exponential(size=n_points)
+    return np.stack([births, deaths], axis=1)
+
+
+def _n_points(rng, n_samples, max_points):
+    # heavy tailed sizes, like the reddit threads
+    return np.minimum(rng.zipf(1.5, size=n_samples) * 10, max_points)
+
+
+def write_nips_provider_file(path, n_samples=1000, n_views=4, n_labels=10, max_points=500, seed=0):
+    rng = np.random.RandomState(seed)
+    labels = ['label_{}'.format(i) for i in range(n_labels)]
+    sample_labels = rng.randint(n_labels, size=n_samples)
+    n_points = _n_points(rng, n_samples, max_points)
+
+    provider = Provider()
+    for v in range(n_views):
+        view = {label: {} for label in labels}
+        for i in range(n_samples):
+            view[labels[sample_labels[i]]]['sample_{}'.format(i)] = random_diagram(rng, n_points[i])
+        provider.add_view('view_{}'.format(v), view)
+
+    provider.dump_as_h5(str(path))
+
+
+def write_one_file(path, n_samples=1000, max_points=2000, n_labels=5, seed=0):
+    """
+    Layout of the graph datasets, 'data'/<i>/dim_0, dim_0_ess, dim_1_ess.
+    """
+    rng = np.random.RandomState(seed)
+    n_points = _n_points(rng, n_samples, max_points)
+
+    with h5py.File(str(path), 'w') as f:
+        grp_data = f.create_group('data')
+        f.create_dataset('target', data=rng.randint(n_labels, size=n_samples))
+        grp_n_points = f.create_group('n_points')
+        grp_n_points.create_dataset('dim_0', data=n_points)
+        grp_n_points.create_dataset('dim_0_ess', data=np.ones(n_samples, dtype=int))
+        grp_n_points.create_dataset('dim_1_ess', data=n_points // 10)
+
+        for i in range(n_samples):
+            grp = grp_data.create_group(str(i))
+            grp.create_dataset('dim_0', data=random_diagram(rng, n_points[i]))
+            grp.create_dataset('dim_0_ess', data=random_diagram(rng, 1, essential=True))
+            grp.create_dataset('dim_1_ess', data=random_diagram(rng, n_points[i] // 10, essential=True))
+
+
+def write_sciNe01_file(path, n_samples=500, n_sensors=16, n_subjects=10, max_points=100, seed=0):
+    """
+    Layout of the SciNe01 pershom dataset, 'data'/<i>/<filtration>/<sensor>.
+    """
+    rng = np.random.RandomState(seed)
+
+    with h5py.File(str(path), 'w') as f:
+        grp_data = f.create_group('data')
+        f.create_dataset('target', data=rng.randint(7, size=n_samples))
+        f.create_dataset('group', data=rng.randint(2, size=n_samples))
+        f.create_dataset('run', data=rng.randint(25, size=n_samples))
+        f.create_dataset('sub_run', data=rng.randint(1, 6, size=n_samples))
+        subject = np.sort(rng.randint(n_subjects, size=n_samples))
+        f.create_dataset('subject', data=subject)
+        stops = np.searchsorted(subject, np.arange(n_subjects), side='right')
+        starts = np.searchsorted(subject, np.arange(n_subjects), side='left')
+        f.create_dataset('subject_index_range', data=np.stack([starts, stops], axis=1))
+        f.create_dataset('subject_int_2_str', data=np.array(['subject_{}'.format(s) for s in range(n_subjects)],
+                                                            dtype=object), dtype=h5py.special_dtype(vlen=str))
+        grp_sensor_cfg = f.create_group('sensor_configurations')
+        grp_sensor_cfg.create_dataset('all', data=np.arange(n_sensors))
+
+        grp_n_points = f.create_group('n_points')
+        n_points = {k: rng.randint(1, max_points, size=(n_samples, n_sensors)) for k in ('top', 'bottom')}
+        for k, v in n_points.items():
+            grp_n_points.create_dataset(k, data=v)
+
+        for i in range(n_samples):
+            grp = grp_data.create_group(str(i))
+            for filt_name in ('top', 'bottom'):
+                grp_filt = grp.create_group(filt_name)
+                for s in range(n_sensors):
+                    dgm = random_diagram(rng, n_points[filt_name][i, s]).astype(np.float32)
+                    grp_filt.create_dataset(str(s), data=dgm)
+
+
+def write_reininghaus_file(path, n_ids=200, freqs=(1, 2, 3, 4, 5), max_points=300, seed=0):
+    """
+    Layout of the Reininghaus 2014 datasets, 'data'/<id>/<freq>/<dim>.
+    """
+    rng = np.random.RandomState(seed)
+    id_freq = np.array([(i, freq) for i in range(n_ids) for freq in freqs], dtype='i8')
+    n_points = {dim: rng.randint(1, max_points, size=len(id_freq)) for dim in ('0', '1')}
+
+    with h5py.File(str(path), 'w') as f:
+        grp_data = f.create_group('data')
+        f.create_dataset('target', data=rng.randint(10, size=n_ids))
+        f.create_dataset('id_freq', data=id_freq)
+
+        grp_n_points = f.create_group('n_points')
+        for dim, v in n_points.items():
+            grp_n_points.create_dataset(dim, data=v)
+
+        for row, (i, freq) in enumerate(id_freq):
+            grp_freq = grp_data.require_group(str(i)).create_group(str(freq))
+            for dim in ('0', '1'):
+                grp_freq.create_dataset(dim, data=random_diagram(rng, n_points[dim][row]))
+
+
+def write_reddit_graphs(n_graphs=200, max_vertices=300, seed=0):
+    """
+    Returns graphs in the format of the reddit pickles, i.e.,
+    {graph_id: {node_id: {'neighbors': [...]}}}, and their labels.
+    """
+    rng = np.random.RandomState(seed)
+    graphs = {}
+    for graph_id in range(n_graphs):
+        n = rng.randint(5, max_vertices)
+        # random tree
+        parents = [rng.randint(i) for i in range(1, n)]
+        neighbors = {i: [] for i in range(n)}
+        for child, parent in enumerate(parents, start=1):
+            neighbors[child].append(parent)
+            neighbors[parent].append(child)
+        graphs[graph_id] = {i: {'neighbors': v} for i, v in neighbors.items()}
+
+    return graphs, rng.randint(2, size=n_graphs)
+
+
+def build_all(folder):
+    """
+    Writes one file of every layout to folder and returns the folder.
+    """
+    from chofer_tda_datasets import Animal, Reddit12kJmlr, SciNe01EEGBottomTopFiltration, \
+        Reininghaus2014ShrecReal
+
+    folder = Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+
+    write_nips_provider_file(folder.joinpath(Animal.provider_file_name))
+    write_one_file(folder.joinpath(Reddit12kJmlr.file_name))
+    write_sciNe01_file(folder.joinpath(SciNe01EEGBottomTopFiltration.file_name))
+    write_reininghaus_file(folder.joinpath(Reininghaus2014ShrecReal.file_name))
+
+    return folder
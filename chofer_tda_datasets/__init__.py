@@ -1,5 +1,42 @@
-from .nips_2017 import Animal, Mpeg7, Reddit_5K, Reddit_12K
-from .anon_eigenvalue_predict import Anon10kEigenvaluePredict, Anon1kEigenvaluePredict, Anon50kEigenvaluePredict
-from .reininghaus_2014 import *
-from .sciNe01_eeg import SciNe01EEGBottomTopFiltration, SciNe01EEGRawSignal
-from .reddit_jmlr import Reddit5kJmlr, Reddit12kJmlr
+"""
+The dataset classes are imported on first access, hence importing the package
+does not import h5py, requests or the modules of the other datasets.
+"""
+import importlib
+
+
+_LAZY_ATTRIBUTES = {
+    'Animal': '.nips_2017',
+    'Mpeg7': '.nips_2017',
+    'Reddit_5K': '.nips_2017',
+    'Reddit_12K': '.nips_2017',
+    'Anon1kEigenvaluePredict': '.anon_eigenvalue_predict',
+    'Anon10kEigenvaluePredict': '.anon_eigenvalue_predict',
+    'Anon50kEigenvaluePredict': '.anon_eigenvalue_predict',
+    'Reininghaus2014Shrec': '.reininghaus_2014',
+    'Reininghaus2014ShrecReal': '.reininghaus_2014',
+    'Reininghaus2014ShrecSynthetic': '.reininghaus_2014',
+    'SciNe01EEG': '.sciNe01_eeg',
+    'SciNe01EEGBottomTopFiltration': '.sciNe01_eeg',
+    'SciNe01EEGRawSignal': '.sciNe01_eeg',
+    'Reddit5kJmlr': '.reddit_jmlr',
+    'Reddit12kJmlr': '.reddit_jmlr',
+    # formerly exported by 'from .reininghaus_2014 import *'
+    'Hdf5SupervisedDatasetOneFile': '.utils.h5py_dataset',
+}
+
+__all__ = list(_LAZY_ATTRIBUTES)
+
+
+def __getattr__(name):
+    module_name = _LAZY_ATTRIBUTES.get(name)
+    if module_name is None:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
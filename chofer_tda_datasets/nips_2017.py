@@ -12,12 +12,15 @@ The code how the barcodes were generated from the origional data sets can be fou
     https://github.com/c-hofer/nips2017.
 
 """
-import h5py
 import numpy as np
-import os
 import os.path as pth
 
+from .utils import instrumentation
+from .utils.cache import DatasetCache
+from .utils.collate import concat_arrays
 from .utils.download import download_file_from_google_drive
+from .utils.ragged import RaggedStore
+from .utils.splits import SplitsMixin, SPLITS_FILE_SUFFIX
 
 
 # region Provider
@@ -120,6 +123,8 @@ class Provider:
                 self.str_2_int_label_map[label] = i + 1
 
     def dump_as_h5(self, file_path):
+        import h5py
+
         self._prepare_state_for_serialization()
 
         with h5py.File(file_path, 'w') as file:
@@ -149,6 +154,8 @@ class Provider:
                     meta_data_group.create_dataset(k, data=v)
 
     def read_from_h5(self, file_path):
+        import h5py
+
         with h5py.File(file_path, 'r') as file:
             # load data_views
             data_views = dict(file[self._serial_str_keys.data_views])
@@ -265,50 +272,122 @@ class DataSetException(Exception):
     pass
 
 
-class DataSetBase:
+class DataSetBase(SplitsMixin):
     google_drive_provider_id = None
     provider_file_name = None
+    # hex digest of the provider file, the download is verified against it if set and
+    # warns with the digest of the downloaded file (UnverifiedDownloadWarning) otherwise
+    provider_sha256 = None
 
-    def __init__(self, root_dir: str, download=True, sample_transforms: list=None):
+    def __init__(self, root_dir: str = None, download=True, sample_transforms: list=None):
+        """
+        If root_dir is None, the shared cache directory is used, see
+        utils.cache.DatasetCache.
+        """
         sample_transforms = [] if sample_transforms is None else sample_transforms
-        self.root_dir = pth.normpath(root_dir)
+        self._dataset_cache = DatasetCache(root_dir)
+        self.root_dir = self._dataset_cache.root
         self.data_transforms = sample_transforms
-        self._provider = None
+        self._provider_cache = None
+        self._ragged_store = None
+        self._ragged_store_state = None
         self.integer_labels = True
 
-        provider_exists = pth.isfile(self._provider_file_path)
-
-        if not provider_exists:
+        def fetch(path):
             print("Did not find data in {}!".format(self.root_dir))
+            print("Downloading ... ")
+            download_file_from_google_drive(self.google_drive_provider_id,
+                                            path,
+                                            sha256=self.provider_sha256)
 
-            if download:
-                print("Downloading ... ")
-                if not pth.isdir(self.root_dir):
-                    os.mkdir(self.root_dir)
-
-                download_file_from_google_drive(self.google_drive_provider_id,
-                                                self._provider_file_path)
+        self._dataset_cache.resolve(self.provider_file_name, fetch=fetch if download else None)
 
         provider_exists = pth.isfile(self._provider_file_path)
         if provider_exists:
             print('Found data!')
-            self._provider = Provider()
-            self._provider.read_from_h5(self._provider_file_path)
-
         else:
             raise DataSetException("Cannot find data in {}.".format(self.root_dir))
 
-        self.str_2_int_label = {str_label: int_label for int_label, str_label in enumerate(self._provider.labels)}
+        label_names = self._store.attrs['labels'] if self._store is not None else self._provider.labels
+        self.str_2_int_label = {str_label: int_label for int_label, str_label in enumerate(label_names)}
+
+    def close(self):
+        """
+        Releases the provider file in the cache, it may be evicted once no
+        process uses it anymore, see utils.cache.DatasetCache.
+        """
+        if getattr(self, '_dataset_cache', None) is not None:
+            self._dataset_cache.release(self.provider_file_name)
+            self._dataset_cache = None
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            # the interpreter may be shutting down
+            pass
 
     @property
     def _provider_file_path(self):
         return pth.join(self.root_dir, self.provider_file_name)
 
+    @property
+    def _provider(self):
+        # only read if needed, e.g. to build the store or by validate
+        if self._provider_cache is None:
+            self._provider_cache = Provider().read_from_h5(self._provider_file_path)
+        return self._provider_cache
+
+    @property
+    def _store(self):
+        # the memory-mapped store of the provider file if it was built already, see ragged_store
+        if self._ragged_store_state is None:
+            self._ragged_store = RaggedStore.open(self._provider_file_path)
+            self._ragged_store_state = 'opened'
+        return self._ragged_store
+
+    def ragged_store(self):
+        """
+        Returns the memory-mapped store of the provider file, see utils.ragged.
+        It is built on first use next to the provider file, None if it cannot
+        be written there, e.g. in a read-only data folder. Once it exists, all
+        datasets of the provider file read their samples from it.
+        """
+        if self._store is None and self._ragged_store_state != 'failed':
+            try:
+                self._ragged_store = RaggedStore.open_or_build(self._provider_file_path,
+                                                               lambda: (self._provider[i] for i in range(len(self._provider))),
+                                                               lambda: {'labels': self._provider.labels})
+            except OSError:
+                self._ragged_store_state = 'failed'
+
+        return self._ragged_store
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_provider_cache'] = None
+        return state
+
+    def _read(self, item):
+        store = self._store
+        if store is not None:
+            return store.get(item), str(store.targets[item])
+        return self._provider[item]
+
     def __getitem__(self, item):
-        x, y = self._provider[item]
+        if instrumentation.ENABLED:
+            with instrumentation.timed('read'):
+                x, y = self._read(item)
+            instrumentation.count('bytes_read', sum(getattr(v, 'nbytes', 0) for v in x.values()))
+
+            with instrumentation.timed('data_transform'):
+                for t in self.data_transforms:
+                    x = t(x)
+        else:
+            x, y = self._read(item)
 
-        for t in self.data_transforms:
-            x = t(x)
+            for t in self.data_transforms:
+                x = t(x)
 
         if self.integer_labels:
             y = self.str_2_int_label[y]
@@ -316,11 +395,56 @@ class DataSetBase:
         return x, y
 
     def __len__(self):
-        return len(self._provider)
+        return len(self._store) if self._store is not None else len(self._provider)
 
     @property
     def labels(self):
-        return [self[i][1] for i in range(len(self))]
+        return self._targets_at(np.arange(len(self))).tolist()
+
+    def n_points(self, key: str = None):
+        """
+        Returns the per sample number of points of the view key, of all views
+        if key is None.
+        """
+        store = self._store
+        if store is None:
+            views = [self._provider[i][0] for i in range(len(self._provider))]
+            return np.array([sum(len(x[k]) for k in (x if key is None else [key])) for x in views])
+
+        keys = store.keys if key is None else [key]
+        return sum(store.lengths(k) for k in keys)
+
+    def get_batch(self, indices, keys: [str] = None):
+        """
+        Returns ({view: FlatBatch}, labels) of the samples indices without
+        applying the sample transforms, see RaggedStore.get_batch. Builds the
+        ragged store on first use, if it cannot be written the views are
+        concatenated from the provider.
+        """
+        store = self.ragged_store()
+        if store is not None:
+            return store.get_batch(indices, keys), self._targets_at(indices)
+
+        views = [self._provider[int(i)][0] for i in indices]
+        keys = sorted(views[0]) if keys is None and len(views) > 0 else keys or []
+        return {k: concat_arrays([x[k] for x in views]) for k in keys}, self._targets_at(indices)
+
+    def _split_labels(self):
+        # the labels without applying the sample transforms
+        if self._store is not None:
+            return self._store.targets
+        label_map = self._provider.sample_id_to_label_map
+        return np.array([label_map[sample_id] for sample_id in self._provider.sample_ids])
+
+    def _targets_at(self, indices):
+        labels = self._split_labels()[indices]
+        if self.integer_labels:
+            labels = np.array([self.str_2_int_label[y] for y in labels])
+        return labels
+
+    @property
+    def _splits_file_path(self):
+        return self._provider_file_path + SPLITS_FILE_SUFFIX
 
 
 class Animal(DataSetBase):
@@ -1,9 +1,115 @@
+import numpy as np
+
 from .utils.h5py_dataset import Hdf5SupervisedDatasetOneFile
+from .utils.splits import SPLITS_FILE_SUFFIX
+
+
+class Reininghaus2014Shrec(Hdf5SupervisedDatasetOneFile):
+    id_freq_hdf5_key = 'id_freq'
+
+    def __init__(self,
+                 data_root_folder_path: str = None,
+                 data_transforms: [] = None,
+                 target_transforms: [] = None,
+                 download: bool = True,
+                 index_by_freq: bool = False,
+                 freqs: [int] = None):
+        """
+        By default the i-th sample is the group 'data'/<i> containing all
+        frequencies. If index_by_freq is True, every (id, freq) pair is a sample
+        of its own, i.e., the i-th sample is the group 'data'/<id>/<freq> where
+        (id, freq) is the i-th row of the flat id_freq table. The selection of
+        frequencies can be restricted by freqs.
+        """
+        super().__init__(data_root_folder_path=data_root_folder_path,
+                         data_transforms=data_transforms,
+                         target_transforms=target_transforms,
+                         download=download)
+
+        assert freqs is None or index_by_freq
+
+        self.index_by_freq = index_by_freq
+        self.freqs = sorted(set(int(f) for f in freqs)) if freqs is not None else None
+        self._id_freq = None
+        self._id_freq_rows = None
+
+        if index_by_freq:
+            id_freq = self._read_id_freq_table()
+            rows = np.arange(len(id_freq))
+            if freqs is not None:
+                rows = rows[np.isin(id_freq[:, 1], self.freqs)]
+            self._id_freq = id_freq[rows]
+            self._id_freq_rows = rows
+
+    def _read_id_freq_table(self):
+        h5file = self._h5py_file
+        if self.id_freq_hdf5_key in h5file:
+            return h5file[self.id_freq_hdf5_key][()]
+
+        # files generated before the table existed
+        rows = [(int(id), int(freq)) for id, grp_id in h5file[self.data_hdf5_key].items() for freq in grp_id.keys()]
+        return np.array(sorted(rows), dtype=np.int64).reshape(-1, 2)
+
+    @property
+    def id_freq(self):
+        return self._id_freq
+
+    def _get_data_i(self, index: int):
+        if not self.index_by_freq:
+            return super()._get_data_i(index)
+
+        id, freq = self._id_freq[index]
+        return self._h5py_file[self.data_hdf5_key][str(id)][str(freq)]
+
+    def _get_target_i(self, index: int):
+        if not self.index_by_freq:
+            return super()._get_target_i(index)
+
+        return self._h5py_file[self.target_hdf5_key][self._id_freq[index, 0]]
+
+    def __len__(self):
+        if not self.index_by_freq:
+            return super().__len__()
+
+        return len(self._id_freq)
+
+    def n_points(self, key: str = None):
+        # the generator stores the number of points per row of the id_freq table
+        n_points = super().n_points(key)
+        if self.index_by_freq:
+            return n_points[self._id_freq_rows]
+
+        ids = self._read_id_freq_table()[:, 0]
+        return np.bincount(ids, weights=n_points, minlength=len(self)).astype(np.int64)
+
+    def _store_rows(self, indices):
+        # the store holds the rows 'data'/<id> with all frequencies
+        assert not self.index_by_freq, 'get_batch is not available with index_by_freq'
+        return indices
+
+    @property
+    def targets(self):
+        targets = super().targets
+        if not self.index_by_freq:
+            return targets
+
+        return targets[self._id_freq[:, 0]]
+
+    def _targets_at(self, indices):
+        return self.targets[indices]
+
+    @property
+    def _splits_file_path(self):
+        # the samples differ if indexed by freq and with every selection of freqs
+        suffix = '' if not self.index_by_freq else '.by_freq'
+        if self.freqs is not None:
+            suffix += '_' + '_'.join(str(f) for f in self.freqs)
+        return str(self.file_path) + suffix + SPLITS_FILE_SUFFIX
 
 
-class Reininghaus2014ShrecReal(Hdf5SupervisedDatasetOneFile):
+class Reininghaus2014ShrecReal(Reininghaus2014Shrec):
     file_name = 'reininghaus_2014_shrec_real.h5'
 
 
-class Reininghaus2014ShrecSynthetic(Hdf5SupervisedDatasetOneFile):
+class Reininghaus2014ShrecSynthetic(Reininghaus2014Shrec):
     file_name = 'reininghaus_2014_shrec_synthetic.h5'
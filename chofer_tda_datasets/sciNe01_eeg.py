@@ -1,17 +1,134 @@
+import numpy as np
+
 from .utils.h5py_dataset import Hdf5SupervisedDatasetOneFile
+from .utils.splits import read_rows, SPLITS_FILE_SUFFIX
 
 
-class SciNe01EEGBottomTopFiltration(Hdf5SupervisedDatasetOneFile):
-    file_name = 'sciNe01_eeg_pershom_bottom_top_filtration.h5'
+class SciNe01EEGError(Exception):
+    pass
+
+
+class SciNe01EEG(Hdf5SupervisedDatasetOneFile):
+    subject_hdf5_key = 'subject'
+    subject_index_range_hdf5_key = 'subject_index_range'
+    subject_int_2_str_hdf5_key = 'subject_int_2_str'
+
+    def __init__(self,
+                 data_root_folder_path: str = None,
+                 data_transforms: [] = None,
+                 target_transforms: [] = None,
+                 download: bool = True,
+                 subjects: [] = None):
+        """
+        If subjects (subject ids as str or int) is given, only the samples of
+        these subjects are contained. As the samples of a subject are stored
+        consecutively, the selection is a list of contiguous index ranges.
+        """
+        super().__init__(data_root_folder_path=data_root_folder_path,
+                         data_transforms=data_transforms,
+                         target_transforms=target_transforms,
+                         download=download)
+
+        self.subjects = None if subjects is None else list(subjects)
+        self._indices = None
+
+        if subjects is not None:
+            ranges = self.subject_index_ranges
+            self._indices = np.concatenate([np.arange(*ranges[s]) for s in self._subject_ints(self.subjects)]
+                                           + [np.zeros(0, dtype=np.int64)])
+
+    def _subject_ints(self, subjects):
+        names = self.subject_names
+        str_2_int = {name: s_int for s_int, name in enumerate(names)}
+
+        subject_ints = []
+        for s in subjects:
+            if isinstance(s, str):
+                if s not in str_2_int:
+                    raise SciNe01EEGError('Unknown subject {}.'.format(s))
+                s = str_2_int[s]
+            subject_ints.append(int(s))
+
+        return sorted(set(subject_ints))
 
     @property
-    def sensor_configurations(self):
-        grp = self._h5py_file['sensor_configurations']
-        return {k: v[()] for k, v in grp.items()}
+    def subject_names(self):
+        h5file = self._h5py_file
+        if self.subject_int_2_str_hdf5_key in h5file:
+            return [s.decode() if isinstance(s, bytes) else s for s in h5file[self.subject_int_2_str_hdf5_key][()]]
 
+        return [str(s) for s in range(len(self.subject_index_ranges))]
 
-class SciNe01EEGRawSignal(Hdf5SupervisedDatasetOneFile):
-    file_name = 'sciNe01_eeg_raw_signal.h5'
+    @property
+    def subject_index_ranges(self):
+        """
+        Returns {subject int: (start, stop)} of the samples of each subject in
+        the file.
+        """
+        h5file = self._h5py_file
+        if self.subject_index_range_hdf5_key in h5file:
+            return {s: tuple(r) for s, r in enumerate(h5file[self.subject_index_range_hdf5_key][()].tolist())}
+
+        if self.subject_hdf5_key not in h5file:
+            raise SciNe01EEGError('{} has no subject table, it has to be regenerated.'.format(self.file_path))
+
+        # files with a per sample subject array only
+        subject = h5file[self.subject_hdf5_key][()]
+        ranges = {}
+        for s in np.unique(subject).tolist():
+            indices = np.flatnonzero(subject == s)
+            if indices[-1] - indices[0] + 1 != len(indices):
+                raise SciNe01EEGError('The samples of subject {} are not stored consecutively.'.format(s))
+            ranges[s] = (int(indices[0]), int(indices[-1]) + 1)
+
+        return ranges
+
+    def _file_index(self, index: int):
+        return index if self._indices is None else int(self._indices[index])
+
+    def _get_data_i(self, index: int):
+        return super()._get_data_i(self._file_index(index))
+
+    def _get_target_i(self, index: int):
+        return super()._get_target_i(self._file_index(index))
+
+    def __len__(self):
+        if self._indices is None:
+            return super().__len__()
+
+        return len(self._indices)
+
+    def _store_rows(self, indices):
+        return indices if self._indices is None else self._indices[indices]
+
+    def _read_rows(self, ds):
+        return ds[()] if self._indices is None else read_rows(ds, self._indices)
+
+    @property
+    def targets(self):
+        return self._read_rows(self._ds_target)
+
+    def n_points(self, key: str = None):
+        n_points = super().n_points(key)
+        return n_points if self._indices is None else n_points[self._indices]
+
+    def _split_groups(self, group_key: str):
+        return self._read_rows(self._h5py_file[group_key])
+
+    def _targets_at(self, indices):
+        if self._indices is None:
+            return super()._targets_at(indices)
+
+        return read_rows(self._ds_target, self._indices[indices])
+
+    @property
+    def _splits_file_path(self):
+        if self.subjects is None:
+            return super()._splits_file_path
+
+        # the samples differ for every selection of subjects
+        suffix = '.subjects_' + '_'.join(str(s) for s in self._subject_ints(self.subjects))
+        return str(self.file_path) + suffix + SPLITS_FILE_SUFFIX
 
     @property
     def sensor_configurations(self):
@@ -19,3 +136,9 @@ class SciNe01EEGRawSignal(Hdf5SupervisedDatasetOneFile):
         return {k: v[()] for k, v in grp.items()}
 
 
+class SciNe01EEGBottomTopFiltration(SciNe01EEG):
+    file_name = 'sciNe01_eeg_pershom_bottom_top_filtration.h5'
+
+
+class SciNe01EEGRawSignal(SciNe01EEG):
+    file_name = 'sciNe01_eeg_raw_signal.h5'
@@ -1,5 +1,7 @@
 import h5py
 
+from .utils.diagrams import map_diagrams, single, threshold_packed, top_k_packed, infinite_deaths_packed
+
 
 class Hdf5GroupListSelector:
     def __init__(self, keys: [str]):
@@ -36,3 +38,63 @@ class Hdf5GroupToDictSelector:
     def __call__(self, data_grp: h5py.Group):
         assert isinstance(data_grp, h5py.Group)
         return self.__select(data_grp, self.key_selection)
+
+
+class PersistenceThreshold:
+    """
+    Drops the points with death - birth < threshold from every diagram of the
+    sample (nested dicts / lists of arrays or a h5py group).
+    """
+    def __init__(self, threshold: float):
+        self.threshold = threshold
+
+    def __call__(self, x):
+        return map_diagrams(x, lambda dgm: threshold_packed(dgm, single(dgm), self.threshold)[0])
+
+    def __repr__(self):
+        return 'PersistenceThreshold({})'.format(self.threshold)
+
+
+class TopKPersistent:
+    """
+    Keeps the k most persistent points of every diagram of the sample.
+    """
+    def __init__(self, k: int):
+        self.k = k
+
+    def __call__(self, x):
+        return map_diagrams(x, lambda dgm: top_k_packed(dgm, single(dgm), self.k)[0])
+
+    def __repr__(self):
+        return 'TopKPersistent({})'.format(self.k)
+
+
+class InfiniteDeaths:
+    """
+    Clips (mode 'clip') or drops (mode 'drop') the points with infinite death,
+    see utils.diagrams.infinite_deaths_packed. Clipping essential-only
+    diagrams, e.g. 'dim_0_ess', needs value.
+    """
+    def __init__(self, mode: str = 'clip', value: float = None):
+        assert mode in ('clip', 'drop')
+        self.mode = mode
+        self.value = value
+
+    def __call__(self, x):
+        return map_diagrams(x, lambda dgm: infinite_deaths_packed(dgm, single(dgm), self.mode, self.value)[0])
+
+    def __repr__(self):
+        return 'InfiniteDeaths({!r}, {})'.format(self.mode, self.value)
+
+
+class Compose:
+    def __init__(self, transforms: []):
+        self.transforms = list(transforms)
+
+    def __call__(self, x):
+        for t in self.transforms:
+            x = t(x)
+        return x
+
+    def __repr__(self):
+        return 'Compose([{}])'.format(', '.join(repr(t) for t in self.transforms))
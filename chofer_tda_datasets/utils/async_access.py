@@ -0,0 +1,72 @@
+"""
+Asyncio facade for datasets. Reads run in a dedicated I/O thread pool, every
+I/O thread keeps its own open h5py handle of the dataset file, and concurrent
+requests for the same sample share a single read.
+"""
+import asyncio
+import concurrent.futures as futures
+import threading
+
+import h5py
+
+from .h5py_dataset import bind_h5py_file
+from .prefetch import materialize
+
+
+class AsyncDatasetAccess:
+    def __init__(self, dataset, n_workers: int = 4):
+        self.dataset = dataset
+        self.n_workers = n_workers
+        self._executor = futures.ThreadPoolExecutor(n_workers, thread_name_prefix='dataset_io')
+        self._file_path = getattr(dataset, 'file_path', None)
+        self._thread_state = threading.local()
+        self._handles = []
+        self._handles_lock = threading.Lock()
+        # (loop, index) -> future of the read in flight
+        self._in_flight = {}
+        self.closed = False
+
+    def _bind_handle(self):
+        if self._file_path is None or getattr(self._thread_state, 'bound', False):
+            return
+
+        h5file = h5py.File(self._file_path, 'r')
+        bind_h5py_file(self._file_path, h5file)
+        self._thread_state.bound = True
+        with self._handles_lock:
+            self._handles.append(h5file)
+
+    def _read(self, index: int):
+        self._bind_handle()
+        return materialize(self.dataset[index])
+
+    async def aget(self, index):
+        index = int(index)
+        loop = asyncio.get_running_loop()
+        key = (loop, index)
+
+        future = self._in_flight.get(key)
+        if future is None:
+            future = loop.run_in_executor(self._executor, self._read, index)
+            self._in_flight[key] = future
+            future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+
+        # shielded, a cancelled request does not cancel the read of the others
+        return await asyncio.shield(future)
+
+    async def aget_many(self, indices):
+        return await asyncio.gather(*(self.aget(i) for i in indices))
+
+    def close(self):
+        self.closed = True
+        self._executor.shutdown(wait=True)
+        with self._handles_lock:
+            for h5file in self._handles:
+                h5file.close()
+            self._handles = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,222 @@
+import collections
+import json
+import os
+import os.path as pth
+import time
+
+from . import instrumentation
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover, windows
+    fcntl = None
+
+
+CACHE_ROOT_ENV = 'CHOFER_TDA_DATASETS_ROOT'
+CACHE_BUDGET_ENV = 'CHOFER_TDA_DATASETS_CACHE_BUDGET'
+DEFAULT_CACHE_ROOT = pth.join(pth.expanduser('~'), '.cache', 'chofer_tda_datasets')
+
+
+class FileLock:
+    """
+    Inter-process lock based on flock. On platforms without fcntl an exclusively
+    created lock file is polled instead.
+    """
+    def __init__(self, lock_path: str, poll_interval: float = 0.1):
+        self.lock_path = lock_path
+        self.poll_interval = poll_interval
+        self._fd = None
+
+    def acquire(self):
+        if fcntl is not None:
+            self._fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o666)
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        else:
+            while True:
+                try:
+                    self._fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o666)
+                    break
+                except FileExistsError:
+                    time.sleep(self.poll_interval)
+
+    def release(self):
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+        else:
+            os.close(self._fd)
+            os.remove(self.lock_path)
+        self._fd = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+
+def _pid_alive(pid: int):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class DatasetCache:
+    """
+    Directory shared by all processes of a node in which the dataset files are
+    stored. Only one process fetches a missing file while all others wait for it.
+
+    The index file keeps for every file its size, the time of the last access and
+    the pids of the processes which use it until they release it. If a budget (in
+    bytes) is given, the least recently used files which are not in use are
+    evicted after a fetch. Only the default root and directories created by the
+    cache (marked by the marker file) are managed like this. In any other
+    directory, e.g. a folder of files downloaded before, and in a directory
+    which is not writable, existing files are used without index and locks and
+    nothing is evicted.
+    """
+    index_file_name = '.cache_index.json'
+    marker_file_name = '.chofer_tda_datasets_cache'
+
+    # number of resolves not released yet by (pid, path)
+    _uses = collections.Counter()
+
+    def __init__(self, root: str = None, budget: int = None):
+        is_default_root = root is None
+        if root is None:
+            root = os.environ.get(CACHE_ROOT_ENV, DEFAULT_CACHE_ROOT)
+
+        if budget is None and os.environ.get(CACHE_BUDGET_ENV):
+            budget = int(os.environ[CACHE_BUDGET_ENV])
+
+        self.root = pth.normpath(pth.expanduser(str(root)))
+        self.budget = budget
+        self.managed = is_default_root or not pth.exists(self.root) or pth.isfile(self._marker_path)
+
+    @property
+    def _marker_path(self):
+        return pth.join(self.root, self.marker_file_name)
+
+    @property
+    def writable(self):
+        return os.access(self.root, os.W_OK)
+
+    @property
+    def _index_path(self):
+        return pth.join(self.root, self.index_file_name)
+
+    def path(self, file_name: str):
+        return pth.join(self.root, file_name)
+
+    def _read_index(self):
+        if not pth.isfile(self._index_path):
+            return {}
+        with open(self._index_path, 'r') as f:
+            return json.load(f)
+
+    def _write_index(self, index):
+        tmp_path = self._index_path + '.{}.tmp'.format(os.getpid())
+        with open(tmp_path, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp_path, self._index_path)
+
+    def _update_index(self, fn):
+        with FileLock(self._index_path + '.lock'):
+            index = self._read_index()
+            fn(index)
+            self._write_index(index)
+
+    def _register_use(self, file_name):
+        path = self.path(file_name)
+
+        def register(index):
+            entry = index.setdefault(file_name, {'pids': []})
+            entry['size'] = pth.getsize(path)
+            entry['last_access'] = time.time()
+            entry['pids'] = [pid for pid in entry['pids'] if _pid_alive(pid)]
+            if os.getpid() not in entry['pids']:
+                entry['pids'].append(os.getpid())
+
+        self._update_index(register)
+        self._uses[(os.getpid(), path)] += 1
+
+    def release(self, file_name: str):
+        """
+        Ends one use of file_name by this process, it may be evicted once no
+        process uses it anymore.
+        """
+        key = (os.getpid(), self.path(file_name))
+        if self._uses[key] == 0:
+            return
+        self._uses[key] -= 1
+        if self._uses[key] > 0:
+            return
+        del self._uses[key]
+
+        def unregister(index):
+            if file_name in index:
+                index[file_name]['pids'] = [pid for pid in index[file_name]['pids'] if pid != os.getpid()]
+
+        self._update_index(unregister)
+
+    def evict(self, keep=()):
+        if self.budget is None:
+            return
+
+        def evict(index):
+            for file_name in list(index.keys()):
+                if not pth.isfile(self.path(file_name)):
+                    del index[file_name]
+
+            total = sum(entry['size'] for entry in index.values())
+            by_last_access = sorted(index.items(), key=lambda kv: kv[1]['last_access'])
+
+            for file_name, entry in by_last_access:
+                if total <= self.budget:
+                    break
+
+                in_use = any(_pid_alive(pid) for pid in entry['pids'])
+                if file_name in keep or in_use:
+                    continue
+
+                with FileLock(self.path(file_name) + '.lock'):
+                    os.remove(self.path(file_name))
+                total -= entry['size']
+                del index[file_name]
+
+        self._update_index(evict)
+
+    def resolve(self, file_name: str, fetch=None):
+        """
+        Returns the path of file_name in the cache. If the file does not exist
+        and fetch is given, fetch(path) is called by exactly one process while
+        the others block until it is done. Every resolve of an existing file
+        is a use until release(file_name).
+        """
+        path = self.path(file_name)
+        exists = pth.isfile(path)
+
+        if instrumentation.ENABLED:
+            instrumentation.count('cache_hits' if exists else 'cache_misses')
+
+        if not exists and fetch is not None:
+            os.makedirs(self.root, exist_ok=True)
+            with FileLock(path + '.lock'):
+                # another process may have fetched it while we were waiting
+                if not pth.isfile(path):
+                    fetch(path)
+
+        if pth.isfile(path) and self.managed and self.writable:
+            if not pth.isfile(self._marker_path):
+                open(self._marker_path, 'w').close()
+            # registered before evicting, such that its size is counted
+            self._register_use(file_name)
+            if not exists:
+                self.evict(keep=(file_name,))
+
+        return path
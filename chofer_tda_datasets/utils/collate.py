@@ -0,0 +1,141 @@
+from collections import namedtuple
+from collections.abc import Mapping
+
+import numpy as np
+
+
+PaddedBatch = namedtuple('PaddedBatch', ('values', 'lengths', 'mask'))
+FlatBatch = namedtuple('FlatBatch', ('values', 'offsets'))
+
+
+def _is_container(x):
+    return isinstance(x, (Mapping, list, tuple))
+
+
+def _gather_leaves(xs, prefix=(), out=None):
+    """
+    Walks the structure of xs[0] once and gathers, for every leaf, the list of
+    the corresponding leaves of all samples. Mappings (including h5py groups)
+    and lists/tuples are treated as containers, everything else as array.
+    """
+    out = [] if out is None else out
+    first = xs[0]
+
+    if isinstance(first, Mapping):
+        for k in first.keys():
+            _gather_leaves([x[k] for x in xs], prefix + (k,), out)
+    elif isinstance(first, (list, tuple)):
+        for i in range(len(first)):
+            _gather_leaves([x[i] for x in xs], prefix + (i,), out)
+    else:
+        out.append((prefix, xs))
+
+    return out
+
+
+def _rebuild(template, leaves):
+    if isinstance(template, Mapping):
+        return {k: _rebuild(template[k], leaves) for k in template.keys()}
+    elif isinstance(template, (list, tuple)):
+        return [_rebuild(v, leaves) for v in template]
+    else:
+        return next(leaves)
+
+
+def _as_arrays(arrays):
+    arrays = [np.asarray(a) for a in arrays]
+
+    # empty diagrams are often stored as shape (0,), so the trailing shape is
+    # taken from the first non empty array.
+    trailing = ()
+    for a in arrays:
+        if a.size > 0:
+            trailing = a.shape[1:]
+            break
+
+    dtype = np.result_type(*arrays) if len(arrays) > 0 else np.float64
+    lengths = np.fromiter((a.shape[0] if a.ndim > 0 else 1 for a in arrays),
+                          dtype=np.int64,
+                          count=len(arrays))
+
+    return arrays, lengths, trailing, dtype
+
+
+def pad_arrays(arrays, pad_value=0.0, with_mask=True) -> PaddedBatch:
+    arrays, lengths, trailing, dtype = _as_arrays(arrays)
+    max_len = int(lengths.max()) if len(lengths) > 0 else 0
+
+    values = np.full((len(arrays), max_len) + trailing, pad_value, dtype=dtype)
+    for i, a in enumerate(arrays):
+        if lengths[i] > 0:
+            values[i, :lengths[i]] = a.reshape((lengths[i],) + trailing)
+
+    mask = None
+    if with_mask:
+        mask = np.arange(max_len)[None, :] < lengths[:, None]
+
+    return PaddedBatch(values, lengths, mask)
+
+
+def concat_arrays(arrays) -> FlatBatch:
+    arrays, lengths, trailing, dtype = _as_arrays(arrays)
+
+    offsets = np.zeros(len(arrays) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+
+    values = np.empty((int(offsets[-1]),) + trailing, dtype=dtype)
+    for i, a in enumerate(arrays):
+        if lengths[i] > 0:
+            values[offsets[i]:offsets[i + 1]] = a.reshape((lengths[i],) + trailing)
+
+    return FlatBatch(values, offsets)
+
+
+def _collate_targets(ys, collate_leaf):
+    ys = [np.asarray(y) for y in ys]
+    if all(y.shape == ys[0].shape for y in ys):
+        return np.stack(ys, axis=0)
+    else:
+        # ragged targets, e.g. eigenvalue spectra of graphs with different sizes
+        return collate_leaf(ys)
+
+
+def _unzip(batch):
+    """
+    Accepts either a list of (x, y) samples or the output of a batched fetch,
+    i.e., a tuple (list of x, list of y).
+    """
+    if isinstance(batch, tuple):
+        xs, ys = batch
+        return list(xs), list(ys)
+
+    xs, ys = zip(*batch)
+    return list(xs), list(ys)
+
+
+def _collate(batch, collate_leaf):
+    xs, ys = _unzip(batch)
+
+    leaves = _gather_leaves(xs)
+    collated = (collate_leaf(arrays) for _, arrays in leaves)
+    x = _rebuild(xs[0], collated) if _is_container(xs[0]) else next(collated)
+
+    return x, _collate_targets(ys, collate_leaf)
+
+
+def collate_padded(batch, pad_value=0.0, with_mask=True):
+    """
+    Collates samples whose data is a (nested) dict or list of variable length
+    arrays. Every leaf becomes a PaddedBatch(values, lengths, mask) where values
+    has shape (batch_size, max_length, ...).
+    """
+    return _collate(batch, lambda arrays: pad_arrays(arrays, pad_value=pad_value, with_mask=with_mask))
+
+
+def collate_flat(batch):
+    """
+    Like collate_padded but every leaf becomes a FlatBatch(values, offsets), i.e.,
+    the concatenation of all arrays along the first axis where
+    values[offsets[i]:offsets[i+1]] belongs to the i-th sample.
+    """
+    return _collate(batch, concat_arrays)
@@ -0,0 +1,166 @@
+"""
+Vectorized operations on packed diagrams, i.e., the points of many diagrams
+concatenated to values (n, 2) with values[offsets[i]:offsets[i + 1]] the points
+of the i-th diagram (the layout of utils.collate.FlatBatch).
+
+1-dim arrays are essential points (births only) and have infinite persistence.
+"""
+import h5py
+import numpy as np
+
+
+def single(values):
+    """
+    Returns the offsets of a single diagram.
+    """
+    return np.array([0, len(values)], dtype=np.int64)
+
+
+def segment_ids(offsets):
+    offsets = np.asarray(offsets)
+    return np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+
+
+def persistence(values):
+    values = np.asarray(values)
+    if values.ndim == 1:
+        return np.full(len(values), np.inf)
+    return values[:, 1] - values[:, 0]
+
+
+def select_packed(values, offsets, keep):
+    """
+    Keeps the points where keep is True, the order of the points is kept.
+    """
+    n_diagrams = len(offsets) - 1
+    sizes = np.bincount(segment_ids(offsets)[keep], minlength=n_diagrams)
+    new_offsets = np.zeros(n_diagrams + 1, dtype=np.int64)
+    np.cumsum(sizes, out=new_offsets[1:])
+    return np.asarray(values)[keep], new_offsets
+
+
+def threshold_packed(values, offsets, threshold: float):
+    """
+    Drops the points with death - birth < threshold.
+    """
+    return select_packed(values, offsets, persistence(values) >= threshold)
+
+
+def top_k_packed(values, offsets, k: int):
+    """
+    Keeps the k most persistent points of every diagram.
+    """
+    seg = segment_ids(offsets)
+    order = np.lexsort((-persistence(values), seg))
+    rank = np.arange(len(order)) - np.asarray(offsets)[seg[order]]
+
+    keep = np.zeros(len(order), dtype=bool)
+    keep[order[rank < k]] = True
+    return select_packed(values, offsets, keep)
+
+
+def infinite_deaths_packed(values, offsets, mode: str = 'clip', value: float = None):
+    """
+    mode 'clip': infinite deaths are replaced by value or, if value is None, by
+    the largest finite coordinate of their diagram (of all diagrams if their
+    own has none). Deaths never fall below their births. 1-dim essential
+    points become (birth, value), value is required for them as their own
+    births are no bound.
+    mode 'drop': points with infinite death are dropped.
+    """
+    assert mode in ('clip', 'drop')
+    values = np.asarray(values, dtype=float)
+
+    if mode == 'drop':
+        return select_packed(values, offsets, np.isfinite(persistence(values)))
+
+    assert values.ndim == 2 or value is not None, 'Clipping essential points (births only) needs a value.'
+    points = values if values.ndim == 2 else np.stack([values, np.full(len(values), np.inf)], axis=1)
+    if len(points) == 0:
+        return points.copy(), np.asarray(offsets)
+
+    if value is None:
+        seg = segment_ids(offsets)
+        finite = np.where(np.isfinite(points), points, -np.inf).max(axis=1)
+        max_finite = np.full(len(offsets) - 1, -np.inf)
+        np.maximum.at(max_finite, seg, finite)
+        assert np.isfinite(finite).any(), 'No finite coordinate to clip to, pass a value.'
+        max_finite[~np.isfinite(max_finite)] = finite.max()
+        fill = max_finite[seg]
+    else:
+        fill = np.full(len(points), float(value))
+
+    points = points.copy()
+    is_inf = np.isinf(points[:, 1])
+    points[is_inf, 1] = np.maximum(fill[is_inf], points[is_inf, 0])
+    return points, np.asarray(offsets)
+
+
+def map_diagrams(x, fn):
+    """
+    Applies fn to every diagram (numpy array or h5py dataset) in the nested
+    dicts / lists x.
+    """
+    if isinstance(x, h5py.Dataset):
+        x = x[()]
+    if isinstance(x, (dict, h5py.Group)):
+        return {k: map_diagrams(v, fn) for k, v in x.items()}
+    if isinstance(x, (list, tuple)):
+        return type(x)(map_diagrams(v, fn) for v in x)
+    return fn(np.asarray(x))
+
+
+def _n_points_of(grp, key: str, shape):
+    if len(shape) == 1:
+        return len(grp[key])
+    return [len(grp[key][str(j)]) for j in range(shape[1])]
+
+
+def rewrite_diagrams(src_path, dst_path, transform, record_n_points: bool = True):
+    """
+    Offline version of a diagram transform: copies the file at src_path to
+    dst_path with transform applied to every dataset below 'data'.
+
+    If record_n_points is True, the datasets in 'n_points' are recomputed from
+    the transformed diagrams, such that LengthBucketBatchSampler buckets by the
+    filtered sizes without reading any diagram.
+    """
+    with h5py.File(str(src_path), 'r') as src, h5py.File(str(dst_path), 'w') as dst:
+        for k, v in src.attrs.items():
+            dst.attrs[k] = v
+        dst.attrs['preprocessing'] = repr(transform)
+
+        for key in src.keys():
+            if key not in ('data', 'n_points'):
+                src.copy(key, dst)
+
+        grp_src_data = src['data']
+        grp_dst_data = dst.create_group('data')
+
+        def rewrite(name, obj):
+            if isinstance(obj, h5py.Dataset):
+                grp_dst_data.create_dataset(name, data=transform(obj[()]))
+
+        grp_src_data.visititems(rewrite)
+
+        if 'n_points' not in src:
+            return
+
+        if not record_n_points:
+            src.copy('n_points', dst)
+            return
+
+        keys = []
+        src['n_points'].visititems(lambda name, obj: keys.append(name) if isinstance(obj, h5py.Dataset) else None)
+
+        # Reininghaus files count per row of the (id, freq) table
+        rows = [str(i) for i in range(len(src['n_points'][keys[0]]))] if len(keys) > 0 else []
+        if 'id_freq' in src:
+            rows = ['{}/{}'.format(id, freq) for id, freq in src['id_freq'][()].tolist()]
+
+        grp_n_points = dst.create_group('n_points')
+        for key in keys:
+            shape = src['n_points'][key].shape
+            grp_n_points.create_dataset(key,
+                                        data=np.array([_n_points_of(grp_dst_data[row], key, shape) for row in rows],
+                                                      dtype=np.int64).reshape(shape))
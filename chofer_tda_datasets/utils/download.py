@@ -1,7 +1,279 @@
-import requests
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+import warnings
 
 
-def download_file_from_google_drive(id, destination):
+GOOGLE_DRIVE_URL = "https://docs.google.com/uc?export=download"
+CHUNK_SIZE = 1 << 20
+
+
+class DownloadError(Exception):
+    pass
+
+
+class UnverifiedDownloadWarning(UserWarning):
+    pass
+
+
+def sha256_of_file(file_path, chunk_size=CHUNK_SIZE):
+    h = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+
+    return h.hexdigest()
+
+
+class _ThrottledProgress:
+    def __init__(self, total=None, interval=1.0, stream=None, enabled=True):
+        self.total = total
+        self.interval = interval
+        self.stream = sys.stderr if stream is None else stream
+        self.enabled = enabled
+        self.n_bytes = 0
+        self._n_bytes_at_start = None
+        self._t_start = time.time()
+        self._t_end = None
+        self._t_last_render = 0.
+        self._lock = threading.Lock()
+
+    def start(self, n_bytes_done=0):
+        self.n_bytes = n_bytes_done
+        self._n_bytes_at_start = n_bytes_done
+        self._t_start = time.time()
+
+    def update(self, n_bytes):
+        with self._lock:
+            self.n_bytes += n_bytes
+            now = time.time()
+            if self.enabled and now - self._t_last_render >= self.interval:
+                self._t_last_render = now
+                self._render(now)
+
+    def _render(self, now):
+        rate = (self.n_bytes - self._n_bytes_at_start) / max(now - self._t_start, 1e-9)
+        text = '{:.1f} MB'.format(self.n_bytes / 1e6)
+        if self.total:
+            text += ' / {:.1f} MB'.format(self.total / 1e6)
+        text += '   {:.1f} MB/s'.format(rate / 1e6)
+        print(text + '          ', end='\r', file=self.stream)
+        self.stream.flush()
+
+    def close(self):
+        self._t_end = time.time()
+        if self.enabled:
+            self._render(self._t_end)
+            print('', file=self.stream)
+
+    def summary(self):
+        elapsed = (time.time() if self._t_end is None else self._t_end) - self._t_start
+        n_bytes_transferred = self.n_bytes - self._n_bytes_at_start
+        return {'n_bytes': self.n_bytes,
+                'n_bytes_transferred': n_bytes_transferred,
+                'elapsed_s': elapsed,
+                'bytes_per_s': n_bytes_transferred / elapsed if elapsed > 0 else None}
+
+
+def _probe(session, url, params):
+    """
+    Returns (total size or None, whether the server accepts range requests).
+    """
+    with session.get(url, params=params, headers={'Range': 'bytes=0-0'}, stream=True) as response:
+        response.raise_for_status()
+
+        if response.status_code == 206:
+            content_range = response.headers.get('Content-Range', '')
+            total = content_range.rsplit('/', 1)[-1]
+            return (int(total) if total.isdigit() else None), True
+
+        total = response.headers.get('Content-Length')
+        return (int(total) if total is not None else None), False
+
+
+def _stream_range(session, url, params, f, start, end, progress, chunk_size):
+    """
+    Writes bytes [start, end] (end inclusive, None for open end) of url to f at
+    offset start. Returns the offset after the last written byte.
+    """
+    range_header = 'bytes={}-'.format(start) if end is None else 'bytes={}-{}'.format(start, end)
+    headers = {'Range': range_header} if start > 0 or end is not None else {}
+
+    with session.get(url, params=params, headers=headers, stream=True) as response:
+        response.raise_for_status()
+
+        if start > 0 and response.status_code != 206:
+            # server ignored the range request, start from scratch
+            start = 0
+            f.truncate(0)
+
+        f.seek(start)
+        for chunk in response.iter_content(chunk_size):
+            if chunk:  # filter out keep-alive new chunks
+                f.write(chunk)
+                start += len(chunk)
+                progress.update(len(chunk))
+
+    return start
+
+
+def _with_retries(fn, retries, what):
+    import requests
+
+    for attempt in range(retries + 1):
+        try:
+            return fn()
+        except (requests.RequestException, DownloadError) as ex:
+            if attempt == retries:
+                raise DownloadError('Failed to download {} after {} attempts.'.format(what, retries + 1)) from ex
+            time.sleep(min(2 ** attempt, 30))
+
+
+def _download_sequential(session, url, params, part_path, total, progress, retries, chunk_size):
+    mode = 'r+b' if os.path.isfile(part_path) else 'w+b'
+    with open(part_path, mode, buffering=0) as f:
+        state = {'offset': os.path.getsize(part_path)}
+        if total is not None and state['offset'] > total:
+            f.truncate(0)
+            state['offset'] = 0
+
+        progress.start(state['offset'])
+
+        def fetch():
+            if total is not None and state['offset'] >= total:
+                return
+            state['offset'] = _stream_range(session, url, params, f, state['offset'], None, progress, chunk_size)
+            if total is not None and state['offset'] < total:
+                raise DownloadError('Connection closed after {} of {} bytes.'.format(state['offset'], total))
+
+        _with_retries(fetch, retries, url)
+
+
+def _download_parallel(session, url, params, part_path, total, n_parts, progress, retries, chunk_size):
+    # the state file keeps the progress of every part such that an interrupted
+    # download can be resumed.
+    state_path = part_path + '.state'
+    part_size = -(-total // n_parts)
+    parts = [[start, min(start + part_size, total) - 1] for start in range(0, total, part_size)]
+    offsets = [start for start, _ in parts]
+
+    if os.path.isfile(part_path) and os.path.isfile(state_path):
+        with open(state_path, 'r') as f:
+            state = json.load(f)
+        if state.get('total') == total and state.get('parts') == parts:
+            offsets = state['offsets']
+
+    if not os.path.isfile(part_path) or os.path.getsize(part_path) != total:
+        with open(part_path, 'wb') as f:
+            f.truncate(total)
+        offsets = [start for start, _ in parts]
+
+    progress.start(sum(o - start for o, (start, _) in zip(offsets, parts)))
+    lock = threading.Lock()
+
+    def save_state():
+        with lock:
+            with open(state_path, 'w') as f:
+                json.dump({'total': total, 'parts': parts, 'offsets': offsets}, f)
+
+    def download_part(i):
+        _, end = parts[i]
+        with open(part_path, 'r+b', buffering=0) as f:
+            def fetch():
+                if offsets[i] > end:
+                    return
+                offsets[i] = _stream_range(session, url, params, f, offsets[i], end, progress, chunk_size)
+                if offsets[i] <= end:
+                    raise DownloadError('Connection closed before end of part {}.'.format(i))
+
+            _with_retries(fetch, retries, '{} (part {})'.format(url, i))
+
+    errors = []
+
+    def worker(i):
+        try:
+            download_part(i)
+        except Exception as ex:
+            errors.append(ex)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(len(parts))]
+    try:
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        save_state()
+
+    if len(errors) > 0:
+        raise errors[0]
+
+    os.remove(state_path)
+
+
+def download_file(url,
+                  destination,
+                  params=None,
+                  sha256=None,
+                  n_parts=1,
+                  retries=5,
+                  session=None,
+                  chunk_size=CHUNK_SIZE,
+                  show_progress=True,
+                  summary_path=None):
+    """
+    Downloads url to destination. The data is written to destination + '.part'
+    which is renamed to destination only if the download is complete and, if
+    given, its sha256 hex digest matches. An existing '.part' file is resumed
+    via HTTP range requests. If n_parts > 1 and the server supports range
+    requests, the file is fetched with n_parts parallel connections. Without
+    sha256 an UnverifiedDownloadWarning with the digest of the downloaded file
+    is issued, such that it can be registered.
+
+    If summary_path is given, a JSON summary of the transfer is written to it.
+    """
+    import requests
+
+    destination = str(destination)
+    part_path = destination + '.part'
+    session = requests.Session() if session is None else session
+
+    total, accepts_ranges = _probe(session, url, params)
+    progress = _ThrottledProgress(total=total, enabled=show_progress)
+
+    if n_parts > 1 and accepts_ranges and total:
+        _download_parallel(session, url, params, part_path, total, n_parts, progress, retries, chunk_size)
+    else:
+        _download_sequential(session, url, params, part_path, total, progress, retries, chunk_size)
+
+    progress.close()
+    summary = progress.summary()
+    summary.update({'url': url, 'n_parts': n_parts if accepts_ranges else 1})
+
+    t_start = time.time()
+    digest = sha256_of_file(part_path)
+    summary['verify_s'] = time.time() - t_start
+    summary['sha256'] = digest
+    if sha256 is None:
+        warnings.warn('No sha256 registered for {}, the download is not verified. '
+                      'Its sha256 is {}.'.format(destination, digest), UnverifiedDownloadWarning)
+    elif digest != sha256.lower():
+        os.remove(part_path)
+        raise DownloadError('Checksum mismatch for {}: expected {}, got {}.'.format(url, sha256, digest))
+
+    os.replace(part_path, destination)
+
+    if summary_path is not None:
+        with open(str(summary_path), 'w') as f:
+            json.dump(summary, f, indent=2)
+
+    return summary
+
+
+def download_file_from_google_drive(id, destination, sha256=None, n_parts=1, **kwargs):
     def get_confirm_token(response):
         for key, value in response.cookies.items():
             if key.startswith('download_warning'):
@@ -9,26 +281,20 @@ def download_file_from_google_drive(id, destination):
 
         return None
 
-    def save_response_content(response, destination):
-        CHUNK_SIZE = 32768
-        content_iter = response.iter_content(CHUNK_SIZE)
-        with open(destination, "wb") as f:
-
-            for i, chunk in enumerate(content_iter):
-                if chunk:  # filter out keep-alive new chunks
-                    f.write(chunk)
-                    print(i, end='\r')
-
-    URL = "https://docs.google.com/uc?export=download"
-
+    import requests
     session = requests.Session()
 
-    response = session.get(URL, params={'id': id}, stream=True)
-
-    token = get_confirm_token(response)
+    with session.get(GOOGLE_DRIVE_URL, params={'id': id}, stream=True) as response:
+        token = get_confirm_token(response)
 
+    params = {'id': id}
     if token:
-        params = {'id': id, 'confirm': token}
-        response = session.get(URL, params=params, stream=True)
+        params['confirm'] = token
 
-    save_response_content(response, destination)
\ No newline at end of file
+    return download_file(GOOGLE_DRIVE_URL,
+                         destination,
+                         params=params,
+                         sha256=sha256,
+                         n_parts=n_parts,
+                         session=session,
+                         **kwargs)
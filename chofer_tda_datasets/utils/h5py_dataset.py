@@ -1,6 +1,47 @@
-import h5py
+import threading
+
+import numpy as np
 from pathlib import Path
 
+from . import instrumentation
+from .cache import DatasetCache
+from .collate import concat_arrays
+from .download import download_file_from_google_drive
+from .prefetch import prefetch_iter
+from .ragged import RaggedStore, flatten
+from .shard import Shard
+from .splits import SplitsMixin, SPLITS_FILE_SUFFIX, read_rows
+
+
+# h5py files bound to the current thread by file path, see bind_h5py_file
+_thread_files = threading.local()
+
+
+def bind_h5py_file(file_path, h5file):
+    """
+    Makes Hdf5SupervisedDatasetOneFile instances of file_path use the open
+    h5file in the current thread instead of opening the file on every access.
+    """
+    if not hasattr(_thread_files, 'files'):
+        _thread_files.files = {}
+    _thread_files.files[str(file_path)] = h5file
+
+
+def unbind_h5py_file(file_path):
+    getattr(_thread_files, 'files', {}).pop(str(file_path), None)
+
+
+def _storage_size(x):
+    import h5py
+
+    if isinstance(x, h5py.Dataset):
+        return x.id.get_storage_size()
+    if isinstance(x, h5py.Group):
+        sizes = []
+        x.visititems(lambda name, obj: sizes.append(obj.id.get_storage_size()) if isinstance(obj, h5py.Dataset) else None)
+        return sum(sizes)
+    return getattr(x, 'nbytes', 0)
+
 
 class SupervisedDataset(object):
     def __init__(self,
@@ -20,6 +61,9 @@ class SupervisedDataset(object):
         raise NotImplementedError()
 
     def __getitem__(self, index):
+        if instrumentation.ENABLED:
+            return self._getitem_instrumented(index)
+
         index = int(index)
         x = self._get_data_i(index)
         y = self._get_target_i(index)
@@ -32,41 +76,169 @@ class SupervisedDataset(object):
 
         return x, y
 
+    def _getitem_instrumented(self, index):
+        index = int(index)
+        with instrumentation.timed('read'):
+            x = self._get_data_i(index)
+            y = self._get_target_i(index)
+        instrumentation.count('bytes_read', _storage_size(x))
+
+        with instrumentation.timed('data_transform'):
+            for t in self.data_transforms:
+                x = t(x)
+
+        with instrumentation.timed('target_transform'):
+            for t in self.target_transforms:
+                y = t(y)
+
+        return x, y
+
     def __iter__(self):
         for i in range(len(self)):
             yield self[i]
 
+    def prefetch(self,
+                 indices=None,
+                 n_workers: int = 4,
+                 buffer_size: int = None,
+                 use_processes: bool = False,
+                 ordered: bool = True):
+        """
+        Iterates like __iter__ (or over indices) but reads ahead and applies
+        the transforms in a thread (or process) pool, see utils.prefetch.
+        """
+        return prefetch_iter(self,
+                             indices=indices,
+                             n_workers=n_workers,
+                             buffer_size=buffer_size,
+                             use_processes=use_processes,
+                             ordered=ordered)
+
+    def shard(self,
+              rank: int,
+              world_size: int,
+              seed: int = 0,
+              epoch: int = 0,
+              chunk_size: int = 64,
+              balance: str = None,
+              key: str = None,
+              pad: bool = True):
+        """
+        Returns the samples of rank as Subset for distributed training. The
+        samples are partitioned in chunks of chunk_size consecutive indices
+        which are reshuffled every epoch (Shard.set_epoch), see utils.shard.
+        balance None balances the number of samples, 'n_points' in addition
+        the number of diagram points ('n_points'/<key>) and 'label' the number
+        of samples of every label. With pad every rank gets the same number of
+        samples.
+        """
+        return Shard(self,
+                     rank,
+                     world_size,
+                     seed=seed,
+                     epoch=epoch,
+                     chunk_size=chunk_size,
+                     balance=balance,
+                     key=key,
+                     pad=pad)
+
+    def async_access(self, n_workers: int = 4):
+        """
+        Returns the asyncio facade of the dataset, see utils.async_access. It
+        is created on first use (or after it was closed) and shared by aget and
+        aget_many.
+        """
+        if getattr(self, '_async_access', None) is None or self._async_access.closed:
+            from .async_access import AsyncDatasetAccess
+            self._async_access = AsyncDatasetAccess(self, n_workers=n_workers)
+        return self._async_access
+
+    async def aget(self, index):
+        return await self.async_access().aget(index)
+
+    async def aget_many(self, indices):
+        return await self.async_access().aget_many(indices)
+
+    def __getstate__(self):
+        # the executor of the asyncio facade stays in this process
+        state = self.__dict__.copy()
+        state.pop('_async_access', None)
+        return state
+
     @property
     def targets(self):
         raise NotImplementedError()
 
 
 def hdf5_group_to_dict(hdf5_group):
+        import h5py
         if isinstance(hdf5_group, h5py.Dataset):
             return hdf5_group[()]
         else:
             return {k: hdf5_group_to_dict(v) for k, v in hdf5_group.items()}
 
 
-class Hdf5SupervisedDatasetOneFile(SupervisedDataset):
+class Hdf5SupervisedDatasetOneFile(SplitsMixin, SupervisedDataset):
     file_name = None
     google_drive_id = None
+    # hex digest of the file, see provider_sha256 of nips_2017.DataSetBase
+    sha256 = None
 
     data_hdf5_key = 'data'
     target_hdf5_key = 'target'
+    n_points_hdf5_key = 'n_points'
 
     def __init__(self,
-                 data_root_folder_path: str,
+                 data_root_folder_path: str = None,
                  data_transforms: [] = None,
-                 target_transforms: [] = None
+                 target_transforms: [] = None,
+                 download: bool = True
                  ):
+        """
+        If data_root_folder_path is None, the shared cache directory is used, see
+        utils.cache.DatasetCache.
+        """
         super().__init__(data_transforms=data_transforms,
                          target_transforms=target_transforms)
 
-        self.file_path = Path(data_root_folder_path).joinpath(self.file_name)
+        fetch = None
+        if download and self.google_drive_id is not None:
+            def fetch(path):
+                download_file_from_google_drive(self.google_drive_id, path, sha256=self.sha256)
+
+        self._dataset_cache = DatasetCache(data_root_folder_path)
+        self.file_path = Path(self._dataset_cache.resolve(self.file_name, fetch=fetch))
+
+    def close(self):
+        """
+        Releases the file in the cache, it may be evicted once no process uses
+        it anymore, see utils.cache.DatasetCache.
+        """
+        if getattr(self, '_dataset_cache', None) is not None:
+            self._dataset_cache.release(self.file_name)
+            self._dataset_cache = None
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            # the interpreter may be shutting down
+            pass
 
     @property
     def _h5py_file(self):
+        import h5py
+
+        h5file = getattr(_thread_files, 'files', {}).get(str(self.file_path))
+
+        if instrumentation.ENABLED:
+            instrumentation.count('handle_hits' if h5file is not None else 'handle_misses')
+            if h5file is None:
+                with instrumentation.timed('open'):
+                    return h5py.File(self.file_path, 'r')
+
+        if h5file is not None:
+            return h5file
         return h5py.File(self.file_path, 'r')
 
     @property
@@ -90,6 +262,94 @@ class Hdf5SupervisedDatasetOneFile(SupervisedDataset):
     def targets(self):
         return self._h5py_file[self.target_hdf5_key][()]
 
+    def n_points(self, key: str = None):
+        """
+        Returns the per sample number of diagram points as stored in
+        'n_points'/<key> by the generators, key may be a path like
+        '<filtration>/dim_0'. If key is None the counts of all datasets below
+        'n_points' are summed up. No sample group is opened.
+        """
+        import h5py
+
+        grp_n_points = self._h5py_file[self.n_points_hdf5_key]
+        if key is not None:
+            grp_n_points = grp_n_points[key]
+
+        if isinstance(grp_n_points, h5py.Dataset):
+            datasets = [grp_n_points]
+        else:
+            datasets = []
+            grp_n_points.visititems(lambda name, obj: datasets.append(obj) if isinstance(obj, h5py.Dataset) else None)
+
+        n_points = None
+        for ds in datasets:
+            v = ds[()]
+            v = v.reshape(v.shape[0], -1).sum(axis=1)
+            n_points = v if n_points is None else n_points + v
+
+        return n_points
+
+    def ragged_store(self):
+        """
+        Returns the memory-mapped store of the rows 'data'/<i> of the file, see
+        utils.ragged. It is built on first use next to the file and shared by
+        all datasets of the file, None if it cannot be written there, e.g. in a
+        read-only data folder. __getitem__ keeps reading the h5py groups, the
+        transforms expect them.
+        """
+        if getattr(self, '_ragged_store', None) is None and getattr(self, '_ragged_store_failed', False) is False:
+            def samples():
+                h5file = self._h5py_file
+                targets = h5file[self.target_hdf5_key][()]
+                grp_data = h5file[self.data_hdf5_key]
+                for i in range(len(grp_data.keys())):
+                    yield hdf5_group_to_dict(grp_data[str(i)]), targets[i]
+
+            try:
+                self._ragged_store = RaggedStore.open_or_build(self.file_path, samples)
+            except OSError:
+                self._ragged_store_failed = True
+
+        return getattr(self, '_ragged_store', None)
+
+    def _store_rows(self, indices):
+        return indices
+
+    def get_batch(self, indices, keys: [str] = None):
+        """
+        Returns ({key: FlatBatch}, targets) of the samples indices from the
+        ragged store, without applying the transforms. keys are paths like
+        'dim_1_ess', all diagrams if None. Without store the groups are read
+        from the file and concatenated.
+        """
+        rows = self._store_rows(np.asarray(indices, dtype=np.int64))
+        store = self.ragged_store()
+        if store is not None:
+            return store.get_batch(rows, keys), store.targets[rows]
+
+        h5file = self._h5py_file
+        grp_data = h5file[self.data_hdf5_key]
+        samples = [dict(flatten(hdf5_group_to_dict(grp_data[str(row)]))) for row in rows]
+        if keys is None:
+            keys = sorted(set(k for x in samples for k in x))
+        batch = {k: concat_arrays([x.get(k, np.zeros(0)) for x in samples]) for k in keys}
+        return batch, h5file[self.target_hdf5_key][()][rows]
+
+    def _split_labels(self):
+        targets = self.targets
+        # regression targets, e.g. eigenvalues, are not stratified
+        return targets if targets.dtype.kind in 'iubSU' else None
+
+    def _split_groups(self, group_key: str):
+        return self._h5py_file[group_key][()]
+
+    def _targets_at(self, indices):
+        return read_rows(self._ds_target, indices)
+
+    @property
+    def _splits_file_path(self):
+        return str(self.file_path) + SPLITS_FILE_SUFFIX
+
     @property
     def readme(self):
         if 'readme' in self._h5py_file.attrs:
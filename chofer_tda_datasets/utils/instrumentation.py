@@ -0,0 +1,247 @@
+"""
+Opt-in instrumentation of the dataset hot path. When enabled, the datasets
+record latency histograms of the stages
+
+    open              opening the h5py file (Hdf5SupervisedDatasetOneFile)
+    read              _get_data_i + _get_target_i, resp. the provider lookup
+    data_transform    all data_transforms of one sample
+    target_transform  all target_transforms of one sample
+
+and the counters bytes_read (storage size of the read datasets), handle_hits /
+handle_misses (bound h5py handle reused / file opened) and cache_hits /
+cache_misses (DatasetCache.resolve found / fetched the file). When disabled the
+datasets only check the module attribute ENABLED.
+
+Every process records on its own. With enable(dump_dir=...) each process,
+e.g. every DataLoader worker, writes its snapshot to dump_dir after
+dump_interval seconds or dump_every records and counts, whichever comes first,
+and once more when it exits, aggregate(dump_dir) merges them. The dump at exit
+runs only if the process exits cleanly, e.g. after Pool.close() and
+Pool.join(). Workers that are terminated, as by Pool.__exit__, Pool.terminate()
+or the shutdown of a DataLoader, lose the numbers recorded since their last
+dump, dump_every=1 makes the numbers complete at the cost of a dump per record.
+"""
+import json
+import math
+import multiprocessing.util
+import os
+import threading
+import time
+
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+ENABLED = False
+
+# bucket i counts latencies in [2^(i-1), 2^i) microseconds, bucket 0 below 1us
+N_BUCKETS = 40
+
+_lock = threading.Lock()
+_stages = {}
+_counters = defaultdict(int)
+_dump_dir = None
+_dump_interval = None
+_dump_every = None
+_last_dump = 0.
+_n_since_dump = 0
+# pid of the process for which the dump at exit is registered
+_exit_dump_pid = None
+
+
+class Histogram:
+    def __init__(self):
+        self.buckets = [0] * N_BUCKETS
+        self.count = 0
+        self.total = 0.
+        self.min = math.inf
+        self.max = 0.
+
+    def record(self, seconds: float):
+        us = seconds * 1e6
+        bucket = 0 if us < 1 else min(int(math.log2(us)) + 1, N_BUCKETS - 1)
+        self.buckets[bucket] += 1
+        self.count += 1
+        self.total += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+
+    def to_dict(self):
+        return {'buckets': list(self.buckets), 'count': self.count, 'total_s': self.total,
+                'min_s': self.min if self.count > 0 else None, 'max_s': self.max}
+
+
+def enable(dump_dir: str = None, dump_interval: float = 10., dump_every: int = 100):
+    global ENABLED, _dump_dir, _dump_interval, _dump_every
+    assert dump_every >= 1
+    _dump_dir = dump_dir
+    _dump_interval = dump_interval
+    _dump_every = dump_every
+    if dump_dir is not None:
+        os.makedirs(dump_dir, exist_ok=True)
+    ENABLED = True
+
+
+def disable():
+    global ENABLED
+    ENABLED = False
+
+
+def reset():
+    with _lock:
+        _stages.clear()
+        _counters.clear()
+
+
+def _after_fork_in_child():
+    global _lock, _last_dump, _n_since_dump, _exit_dump_pid
+    # forked workers must not report the numbers of their parent again
+    _lock = threading.Lock()
+    _stages.clear()
+    _counters.clear()
+    _last_dump = 0.
+    _n_since_dump = 0
+    _exit_dump_pid = None
+
+
+def _dump_at_exit():
+    if _dump_dir is not None and os.getpid() == _exit_dump_pid:
+        dump()
+
+
+def _register_dump_at_exit():
+    global _exit_dump_pid
+    _exit_dump_pid = os.getpid()
+    # runs at the exit of multiprocessing workers (which skip atexit) as well as
+    # of the main process. Registered on first use, as a worker clears the
+    # finalizers inherited from its parent on start.
+    multiprocessing.util.Finalize(None, _dump_at_exit, exitpriority=10)
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def record(stage: str, seconds: float):
+    with _lock:
+        histogram = _stages.get(stage)
+        if histogram is None:
+            histogram = _stages[stage] = Histogram()
+        histogram.record(seconds)
+
+    _maybe_dump()
+
+
+def count(counter: str, n: int = 1):
+    with _lock:
+        _counters[counter] += n
+
+    _maybe_dump()
+
+
+def _maybe_dump():
+    global _n_since_dump
+    if _dump_dir is None:
+        return
+    if _exit_dump_pid != os.getpid():
+        _register_dump_at_exit()
+    _n_since_dump += 1
+    if _n_since_dump >= _dump_every or time.time() - _last_dump >= _dump_interval:
+        dump()
+
+
+@contextmanager
+def timed(stage: str):
+    t_start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - t_start)
+
+
+def _quantile(buckets, count, q):
+    if count == 0:
+        return None
+    target = q * count
+    cumulative = 0
+    for i, n in enumerate(buckets):
+        cumulative += n
+        if cumulative >= target:
+            # upper bound of the bucket
+            return 2 ** i * 1e-6
+    return None
+
+
+def _summarize(snapshot):
+    for stage in snapshot['stages'].values():
+        stage['mean_s'] = stage['total_s'] / stage['count'] if stage['count'] > 0 else None
+        for q in (0.5, 0.9, 0.99):
+            stage['p{}_s'.format(int(q * 100))] = _quantile(stage['buckets'], stage['count'], q)
+
+    counters = snapshot['counters']
+    for name in ('handle', 'cache'):
+        n = counters.get(name + '_hits', 0) + counters.get(name + '_misses', 0)
+        snapshot[name + '_hit_rate'] = counters.get(name + '_hits', 0) / n if n > 0 else None
+
+    return snapshot
+
+
+def snapshot():
+    """
+    Returns the numbers of this process as dict, the quantiles are the upper
+    bounds of the histogram buckets.
+    """
+    with _lock:
+        raw = {'pids': [os.getpid()],
+               'stages': {k: v.to_dict() for k, v in _stages.items()},
+               'counters': dict(_counters)}
+    return _summarize(raw)
+
+
+def merge(snapshots):
+    merged = {'pids': [], 'stages': {}, 'counters': defaultdict(int)}
+    for s in snapshots:
+        merged['pids'] += s['pids']
+        for name, stage in s['stages'].items():
+            m = merged['stages'].setdefault(name, {'buckets': [0] * N_BUCKETS, 'count': 0, 'total_s': 0.,
+                                                   'min_s': None, 'max_s': 0.})
+            m['buckets'] = [a + b for a, b in zip(m['buckets'], stage['buckets'])]
+            m['count'] += stage['count']
+            m['total_s'] += stage['total_s']
+            if stage['min_s'] is not None:
+                m['min_s'] = stage['min_s'] if m['min_s'] is None else min(m['min_s'], stage['min_s'])
+            m['max_s'] = max(m['max_s'], stage['max_s'])
+        for name, n in s['counters'].items():
+            merged['counters'][name] += n
+
+    merged['counters'] = dict(merged['counters'])
+    return _summarize(merged)
+
+
+def dump(dump_dir: str = None):
+    global _last_dump, _n_since_dump
+    dump_dir = _dump_dir if dump_dir is None else dump_dir
+    _last_dump = time.time()
+    _n_since_dump = 0
+
+    path = os.path.join(dump_dir, 'instrumentation_{}.json'.format(os.getpid()))
+    with open(path + '.tmp', 'w') as f:
+        json.dump(snapshot(), f)
+    os.replace(path + '.tmp', path)
+
+
+def aggregate(dump_dir: str = None):
+    """
+    Merges the snapshots dumped by all processes, including this one.
+    """
+    dump_dir = _dump_dir if dump_dir is None else dump_dir
+    # flush this process, also if it was disabled since its last dump
+    if ENABLED or _stages or _counters:
+        dump(dump_dir)
+
+    snapshots = []
+    for name in sorted(os.listdir(dump_dir)):
+        if name.startswith('instrumentation_') and name.endswith('.json'):
+            with open(os.path.join(dump_dir, name), 'r') as f:
+                snapshots.append(json.load(f))
+    return merge(snapshots)
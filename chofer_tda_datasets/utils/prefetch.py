@@ -0,0 +1,97 @@
+"""
+Read-ahead iteration over a dataset. Samples are fetched (including the
+transforms) by a thread or process pool while the consumer works on the
+previous ones, at most buffer_size samples are in flight.
+"""
+import concurrent.futures as futures
+from collections import deque
+
+
+def materialize(x):
+    """
+    Reads h5py groups and datasets, also nested in dicts and lists, into
+    memory such that the I/O happens in the worker and the result can be sent
+    between processes.
+    """
+    import h5py
+
+    if isinstance(x, h5py.Dataset):
+        return x[()]
+    if isinstance(x, h5py.Group):
+        return {k: materialize(v) for k, v in x.items()}
+    if isinstance(x, dict):
+        return {k: materialize(v) for k, v in x.items()}
+    if isinstance(x, (list, tuple)):
+        return type(x)(materialize(v) for v in x)
+    return x
+
+
+_worker_dataset = None
+
+
+def _init_process_worker(dataset):
+    global _worker_dataset
+    _worker_dataset = dataset
+
+
+def _fetch_in_process(index):
+    return index, materialize(_worker_dataset[index])
+
+
+def prefetch_iter(dataset,
+                  indices=None,
+                  n_workers: int = 4,
+                  buffer_size: int = None,
+                  use_processes: bool = False,
+                  ordered: bool = True,
+                  with_index: bool = False):
+    """
+    Yields dataset[i] for i in indices (default all). If ordered is False the
+    samples are yielded as they become ready. With use_processes the dataset is
+    sent once to every worker process, hence it and its transforms have to be
+    picklable. If with_index is True, (i, sample) is yielded.
+    """
+    indices = range(len(dataset)) if indices is None else indices
+    buffer_size = 4 * n_workers if buffer_size is None else buffer_size
+    assert buffer_size >= 1
+
+    if use_processes:
+        executor = futures.ProcessPoolExecutor(n_workers,
+                                               initializer=_init_process_worker,
+                                               initargs=(dataset,))
+        fetch = _fetch_in_process
+    else:
+        executor = futures.ThreadPoolExecutor(n_workers)
+
+        def fetch(index):
+            return index, materialize(dataset[index])
+
+    index_iter = iter(indices)
+    pending = deque()
+
+    def submit(n):
+        for _ in range(n):
+            try:
+                index = next(index_iter)
+            except StopIteration:
+                return
+            pending.append(executor.submit(fetch, int(index)))
+
+    try:
+        submit(buffer_size)
+        while len(pending) > 0:
+            if ordered:
+                future = pending.popleft()
+            else:
+                done, _ = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+                future = next(f for f in pending if f in done)
+                pending.remove(future)
+
+            index, sample = future.result()
+            submit(1)
+            yield (index, sample) if with_index else sample
+
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
@@ -0,0 +1,256 @@
+"""
+Storage engine shared by the dataset readers. The diagrams of all samples are
+stored as one ragged array per key path (e.g. 'view_0' or 'dim_1/ess')
+
+    <key>.values.npy    the points of all samples, concatenated
+    <key>.offsets.npy   sample i is values[offsets[i]:offsets[i + 1]]
+
+plus the targets, in the directory <source file>.ragged next to the source
+file. The arrays are memory-mapped (read-only), a sample is a nested dict of
+views without copying and a batch of samples is gathered per key by one
+vectorized take (the FlatBatch layout of utils.collate). The directory is built
+once from the source file and rebuilt if the source changes.
+"""
+import json
+import os
+import shutil
+
+import numpy as np
+
+from .cache import FileLock
+from .collate import FlatBatch
+
+
+RAGGED_STORE_SUFFIX = '.ragged'
+INDEX_FILE_NAME = 'index.json'
+
+
+class RaggedStoreError(Exception):
+    pass
+
+
+def flatten(x, prefix=''):
+    if isinstance(x, dict):
+        for k, v in x.items():
+            yield from flatten(v, prefix + '/' + k if prefix else k)
+    else:
+        yield prefix, np.asarray(x)
+
+
+def _unflatten(flat):
+    x = {}
+    for path, v in flat.items():
+        keys = path.split('/')
+        d = x
+        for k in keys[:-1]:
+            d = d.setdefault(k, {})
+        d[keys[-1]] = v
+    return x
+
+
+def _file_name(key: str):
+    return key.replace('/', '.')
+
+
+def _source_stamp(source_path: str):
+    stat = os.stat(source_path)
+    return {'source_size': stat.st_size, 'source_mtime_ns': stat.st_mtime_ns}
+
+
+class _ValuesWriter:
+    """
+    Appends the points of one key sample by sample to a raw file, finish writes
+    the <key>.values.npy and <key>.offsets.npy files from it.
+    """
+    def __init__(self, name: str, n_samples: int):
+        self.name = name
+        # the samples before the first one with the key have none of its points
+        self.lengths = [0] * n_samples
+        self.dtype = None
+        self.trailing = ()
+        self._raw = open(name + '.values.raw', 'wb')
+
+    def append(self, a):
+        self.lengths.append(a.shape[0] if a.ndim > 0 else 1)
+        # empty diagrams are often stored as shape (0,), the trailing shape is taken from the non empty ones
+        if a.size == 0:
+            return
+        if self.dtype is None:
+            self.dtype, self.trailing = a.dtype, a.shape[1:]
+        a = a.reshape((-1,) + self.trailing).astype(self.dtype, casting='same_kind', copy=False)
+        self._raw.write(np.ascontiguousarray(a).tobytes())
+
+    def pad(self, n_samples: int):
+        self.lengths.extend([0] * (n_samples - len(self.lengths)))
+
+    def finish(self, n_samples: int):
+        self.pad(n_samples)
+        self._raw.close()
+
+        offsets = np.zeros(n_samples + 1, dtype=np.int64)
+        np.cumsum(self.lengths, out=offsets[1:])
+        np.save(self.name + '.offsets.npy', offsets)
+
+        dtype = self.dtype if self.dtype is not None else np.dtype(np.float64)
+        header = {'descr': np.lib.format.dtype_to_descr(dtype),
+                  'fortran_order': False,
+                  'shape': (int(offsets[-1]),) + self.trailing}
+        with open(self.name + '.values.raw', 'rb') as src, open(self.name + '.values.npy', 'wb') as dst:
+            np.lib.format.write_array_header_1_0(dst, header)
+            shutil.copyfileobj(src, dst, 1 << 20)
+        os.remove(self.name + '.values.raw')
+
+
+class RaggedStore:
+    def __init__(self, path: str, mmap: bool = True):
+        self.path = str(path)
+        index_path = os.path.join(self.path, INDEX_FILE_NAME)
+        if not os.path.isfile(index_path):
+            raise RaggedStoreError('No ragged store in {}.'.format(self.path))
+
+        with open(index_path, 'r') as f:
+            self.index = json.load(f)
+
+        self.mmap = mmap
+        mmap_mode = 'r' if mmap else None
+        self._values = {}
+        self._offsets = {}
+        for key in self.keys:
+            name = os.path.join(self.path, _file_name(key))
+            # np.asarray drops the memmap subclass, the data stays mapped
+            self._values[key] = np.asarray(np.load(name + '.values.npy', mmap_mode=mmap_mode))
+            self._offsets[key] = np.load(name + '.offsets.npy')
+
+        self.targets = np.load(os.path.join(self.path, 'targets.npy'), allow_pickle=True)
+
+    def __getstate__(self):
+        # worker processes map the files themselves instead of receiving a copy
+        return {'path': self.path, 'mmap': self.mmap}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'], mmap=state['mmap'])
+
+    @property
+    def keys(self):
+        return self.index['keys']
+
+    @property
+    def attrs(self):
+        return self.index['attrs']
+
+    def __len__(self):
+        return self.index['n_samples']
+
+    @classmethod
+    def build(cls, path: str, samples, attrs: dict = None, source_path: str = None):
+        """
+        Writes the store from the iterable of samples (x, y), x a (nested) dict
+        of arrays. Keys missing in a sample are stored as empty diagrams. The
+        points are appended to one file per key while iterating, only lengths
+        and targets are kept in memory.
+        """
+        path = str(path)
+        tmp_path = path + '.tmp'
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+
+        writers = {}
+        targets = []
+        for i, (x, y) in enumerate(samples):
+            for key, a in flatten(x):
+                if key not in writers:
+                    writers[key] = _ValuesWriter(os.path.join(tmp_path, _file_name(key)), i)
+                writers[key].append(a)
+            for writer in writers.values():
+                writer.pad(i + 1)
+            targets.append(y)
+
+        n_samples = len(targets)
+        for writer in writers.values():
+            writer.finish(n_samples)
+
+        try:
+            targets = np.array(targets)
+        except ValueError:
+            # ragged targets, e.g. eigenvalues
+            targets = np.array(targets + [None], dtype=object)[:-1]
+        np.save(os.path.join(tmp_path, 'targets.npy'), targets, allow_pickle=targets.dtype.kind == 'O')
+
+        index = {'n_samples': n_samples, 'keys': sorted(writers), 'attrs': attrs or {}}
+        if source_path is not None:
+            index.update(_source_stamp(source_path))
+        with open(os.path.join(tmp_path, INDEX_FILE_NAME), 'w') as f:
+            json.dump(index, f, indent=1)
+
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
+        return cls(path)
+
+    @classmethod
+    def open(cls, source_path: str, mmap: bool = True):
+        """
+        Returns the store of source_path if it exists and is up to date, None
+        otherwise. Takes no lock, the source folder may be read-only.
+        """
+        source_path = str(source_path)
+        try:
+            store = cls(source_path + RAGGED_STORE_SUFFIX, mmap=mmap)
+            stamp = _source_stamp(source_path)
+        except (RaggedStoreError, OSError):
+            # missing, or replaced by another process right now
+            return None
+
+        return store if all(store.index.get(k) == v for k, v in stamp.items()) else None
+
+    @classmethod
+    def open_or_build(cls, source_path: str, samples_fn, attrs_fn=None, mmap: bool = True):
+        """
+        Opens the store of source_path, (re)building it from samples_fn() and
+        attrs_fn() if it does not exist or the source has changed since. Only
+        building takes the lock, raises OSError if the store cannot be written.
+        """
+        store = cls.open(source_path, mmap=mmap)
+        if store is not None:
+            return store
+
+        source_path = str(source_path)
+        path = source_path + RAGGED_STORE_SUFFIX
+        with FileLock(path + '.lock'):
+            # another process may have built it while we were waiting
+            store = cls.open(source_path, mmap=mmap)
+            if store is None:
+                attrs = attrs_fn() if attrs_fn is not None else None
+                cls.build(path, samples_fn(), attrs=attrs, source_path=source_path)
+                store = cls(path, mmap=mmap)
+
+        return store
+
+    def lengths(self, key: str):
+        return np.diff(self._offsets[key])
+
+    def get(self, index: int):
+        index = int(index)
+        flat = {}
+        for key in self.keys:
+            offsets = self._offsets[key]
+            flat[key] = self._values[key][offsets[index]:offsets[index + 1]]
+        return _unflatten(flat)
+
+    def get_batch(self, indices, keys: [str] = None):
+        """
+        Returns {key: FlatBatch} of the samples indices, the points of every
+        key are gathered by one take.
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        batch = {}
+        for key in (self.keys if keys is None else keys):
+            offsets = self._offsets[key]
+            starts = offsets[indices]
+            lengths = offsets[indices + 1] - starts
+
+            new_offsets = np.zeros(len(indices) + 1, dtype=np.int64)
+            np.cumsum(lengths, out=new_offsets[1:])
+            positions = np.repeat(starts - new_offsets[:-1], lengths) + np.arange(new_offsets[-1])
+            batch[key] = FlatBatch(self._values[key][positions], new_offsets)
+
+        return batch
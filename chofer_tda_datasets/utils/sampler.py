@@ -0,0 +1,80 @@
+import numpy as np
+
+
+class LengthBucketBatchSampler:
+    """
+    Batch sampler which groups samples of similar size. The samples are sorted
+    by their length, cut into buckets of bucket_size consecutive samples and each
+    bucket is split into batches. If shuffle is True, samples are shuffled within
+    their bucket and the batches are yielded in random order.
+
+    Can be used as batch_sampler of a torch.utils.data.DataLoader.
+    """
+    def __init__(self,
+                 lengths,
+                 batch_size: int,
+                 bucket_size: int = None,
+                 shuffle: bool = True,
+                 drop_last: bool = False,
+                 seed: int = None):
+        self.lengths = np.asarray(lengths)
+        assert self.lengths.ndim == 1
+
+        self.batch_size = int(batch_size)
+        self.bucket_size = int(bucket_size) if bucket_size is not None else 50 * self.batch_size
+        assert self.bucket_size >= self.batch_size
+
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.seed = seed
+        self.epoch = 0
+
+        # stable sort such that the order is reproducible without shuffling
+        self._sorted_indices = np.argsort(self.lengths, kind='stable')
+
+    @classmethod
+    def from_dataset(cls, dataset, batch_size: int, key: str = None, **kwargs):
+        """
+        Reads only the 'n_points' entries of a Hdf5SupervisedDatasetOneFile.
+        """
+        return cls(dataset.n_points(key), batch_size, **kwargs)
+
+    def set_epoch(self, epoch: int):
+        self.epoch = epoch
+
+    def _batches(self):
+        rng = None
+        if self.shuffle:
+            seed = None if self.seed is None else [self.seed, self.epoch]
+            rng = np.random.RandomState(seed)
+
+        batches = []
+        for start in range(0, len(self._sorted_indices), self.bucket_size):
+            bucket = self._sorted_indices[start:start + self.bucket_size]
+            if rng is not None:
+                bucket = rng.permutation(bucket)
+
+            for b_start in range(0, len(bucket), self.batch_size):
+                batch = bucket[b_start:b_start + self.batch_size]
+                if self.drop_last and len(batch) < self.batch_size:
+                    continue
+                batches.append(batch)
+
+        if rng is not None:
+            batches = [batches[i] for i in rng.permutation(len(batches))]
+
+        return batches
+
+    def __iter__(self):
+        for batch in self._batches():
+            yield batch.tolist()
+
+    def __len__(self):
+        n = 0
+        for start in range(0, len(self._sorted_indices), self.bucket_size):
+            bucket_len = min(self.bucket_size, len(self._sorted_indices) - start)
+            n += bucket_len // self.batch_size
+            if not self.drop_last and bucket_len % self.batch_size > 0:
+                n += 1
+
+        return n
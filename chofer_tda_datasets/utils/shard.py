@@ -0,0 +1,180 @@
+"""
+Deterministic partition of the samples over the ranks of a distributed run.
+The sample indices are cut into chunks of chunk_size consecutive indices and
+the chunks are dealt to the ranks, hence every rank reads only its own
+contiguous ranges of the file, i.e., about 1/world_size of it. The partition
+depends only on (seed, epoch), every rank computes it on its own without any
+communication.
+"""
+import numpy as np
+
+from .splits import Subset, SplitError
+
+
+def _chunks(indices, chunk_size: int, offset: int):
+    bounds = list(range(offset, len(indices), chunk_size))
+    bounds = ([0] if offset > 0 else []) + bounds + [len(indices)]
+    return [indices[start:stop] for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+
+
+def _split_group(chunks, sizes):
+    """
+    Cuts the chunks of a group in order into pieces of sizes samples, chunks
+    are split where a piece ends.
+    """
+    indices = np.concatenate(chunks)
+    chunk_ids = np.repeat(np.arange(len(chunks)), [len(c) for c in chunks])
+    bounds = np.concatenate([[0], np.cumsum(sizes)])
+
+    pieces = []
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        cuts = np.flatnonzero(np.diff(chunk_ids[start:stop])) + 1
+        pieces.append([c for c in np.split(indices[start:stop], cuts) if len(c) > 0])
+    return pieces
+
+
+def partition_chunks(n_samples: int,
+                     world_size: int,
+                     chunk_size: int = 64,
+                     seed: int = 0,
+                     epoch: int = 0,
+                     weights=None,
+                     labels=None):
+    """
+    Returns for every rank the list of its chunks (index arrays) in the order
+    they are read. Every epoch the chunk boundaries are shifted by a random
+    offset and the chunks are dealt anew in random order.
+
+    By default every chunk goes to the rank with the fewest samples so far. If
+    weights (e.g. the number of diagram points of every sample) are given, it
+    goes to the rank with the smallest total weight among the ranks which have
+    not yet received their share of chunks. In both cases the ranks differ by
+    at most about one chunk.
+
+    If labels are given, the chunks are cut per label and the chunks of every
+    label are split in order into world_size pieces of equal size, the
+    remainders of the labels are dealt round robin. Hence the ranks differ by
+    at most one sample per label and in total. Chunks of a
+    label are contiguous in the file only as far as the label is and at most
+    world_size - 1 chunks per label are cut where a piece ends.
+    """
+    assert world_size >= 1 and chunk_size >= 1
+    assert weights is None or labels is None
+    rng = np.random.RandomState([seed, epoch])
+
+    if labels is None:
+        groups = [np.arange(n_samples)]
+    else:
+        labels = np.asarray(labels)
+        groups = [np.flatnonzero(labels == label) for label in np.unique(labels)]
+
+    group_chunks = []
+    for group in groups:
+        chunks = _chunks(group, chunk_size, rng.randint(chunk_size))
+        group_chunks.append([chunks[i] for i in rng.permutation(len(chunks))])
+
+    if labels is not None:
+        parts = [[] for _ in range(world_size)]
+        # the rank which gets the next remainder sample
+        next_rank = 0
+        for chunks in group_chunks:
+            n_per_rank, remainder = divmod(sum(len(c) for c in chunks), world_size)
+            sizes = np.full(world_size, n_per_rank, dtype=np.int64)
+            sizes[(next_rank + np.arange(remainder)) % world_size] += 1
+            next_rank = (next_rank + remainder) % world_size
+
+            for rank, piece in enumerate(_split_group(chunks, sizes)):
+                parts[rank].extend(piece)
+
+        return [[p[i] for i in rng.permutation(len(p))] for p in parts]
+
+    if weights is not None:
+        weights = np.asarray(weights, dtype=np.float64)
+        max_chunks = -(-sum(len(chunks) for chunks in group_chunks) // world_size)
+
+    parts = [[] for _ in range(world_size)]
+    sizes = np.zeros(world_size, dtype=np.int64)
+    loads = np.zeros(world_size)
+    for chunk in group_chunks[0]:
+        if weights is not None:
+            is_open = np.array([len(p) < max_chunks for p in parts])
+            rank = int(np.argmin(np.where(is_open, loads, np.inf)))
+            loads[rank] += weights[chunk].sum()
+        else:
+            rank = int(np.argmin(sizes))
+
+        parts[rank].append(chunk)
+        sizes[rank] += len(chunk)
+
+    return [[p[i] for i in rng.permutation(len(p))] for p in parts]
+
+
+def shard_indices(n_samples: int,
+                  rank: int,
+                  world_size: int,
+                  pad: bool = True,
+                  **kwargs):
+    """
+    The indices of rank, see partition_chunks for kwargs. If pad is True,
+    every rank gets as many indices as the largest rank by repeating its own
+    first indices, such that all ranks run the same number of steps.
+    """
+    assert 0 <= rank < world_size
+    parts = partition_chunks(n_samples, world_size, **kwargs)
+    sizes = [sum(len(c) for c in p) for p in parts]
+
+    part = parts[rank]
+    indices = np.concatenate(part).astype(np.int64) if len(part) > 0 else np.zeros(0, dtype=np.int64)
+
+    if pad and len(indices) > 0 and len(indices) < max(sizes):
+        indices = np.resize(indices, max(sizes))
+
+    return indices
+
+
+class Shard(Subset):
+    """
+    The samples of one rank, see SupervisedDataset.shard. Call set_epoch at the
+    beginning of every epoch to get the partition of that epoch.
+    """
+    def __init__(self,
+                 dataset,
+                 rank: int,
+                 world_size: int,
+                 seed: int = 0,
+                 epoch: int = 0,
+                 chunk_size: int = 64,
+                 balance: str = None,
+                 key: str = None,
+                 pad: bool = True):
+        assert balance in (None, 'n_points', 'label')
+        self.rank = rank
+        self.world_size = world_size
+        self.seed = seed
+        self.chunk_size = chunk_size
+        self.balance = balance
+        self.pad = pad
+
+        self._weights = None
+        self._labels = None
+        if balance == 'n_points':
+            self._weights = dataset.n_points(key)
+        elif balance == 'label':
+            self._labels = dataset._split_labels()
+            if self._labels is None:
+                raise SplitError('Cannot balance by label, the targets are not categorical.')
+
+        super().__init__(dataset, [])
+        self.set_epoch(epoch)
+
+    def set_epoch(self, epoch: int):
+        self.epoch = epoch
+        self.indices = shard_indices(len(self.dataset),
+                                     self.rank,
+                                     self.world_size,
+                                     pad=self.pad,
+                                     chunk_size=self.chunk_size,
+                                     seed=self.seed,
+                                     epoch=epoch,
+                                     weights=self._weights,
+                                     labels=self._labels)
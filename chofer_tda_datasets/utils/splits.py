@@ -0,0 +1,243 @@
+"""
+Reproducible train/test splits and k-folds which are computed once from the
+stored targets (or groups like the SciNe01 subjects) and written to a sidecar
+file <dataset file>.splits.h5 with the layout
+
+    <name>/<fold>/train, <name>/<fold>/test    sorted sample indices
+
+and the parameters of the split as attributes of <name>.
+"""
+import os
+
+import numpy as np
+
+from .cache import FileLock
+
+
+SPLITS_FILE_SUFFIX = '.splits.h5'
+
+
+class SplitError(Exception):
+    pass
+
+
+def stratified_fold_ids(labels, n_folds: int, seed: int = 0):
+    """
+    Assigns every sample to one of n_folds folds such that each label is spread
+    evenly over the folds.
+    """
+    labels = np.asarray(labels)
+    rng = np.random.RandomState(seed)
+    fold_ids = np.empty(len(labels), dtype=np.int64)
+
+    offset = 0
+    for label in np.unique(labels):
+        indices = rng.permutation(np.flatnonzero(labels == label))
+        # the offset keeps the folds balanced in size over all labels
+        fold_ids[indices] = (offset + np.arange(len(indices))) % n_folds
+        offset += len(indices)
+
+    return fold_ids
+
+
+def grouped_fold_ids(groups, n_folds: int, seed: int = 0):
+    """
+    Assigns every group of samples as a whole to one of n_folds folds, largest
+    groups first to the currently smallest fold.
+    """
+    groups = np.asarray(groups)
+    rng = np.random.RandomState(seed)
+    unique_groups, inverse, counts = np.unique(groups, return_inverse=True, return_counts=True)
+
+    order = rng.permutation(len(unique_groups))
+    order = order[np.argsort(-counts[order], kind='stable')]
+
+    fold_of_group = np.empty(len(unique_groups), dtype=np.int64)
+    fold_sizes = np.zeros(n_folds, dtype=np.int64)
+    for g in order:
+        fold = int(np.argmin(fold_sizes))
+        fold_of_group[g] = fold
+        fold_sizes[fold] += counts[g]
+
+    return fold_of_group[inverse]
+
+
+def train_test_mask(n_samples: int, test_fraction: float, labels=None, groups=None, seed: int = 0):
+    """
+    Returns a boolean mask of the test samples. The split is stratified by
+    labels or, if groups is given, no group is split.
+    """
+    assert 0 < test_fraction < 1
+    rng = np.random.RandomState(seed)
+    is_test = np.zeros(n_samples, dtype=bool)
+
+    if groups is not None:
+        unique_groups, inverse, counts = np.unique(np.asarray(groups), return_inverse=True, return_counts=True)
+        order = rng.permutation(len(unique_groups))
+        n_test = np.cumsum(counts[order])
+        test_groups = order[:np.searchsorted(n_test, test_fraction * n_samples) + 1]
+        is_test[np.isin(inverse, test_groups)] = True
+
+    else:
+        labels = np.zeros(n_samples) if labels is None else np.asarray(labels)
+        for label in np.unique(labels):
+            indices = rng.permutation(np.flatnonzero(labels == label))
+            is_test[indices[:int(round(test_fraction * len(indices)))]] = True
+
+    return is_test
+
+
+def contiguous_ranges(indices):
+    """
+    Returns the runs of consecutive values of the sorted indices as
+    [(start, stop), ...].
+    """
+    indices = np.asarray(indices)
+    if len(indices) == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(indices) != 1) + 1
+    starts = indices[np.concatenate([[0], breaks])]
+    stops = indices[np.concatenate([breaks - 1, [len(indices) - 1]])] + 1
+    return list(zip(starts.tolist(), stops.tolist()))
+
+
+def read_rows(ds, indices):
+    """
+    Reads ds[indices] for sorted indices by one slice per contiguous range
+    instead of a point selection.
+    """
+    ranges = contiguous_ranges(indices)
+    if len(ranges) == 0:
+        return ds[0:0]
+    return np.concatenate([ds[start:stop] for start, stop in ranges], axis=0)
+
+
+def write_splits(path: str, name: str, folds, attrs: dict = None):
+    """
+    folds: [(train indices, test indices), ...]. An existing split of the same
+    name is replaced.
+    """
+    import h5py
+
+    with FileLock(path + '.lock'):
+        with h5py.File(path, 'a') as f:
+            if name in f:
+                del f[name]
+            grp = f.create_group(name)
+            for k, v in (attrs or {}).items():
+                grp.attrs[k] = v
+            for fold, (train, test) in enumerate(folds):
+                grp_fold = grp.create_group(str(fold))
+                grp_fold.create_dataset('train', data=np.sort(train).astype(np.int64))
+                grp_fold.create_dataset('test', data=np.sort(test).astype(np.int64))
+
+
+def read_split(path: str, name: str, split: str, fold: int, n_samples: int = None):
+    if not os.path.isfile(path):
+        raise SplitError('No splits file {}, call make_splits first.'.format(path))
+
+    import h5py
+    with h5py.File(path, 'r') as f:
+        if name not in f:
+            raise SplitError('No split named {} in {}, call make_splits first.'.format(name, path))
+        if n_samples is not None and f[name].attrs['n_samples'] != n_samples:
+            raise SplitError('Split {} was made for {} samples, not {}.'.format(name, f[name].attrs['n_samples'],
+                                                                              n_samples))
+        if str(fold) not in f[name]:
+            raise SplitError('Split {} has no fold {}.'.format(name, fold))
+        return f[name][str(fold)][split][()]
+
+
+class Subset:
+    """
+    View on the samples indices of a dataset, iterated in the order of indices.
+    """
+    def __init__(self, dataset, indices):
+        self.dataset = dataset
+        self.indices = np.asarray(indices, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, index):
+        return self.dataset[int(self.indices[index])]
+
+    def __iter__(self):
+        for i in self.indices.tolist():
+            yield self.dataset[i]
+
+    def prefetch(self, **kwargs):
+        return self.dataset.prefetch(indices=self.indices, **kwargs)
+
+    @property
+    def ranges(self):
+        return contiguous_ranges(np.unique(self.indices))
+
+    @property
+    def targets(self):
+        # _targets_at reads sorted indices
+        unique, inverse = np.unique(self.indices, return_inverse=True)
+        return self.dataset._targets_at(unique)[inverse]
+
+    def n_points(self, key: str = None):
+        return self.dataset.n_points(key)[self.indices]
+
+
+class SplitsMixin:
+    """
+    Adds make_splits and subset to a dataset which provides _split_labels,
+    _split_groups, _targets_at and _splits_file_path.
+    """
+    def _split_labels(self):
+        raise NotImplementedError()
+
+    def _split_groups(self, group_key: str):
+        raise NotImplementedError()
+
+    def _targets_at(self, indices):
+        return np.array([self[i][1] for i in indices])
+
+    @property
+    def _splits_file_path(self):
+        raise NotImplementedError()
+
+    def make_splits(self,
+                    name: str = 'default',
+                    n_folds: int = None,
+                    test_fraction: float = 0.2,
+                    stratify: bool = True,
+                    group_key: str = None,
+                    seed: int = 0):
+        """
+        Computes a train/test split (n_folds None) or n_folds folds where fold k
+        tests on the k-th part and trains on the rest and writes it to the
+        sidecar file. The split is stratified by the targets, as far as they are
+        categorical, or, if group_key is given, grouped by the stored array
+        group_key (e.g. 'subject').
+        """
+        n_samples = len(self)
+        labels = self._split_labels() if stratify and group_key is None else None
+        groups = self._split_groups(group_key) if group_key is not None else None
+        all_indices = np.arange(n_samples)
+
+        if n_folds is None:
+            is_test = train_test_mask(n_samples, test_fraction, labels=labels, groups=groups, seed=seed)
+            folds = [(all_indices[~is_test], all_indices[is_test])]
+        else:
+            if groups is not None:
+                fold_ids = grouped_fold_ids(groups, n_folds, seed=seed)
+            else:
+                fold_ids = stratified_fold_ids(np.zeros(n_samples) if labels is None else labels, n_folds, seed=seed)
+            folds = [(all_indices[fold_ids != k], all_indices[fold_ids == k]) for k in range(n_folds)]
+
+        attrs = {'n_folds': 0 if n_folds is None else n_folds,
+                 'test_fraction': test_fraction if n_folds is None else 0.,
+                 'stratify': bool(labels is not None),
+                 'group_key': group_key or '',
+                 'seed': seed,
+                 'n_samples': n_samples}
+        write_splits(self._splits_file_path, name, folds, attrs=attrs)
+
+    def subset(self, split: str = 'train', fold: int = 0, name: str = 'default'):
+        assert split in ('train', 'test')
+        return Subset(self, read_split(self._splits_file_path, name, split, fold, n_samples=len(self)))
@@ -0,0 +1,280 @@
+"""
+Export of a dataset to sequential tar shards (WebDataset layout) and a
+streaming reader of them, for storage where random access is slow, e.g. an S3
+compatible object store.
+
+Every sample i is stored as the members
+
+    <i:08d>.data.npz    the diagrams, nested dict keys joined by '/'
+    <i:08d>.data.npy    instead, if the data is a single array
+    <i:08d>.target.npy  the target
+
+in the shards <prefix>-<k:05d>.tar, which are listed with their number of
+samples and size in <prefix>.index.json.
+"""
+import io
+import json
+import os
+import tarfile
+
+import numpy as np
+
+from .prefetch import materialize
+
+try:
+    # DataLoader treats only subclasses of IterableDataset as streams
+    from torch.utils.data import IterableDataset as _IterableDatasetBase
+except ImportError:
+    _IterableDatasetBase = object
+
+
+class TarShardError(Exception):
+    pass
+
+
+def _flatten(x, prefix=''):
+    if isinstance(x, dict):
+        for k, v in x.items():
+            yield from _flatten(v, prefix + '/' + k if prefix else k)
+    elif isinstance(x, (list, tuple)):
+        raise TarShardError('Cannot export list data, export without the selecting transform.')
+    else:
+        yield prefix, np.asarray(x)
+
+
+def _unflatten(flat):
+    x = {}
+    for path, v in flat.items():
+        keys = path.split('/')
+        d = x
+        for k in keys[:-1]:
+            d = d.setdefault(k, {})
+        d[keys[-1]] = v
+    return x
+
+
+def encode_sample(index: int, x, y):
+    """
+    Returns the [(member name, bytes), ...] of a sample.
+    """
+    key = '{:08d}'.format(index)
+    f = io.BytesIO()
+    if isinstance(x, dict):
+        np.savez(f, **dict(_flatten(x)))
+        members = [(key + '.data.npz', f.getvalue())]
+    else:
+        np.save(f, np.asarray(x), allow_pickle=False)
+        members = [(key + '.data.npy', f.getvalue())]
+
+    f = io.BytesIO()
+    np.save(f, np.asarray(y), allow_pickle=np.asarray(y).dtype.kind == 'O')
+    members.append((key + '.target.npy', f.getvalue()))
+    return members
+
+
+def decode_member(name: str, data: bytes):
+    f = io.BytesIO(data)
+    if name.endswith('.npz'):
+        with np.load(f, allow_pickle=False) as npz:
+            return _unflatten({k: npz[k] for k in npz.files})
+    return np.load(f, allow_pickle=name.endswith('.target.npy'))
+
+
+def _add_member(tar, name: str, data: bytes):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    # mtime 0 such that the shards are reproducible
+    info.mtime = 0
+    tar.addfile(info, io.BytesIO(data))
+
+
+def export_tar_shards(dataset,
+                      output_dir: str,
+                      prefix: str = 'shard',
+                      shard_size: int = 256 * 1024 ** 2,
+                      indices=None,
+                      n_workers: int = 4):
+    """
+    Writes dataset[i] for i in indices (default all) in this order to tar
+    shards of about shard_size bytes each, the samples are read ahead by
+    n_workers threads. Returns the index, which is also written to
+    <prefix>.index.json.
+
+    Export datasets without selecting transforms, the nested dicts of the raw
+    samples are kept.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    # iterated twice below, a generator would be split between both
+    indices = range(len(dataset)) if indices is None else list(indices)
+    shards = []
+    tar = None
+
+    def close():
+        tar.close()
+        shard = shards[-1]
+        os.replace(shard['path'] + '.tmp', shard['path'])
+        shard['path'] = os.path.basename(shard['path'])
+
+    samples = dataset.prefetch(indices=indices, n_workers=n_workers) if hasattr(dataset, 'prefetch') else \
+        (dataset[i] for i in indices)
+
+    for index, (x, y) in zip(indices, samples):
+        members = encode_sample(int(index), materialize(x), y)
+        n_bytes = sum(len(data) + 512 for _, data in members)
+
+        if tar is None or (shards[-1]['n_samples'] > 0 and shards[-1]['n_bytes'] + n_bytes > shard_size):
+            if tar is not None:
+                close()
+            path = os.path.join(output_dir, '{}-{:05d}.tar'.format(prefix, len(shards)))
+            shards.append({'path': path, 'n_samples': 0, 'n_bytes': 0})
+            tar = tarfile.open(path + '.tmp', 'w', format=tarfile.USTAR_FORMAT)
+
+        for name, data in members:
+            _add_member(tar, name, data)
+        shards[-1]['n_samples'] += 1
+        shards[-1]['n_bytes'] += n_bytes
+
+    if tar is not None:
+        close()
+
+    index = {'dataset': type(dataset).__name__,
+             'n_samples': sum(s['n_samples'] for s in shards),
+             'shards': shards}
+    with open(os.path.join(output_dir, prefix + '.index.json'), 'w') as f:
+        json.dump(index, f, indent=1)
+
+    return index
+
+
+def _open_stream(url: str):
+    if url.startswith('http://') or url.startswith('https://'):
+        import requests
+        response = requests.get(url, stream=True)
+        response.raise_for_status()
+        response.raw.decode_content = True
+        return response.raw
+    if url.startswith('file://'):
+        url = url[len('file://'):]
+    return open(url, 'rb', buffering=1 << 20)
+
+
+def iter_tar_samples(url: str):
+    """
+    Yields (index, x, y) of the shard at url (path, file:// or http(s) url,
+    e.g. a presigned object store url) in one sequential pass.
+    """
+    with _open_stream(url) as stream, tarfile.open(fileobj=stream, mode='r|') as tar:
+        key, sample = None, {}
+        for info in tar:
+            if not info.isfile():
+                continue
+            member_key, field = info.name.split('.', 1)
+            if member_key != key:
+                if key is not None:
+                    yield int(key), sample['data'], sample['target']
+                key, sample = member_key, {}
+            sample[field.split('.')[0]] = decode_member(info.name, tar.extractfile(info).read())
+
+        if key is not None:
+            yield int(key), sample['data'], sample['target']
+
+
+def _torch_worker_info():
+    try:
+        from torch.utils.data import get_worker_info
+    except ImportError:
+        return None
+    return get_worker_info()
+
+
+class TarShardDataset(_IterableDatasetBase):
+    """
+    Streams the samples (x, y) of tar shards, a torch.utils.data.IterableDataset
+    if torch is installed. If shuffle is True, the shard order is shuffled with
+    (seed, epoch) (set_epoch) and the samples pass a shuffle buffer of
+    buffer_size samples. The shards are split over rank / world_size and,
+    inside a torch DataLoader, over its workers. The data transforms get the
+    diagrams as nested dicts of numpy arrays, not h5py groups.
+    """
+    def __init__(self,
+                 urls,
+                 data_transforms: [] = None,
+                 target_transforms: [] = None,
+                 shuffle: bool = True,
+                 buffer_size: int = 1000,
+                 seed: int = 0,
+                 rank: int = 0,
+                 world_size: int = 1,
+                 with_index: bool = False):
+        if isinstance(urls, str):
+            urls = self.urls_from_index(urls)
+        self.urls = list(urls)
+        self.data_transforms = list(data_transforms) if data_transforms is not None else []
+        self.target_transforms = list(target_transforms) if target_transforms is not None else []
+        self.shuffle = shuffle
+        self.buffer_size = buffer_size
+        self.seed = seed
+        self.epoch = 0
+        self.rank = rank
+        self.world_size = world_size
+        self.with_index = with_index
+        assert 0 <= rank < world_size and buffer_size >= 1
+
+    @staticmethod
+    def urls_from_index(index_path: str):
+        """
+        The shards of the <prefix>.index.json written by export_tar_shards, which
+        are located next to it.
+        """
+        if not os.path.isfile(index_path):
+            raise TarShardError('No index file {}.'.format(index_path))
+        with open(index_path, 'r') as f:
+            index = json.load(f)
+        return [os.path.join(os.path.dirname(index_path), s['path']) for s in index['shards']]
+
+    def set_epoch(self, epoch: int):
+        self.epoch = epoch
+
+    def _shard_urls(self):
+        urls = self.urls
+        if self.shuffle:
+            rng = np.random.RandomState([self.seed, self.epoch])
+            urls = [urls[i] for i in rng.permutation(len(urls))]
+
+        urls = urls[self.rank::self.world_size]
+        worker_info = _torch_worker_info()
+        if worker_info is not None:
+            urls = urls[worker_info.id::worker_info.num_workers]
+        return urls
+
+    def _samples(self):
+        for url in self._shard_urls():
+            yield from iter_tar_samples(url)
+
+    def _shuffled(self, samples):
+        worker_info = _torch_worker_info()
+        worker_id = worker_info.id if worker_info is not None else 0
+        rng = np.random.RandomState([self.seed, self.epoch, self.rank, worker_id])
+        buffer = []
+        for sample in samples:
+            if len(buffer) < self.buffer_size:
+                buffer.append(sample)
+                continue
+            i = rng.randint(self.buffer_size)
+            yield buffer[i]
+            buffer[i] = sample
+
+        for i in rng.permutation(len(buffer)):
+            yield buffer[i]
+
+    def __iter__(self):
+        samples = self._samples()
+        if self.shuffle:
+            samples = self._shuffled(samples)
+
+        for index, x, y in samples:
+            for t in self.data_transforms:
+                x = t(x)
+            for t in self.target_transforms:
+                y = t(y)
+            yield (index, (x, y)) if self.with_index else (x, y)
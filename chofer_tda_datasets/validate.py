@@ -0,0 +1,214 @@
+"""
+Integrity check of dataset files, meant as pre-flight step before training.
+
+Usage:
+
+    python -m chofer_tda_datasets.validate Reddit12kJmlr --root <folder> --report report.json
+
+Checks that every index 0..len-1 exists and the number of targets matches, that
+every diagram (key path) has the same dtype in all samples, that there are no
+NaNs, that births do not exceed deaths and that the stored 'n_points' match.
+The samples are scanned in sorted chunks by a pool of reader processes which
+keep the file open. Exits with 1 if a problem was found.
+"""
+import argparse
+import concurrent.futures as futures
+import json
+import sys
+import time
+
+from collections import defaultdict
+
+import h5py
+import numpy as np
+
+from .utils.h5py_dataset import Hdf5SupervisedDatasetOneFile, bind_h5py_file
+
+
+MAX_PROBLEMS_IN_REPORT = 100
+
+
+def check_array(key: str, a, problems: list, index=None):
+    a = np.asarray(a)
+    if a.dtype.kind not in 'fiu':
+        return
+
+    if a.dtype.kind == 'f' and np.isnan(a).any():
+        problems.append((index, key, '{} NaN values'.format(int(np.isnan(a).sum()))))
+
+    if a.ndim == 2 and a.shape[1] == 2:
+        n_bad = int((a[:, 0] > a[:, 1]).sum())
+        if n_bad > 0:
+            problems.append((index, key, '{} points with birth > death'.format(n_bad)))
+
+
+def _leaves(x, prefix=''):
+    if isinstance(x, h5py.Dataset):
+        yield prefix, x[()]
+    elif isinstance(x, (dict, h5py.Group)):
+        for k, v in x.items():
+            yield from _leaves(v, prefix + '/' + k if prefix else k)
+    else:
+        yield prefix, np.asarray(x)
+
+
+_worker_dataset = None
+
+
+def _init_worker(dataset):
+    global _worker_dataset
+    _worker_dataset = dataset
+    bind_h5py_file(dataset.file_path, h5py.File(dataset.file_path, 'r'))
+
+
+def _check_chunk(chunk):
+    start, stop = chunk
+    problems = []
+    dtypes = defaultdict(set)
+    n_points = np.zeros(stop - start, dtype=np.int64)
+
+    for index in range(start, stop):
+        try:
+            grp = _worker_dataset._get_data_i(index)
+            for key, a in _leaves(grp):
+                dtypes[key].add(a.dtype.str)
+                check_array(key, a, problems, index=index)
+                n_points[index - start] += a.shape[0] if a.ndim > 0 else 1
+        except Exception as ex:
+            problems.append((index, None, 'cannot read: {!r}'.format(ex)))
+
+    return start, problems, {k: sorted(v) for k, v in dtypes.items()}, n_points
+
+
+def validate_hdf5_dataset(dataset: Hdf5SupervisedDatasetOneFile, n_workers: int = 8, chunk_size: int = 256):
+    """
+    Returns the report as dict.
+    """
+    t_start = time.perf_counter()
+    problems = []
+
+    try:
+        with h5py.File(dataset.file_path, 'r') as h5file:
+            data_keys = set(h5file[dataset.data_hdf5_key].keys())
+            n_targets = len(h5file[dataset.target_hdf5_key])
+            has_n_points = dataset.n_points_hdf5_key in h5file
+    except Exception as ex:
+        return {'file': str(dataset.file_path),
+                'ok': False,
+                'n_problems': 1,
+                'problems': [(None, None, 'cannot open: {!r}'.format(ex))]}
+
+    # without index_by_freq etc. the samples are 'data'/<i>, i = 0, ..., n - 1
+    n_samples = len(data_keys)
+    missing = sorted(i for i in range(n_samples) if str(i) not in data_keys)
+    unexpected = sorted(data_keys - {str(i) for i in range(n_samples)})
+    problems += [(i, None, 'missing sample') for i in missing]
+    problems += [(None, k, 'unexpected sample key') for k in unexpected]
+    if n_targets != n_samples:
+        problems.append((None, dataset.target_hdf5_key, '{} targets for {} samples'.format(n_targets, n_samples)))
+
+    # also the indices up to the number of targets are read, missing ones are reported as unreadable
+    n_expected = max(len(dataset), n_targets)
+    chunks = [(start, min(start + chunk_size, n_expected)) for start in range(0, n_expected, chunk_size)]
+    dtypes = defaultdict(set)
+    n_points = np.zeros(n_expected, dtype=np.int64)
+
+    with futures.ProcessPoolExecutor(n_workers, initializer=_init_worker, initargs=(dataset,)) as executor:
+        for start, chunk_problems, chunk_dtypes, chunk_n_points in executor.map(_check_chunk, chunks):
+            problems += chunk_problems
+            for k, v in chunk_dtypes.items():
+                dtypes[k].update(v)
+            n_points[start:start + len(chunk_n_points)] = chunk_n_points
+
+    for key, key_dtypes in sorted(dtypes.items()):
+        if len(key_dtypes) > 1:
+            problems.append((None, key, 'inconsistent dtypes {}'.format(sorted(key_dtypes))))
+
+    if has_n_points:
+        stored = dataset.n_points()
+        if stored is not None and len(stored) == len(n_points):
+            for i in np.flatnonzero(stored != n_points).tolist():
+                problems.append((i, dataset.n_points_hdf5_key, 'stored {} points, found {}'.format(stored[i],
+                                                                                                    n_points[i])))
+
+    elapsed = time.perf_counter() - t_start
+    return {'file': str(dataset.file_path),
+            'ok': len(problems) == 0,
+            'n_samples': len(dataset),
+            'n_targets': n_targets,
+            'n_problems': len(problems),
+            'problems': problems[:MAX_PROBLEMS_IN_REPORT],
+            'dtypes': {k: sorted(v) for k, v in sorted(dtypes.items())},
+            'elapsed_s': elapsed,
+            'samples_per_s': len(dataset) / elapsed if elapsed > 0 else None}
+
+
+def validate_provider_dataset(dataset):
+    """
+    NIPS 2017 datasets, the provider is in memory, hence no pool is used.
+    """
+    t_start = time.perf_counter()
+    problems = []
+    dtypes = defaultdict(set)
+    provider = dataset._provider
+
+    try:
+        provider._check_views_are_consistent()
+    except Exception as ex:
+        problems.append((None, None, str(ex)))
+
+    for view_name, view in provider.data_views.items():
+        for label, label_group in view.items():
+            for sample_id, dgm in label_group.items():
+                dgm = np.asarray(dgm)
+                dtypes[view_name].add(dgm.dtype.str)
+                check_array(view_name, dgm, problems, index=sample_id)
+
+    for key, key_dtypes in sorted(dtypes.items()):
+        if len(key_dtypes) > 1:
+            problems.append((None, key, 'inconsistent dtypes {}'.format(sorted(key_dtypes))))
+
+    return {'file': dataset._provider_file_path,
+            'ok': len(problems) == 0,
+            'n_samples': len(dataset),
+            'n_problems': len(problems),
+            'problems': problems[:MAX_PROBLEMS_IN_REPORT],
+            'dtypes': {k: sorted(v) for k, v in sorted(dtypes.items())},
+            'elapsed_s': time.perf_counter() - t_start}
+
+
+def validate(dataset, n_workers: int = 8, chunk_size: int = 256):
+    if isinstance(dataset, Hdf5SupervisedDatasetOneFile):
+        return validate_hdf5_dataset(dataset, n_workers=n_workers, chunk_size=chunk_size)
+    return validate_provider_dataset(dataset)
+
+
+def main(argv=None):
+    import chofer_tda_datasets
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('dataset', help='name of the dataset class, e.g. Reddit12kJmlr')
+    parser.add_argument('--root', default=None, help='folder of the dataset file, the cache if not given')
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--chunk-size', type=int, default=256)
+    parser.add_argument('--report', default=None, help='path of the json report')
+    args = parser.parse_args(argv)
+
+    dataset = getattr(chofer_tda_datasets, args.dataset)(args.root, download=False)
+
+    report = validate(dataset, n_workers=args.workers, chunk_size=args.chunk_size)
+    report['dataset'] = args.dataset
+
+    if args.report is not None:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=1, default=str)
+
+    print('{}: {}, {} problems'.format(args.dataset, 'ok' if report['ok'] else 'FAILED', report['n_problems']))
+    for problem in report['problems'][:10]:
+        print('  index {}, key {}: {}'.format(*problem))
+
+    sys.exit(0 if report['ok'] else 1)
+
+
+if __name__ == '__main__':
+    main()
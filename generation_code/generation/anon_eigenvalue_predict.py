@@ -1,31 +1,50 @@
 import multiprocessing
+import time
 
 import h5py
 import numpy as np
 from pershombox import toplex_persistence_diagrams
 
-from .utils.graph import read_graph_from_metis_file
+from .utils.discovery import load_or_discover_files_by_id
+from .utils.filtrations import Graph, filtration_names, persistence_diagrams_of_filtrations
+from .utils.graph import read_graph_from_metis_file, read_csr_from_metis_file, read_eigenvalue_file
 from .path_config import data_raw_path, data_generated_path
-from .utils.gui import SimpleProgressCounter
+from .utils.gui import ProgressMetrics
+from .utils.writer import create_n_points_datasets, write_diagrams, ordered_imap
 
 
 def job_args_list(raw_data_dir,
                   get_graph_id_from_path,
                   graph_file_extension='metis',
-                  eigenvalue_file_extension='eigenvalues'):
-    gr_files = sorted(raw_data_dir.glob('*.' + graph_file_extension))
-    ev_files = sorted(raw_data_dir.glob('*.' + eigenvalue_file_extension))
-    assert len(gr_files) == len(ev_files)
-    file_paths = list(zip(gr_files, ev_files))
+                  eigenvalue_file_extension='eigenvalues',
+                  manifest_path=None):
+    """
+    Pairs the graph and eigenvalue files by id in one pass over raw_data_dir,
+    all unpaired ids are reported at once by a DiscoveryError. If
+    manifest_path is given the pairing is cached there, see
+    utils.discovery.load_or_discover_files_by_id.
+    """
+    extensions_by_kind = {'graph': graph_file_extension}
+    if eigenvalue_file_extension is not None:
+        extensions_by_kind['eigenvalues'] = eigenvalue_file_extension
+    # otherwise the eigenvalues are computed by the jobs
+
+    files_by_id = load_or_discover_files_by_id(raw_data_dir,
+                                               get_graph_id_from_path,
+                                               extensions_by_kind,
+                                               manifest_path=manifest_path)
+
+    # the index order is the order of the graph file names
+    sorted_ids = sorted(files_by_id, key=lambda id: files_by_id[id]['graph'])
 
     job_args = []
-    for index, (gr, ev) in enumerate(file_paths):
-        gr_id = get_graph_id_from_path(gr)
-        assert gr_id == get_graph_id_from_path(ev)
+    for index, gr_id in enumerate(sorted_ids):
+        files = files_by_id[gr_id]
+        ev = files.get('eigenvalues')
         arg = {'graph_index': index,
                'graph_id': gr_id,
-               'graph_file_path': str(gr),
-               'ev_file_path': str(ev)}
+               'graph_file_path': str(raw_data_dir.joinpath(files['graph'])),
+               'ev_file_path': None if ev is None else str(raw_data_dir.joinpath(ev))}
 
         job_args.append(arg)
 
@@ -37,28 +56,52 @@ def degree_filtration(simplex, vertex_degree_list):
 
 
 def job(args):
+    """
+    If args['eigenvalue_targets'] is given, e.g., {'k': 10, 'which': 'smallest'},
+    the target is computed by Graph.laplacian_eigenvalues instead of read from
+    args['ev_file_path'].
+    """
     graph_index = args['graph_index']
     graph_id = args['graph_id']
     graph_file_path = args['graph_file_path']
     ev_file_path = args['ev_file_path']
-
-    vertices, edges, vertex_degree_list = read_graph_from_metis_file(graph_file_path)
-    eigenvalues = np.loadtxt(ev_file_path)
-
-    list_of_toplices = vertices + edges
-    filtration_values = [degree_filtration(s, vertex_degree_list) for s in list_of_toplices]
-    dgms_by_dim = toplex_persistence_diagrams(list_of_toplices, filtration_values, deessentialize=False)
-
-    dim_0 = [(b, d) for b, d in dgms_by_dim[0] if d != float('inf')]
-    dim_0_ess = [b for b, d in dgms_by_dim[0] if d == float('inf')]
-    dim_1_ess = [b for b, d in dgms_by_dim[1] if d == float('inf')]
+    filtrations = args.get('filtrations')
+    eigenvalue_targets = args.get('eigenvalue_targets')
+
+    t_start = time.perf_counter()
+    if filtrations is None:
+        vertices, edges, vertex_degree_list = read_graph_from_metis_file(graph_file_path)
+        graph = Graph.from_edge_list(len(vertices), edges) if eigenvalue_targets is not None else None
+    else:
+        n_vertices, indptr, indices = read_csr_from_metis_file(graph_file_path)
+        graph = Graph.from_csr(np.arange(n_vertices), indptr, indices)
+    eigenvalues = read_eigenvalue_file(ev_file_path) if eigenvalue_targets is None else None
+    t_read = time.perf_counter()
+
+    if eigenvalue_targets is not None:
+        eigenvalues = graph.laplacian_eigenvalues(**eigenvalue_targets)
+
+    if filtrations is None:
+        list_of_toplices = vertices + edges
+        filtration_values = [degree_filtration(s, vertex_degree_list) for s in list_of_toplices]
+        dgms_by_dim = toplex_persistence_diagrams(list_of_toplices, filtration_values, deessentialize=False)
+
+        dim_0 = [(b, d) for b, d in dgms_by_dim[0] if d != float('inf')]
+        dim_0_ess = [b for b, d in dgms_by_dim[0] if d == float('inf')]
+        dim_1_ess = [b for b, d in dgms_by_dim[1] if d == float('inf')]
+
+        dgms = {None: {'dim_0': np.array(dim_0),
+                       'dim_0_ess': np.array(dim_0_ess),
+                       'dim_1_ess': np.array(dim_1_ess)}}
+    else:
+        dgms = persistence_diagrams_of_filtrations(graph, filtrations)
 
     ret_val = {'graph_index': graph_index,
                'graph_id': graph_id,
-               'dim_0': np.array(dim_0),
-               'dim_0_ess': np.array(dim_0_ess),
-               'dim_1_ess': np.array(dim_1_ess),
-               'eigenvalues': eigenvalues}
+               'dgms': dgms,
+               'eigenvalues': eigenvalues,
+               'timings': {'read': t_read - t_start,
+                           'compute': time.perf_counter() - t_read}}
 
     return ret_val
 
@@ -69,18 +112,37 @@ def run(raw_data_dir_name,
         eigenvalue_file_extension,
         output_file_name,
         read_me_txt="",
-        max_cpu=10):
+        max_cpu=10,
+        filtrations=None,
+        eigenvalue_targets=None,
+        manifest_path=None):
+    """
+    If filtrations (names or (name, kwargs) pairs of utils.filtrations) is
+    given, the diagrams of each filtration are written to 'data'/<i>/<filtration>
+    instead of the degree filtration diagrams to 'data'/<i>.
+
+    If eigenvalue_targets (kwargs of Graph.laplacian_eigenvalues) is given, the
+    targets are computed in the worker pool and eigenvalue_file_extension may be
+    None.
+
+    manifest_path caches the discovered raw files for repeated runs, see
+    job_args_list.
+    """
     raw_data_dir = data_raw_path.joinpath(raw_data_dir_name)
     output_path = data_generated_path.joinpath(output_file_name)
 
     job_args = job_args_list(raw_data_dir,
                              get_graph_id_from_path=get_graph_id_from_path,
                              graph_file_extension=graph_file_extension,
-                             eigenvalue_file_extension=eigenvalue_file_extension)
+                             eigenvalue_file_extension=eigenvalue_file_extension,
+                             manifest_path=manifest_path)
+    for arg in job_args:
+        arg['filtrations'] = filtrations
+        arg['eigenvalue_targets'] = eigenvalue_targets
 
-    progress = SimpleProgressCounter(len(job_args))
-    progress.display()
     n_cores = min(multiprocessing.cpu_count() - 1, max_cpu)
+    progress = ProgressMetrics(len(job_args), n_workers=n_cores)
+    progress.start()
 
     with h5py.File(output_path, 'w') as h5file:
 
@@ -93,27 +155,29 @@ def run(raw_data_dir_name,
                                                dtype=int,
                                                shape=(len(job_args),))
 
+        ds_n_points = create_n_points_datasets(h5file, len(job_args),
+                                               None if filtrations is None else filtration_names(filtrations))
+
         ds_read_me = h5file.create_dataset('readme', (1,), dtype=h5py.special_dtype(vlen=str))
 
         ds_read_me[0] = read_me_txt
 
         with multiprocessing.Pool(n_cores) as p:
 
-            for ret_val in p.imap_unordered(job, job_args):
+            for ret_val in ordered_imap(p, job, job_args, window=4 * n_cores):
                 index = ret_val['graph_index']
                 graph_id = ret_val['graph_id']
-                dim_0 = ret_val['dim_0']
-                dim_0_ess = ret_val['dim_0_ess']
-                dim_1_ess = ret_val['dim_1_ess']
+                dgms = ret_val['dgms']
                 eigenvalues = ret_val['eigenvalues']
 
-                grp_index = grp_data.create_group(str(index))
+                with progress.stage('write'):
+                    grp_index = grp_data.create_group(str(index))
+                    n_bytes = write_diagrams(grp_index, dgms, ds_n_points, index)
 
-                grp_index.create_dataset('dim_0', data=dim_0)
-                grp_index.create_dataset('dim_0_ess', data=dim_0_ess)
-                grp_index.create_dataset('dim_1_ess', data=dim_1_ess)
+                    ds_target[index] = eigenvalues
+                    ds_index_to_id[index] = graph_id
 
-                ds_target[index] = eigenvalues
-                ds_index_to_id[index] = graph_id
+                progress.add_stage_times(ret_val['timings'])
+                progress.trigger_progress(n_bytes=n_bytes)
 
-                progress.trigger_progress()
+    progress.finish(summary_path=str(output_path) + '.metrics.json')
@@ -1,11 +1,15 @@
 import pickle
 import multiprocessing
+import time
 import h5py
 import numpy as np
 
 from collections import defaultdict
 from pershombox import toplex_persistence_diagrams
-from .utils.gui import SimpleProgressCounter
+from .utils.filtrations import Graph, filtration_names, persistence_diagrams_of_filtrations
+from .utils.graph_store import GraphStore
+from .utils.gui import ProgressMetrics
+from .utils.writer import create_n_points_datasets, write_diagrams, ordered_imap
 
 
 def load_data(data_set_path):
@@ -47,65 +51,108 @@ def degree_filtration(simplex, vertex_degree_list):
     return max(vertex_degree_list[vertex_id] for vertex_id in simplex)
 
 
-def job_args_list(file_path):
+def convert_pickle_to_graph_store(file_path, store_dir):
+    """
+    One time conversion of a reddit pickle to a GraphStore. This is the only
+    step which loads the whole pickle.
+    """
     data = load_data(file_path)
-    job_args = []
 
-    for graph_id, graph_dict in data['graph'].items():
-         graph_id = int(graph_id)
-         job_args.append({
-                          'graph_id': graph_id,
-                          'graph_dict': graph_dict,
-                          'label': int(data['labels'][graph_id])
-                         })
+    def graphs():
+        for graph_id in sorted(data['graph'].keys(), key=int):
+            graph_dict = data['graph'][graph_id]
+            node_ids = list(graph_dict.keys())
+            neighbor_lists = [graph_dict[node_id]['neighbors'] for node_id in node_ids]
+            yield int(graph_id), int(data['labels'][graph_id]), node_ids, neighbor_lists
 
-    return job_args
+    return GraphStore.write(store_dir, graphs(), source_path=file_path)
 
 
-def job(args):
-    graph_id = args['graph_id']
-    graph_dict = args['graph_dict']
-    label = args['label']
-
-    vertices, edges, vertex_degree_list = build_graph(graph_dict)
+def job_args_iter(store_dir, filtrations=None):
+    store = GraphStore.open(store_dir)
+    for index in range(len(store)):
+        yield {'store_dir': str(store_dir),
+               'graph_index': index,
+               'filtrations': filtrations}
 
-    list_of_toplices = vertices + edges
-    filtration_values = [degree_filtration(s, vertex_degree_list) for s in list_of_toplices]
-    dgms_by_dim = toplex_persistence_diagrams(list_of_toplices, filtration_values, deessentialize=False)
 
-    dim_0 = [(b, d) for b, d in dgms_by_dim[0] if d != float('inf')]
-    dim_0_ess = [b for b, d in dgms_by_dim[0] if d == float('inf')]
-    dim_1_ess = [b for b, d in dgms_by_dim[1] if d == float('inf')]
-    max_degree = max(vertex_degree_list)
+def job(args):
+    """
+    Computes the degree filtration diagrams of the graph args['graph_index']
+    of the GraphStore args['store_dir'] or, if args['filtrations'] is given,
+    the diagrams of every filtration in it, see utils.filtrations.
+    """
+    t_start = time.perf_counter()
+    filtrations = args.get('filtrations')
+
+    store = GraphStore.open(args['store_dir'])
+    graph_id = store.graph_id(args['graph_index'])
+    label = store.label(args['graph_index'])
+    graph_dict = store.graph_dict(args['graph_index']) if filtrations is None else None
+    graph = Graph.from_csr(*store.csr(args['graph_index'])) if filtrations is not None else None
+
+    if filtrations is None:
+        vertices, edges, vertex_degree_list = build_graph(graph_dict)
+
+        list_of_toplices = vertices + edges
+        filtration_values = [degree_filtration(s, vertex_degree_list) for s in list_of_toplices]
+        dgms_by_dim = toplex_persistence_diagrams(list_of_toplices, filtration_values, deessentialize=False)
+
+        dim_0 = [(b, d) for b, d in dgms_by_dim[0] if d != float('inf')]
+        dim_0_ess = [b for b, d in dgms_by_dim[0] if d == float('inf')]
+        dim_1_ess = [b for b, d in dgms_by_dim[1] if d == float('inf')]
+        max_degree = max(vertex_degree_list)
+
+        dgms = {None: {'dim_0': np.array(dim_0, dtype=float),
+                       'dim_0_ess': np.array(dim_0_ess, dtype=float),
+                       'dim_1_ess': np.array(dim_1_ess, dtype=float)}}
+    else:
+        dgms = persistence_diagrams_of_filtrations(graph, filtrations)
+        max_degree = graph.degree.max() if graph.n_vertices > 0 else 0
 
     ret_val = {'graph_id': graph_id,
-               'dim_0': np.array(dim_0, dtype=float),
-               'dim_0_ess': np.array(dim_0_ess, dtype=float),
-               'dim_1_ess': np.array(dim_1_ess, dtype=float),
+               'dgms': dgms,
                'label': label,
-               'max_degree': float(max_degree)}
+               'max_degree': float(max_degree),
+               'timings': {'compute': time.perf_counter() - t_start}}
 
     return ret_val
 
 
-def run(raw_data_path, output_path, max_cpu=10):
+def run(raw_data_path, output_path, max_cpu=10, store_dir=None, filtrations=None):
+    """
+    The pickle at raw_data_path is converted once to a GraphStore at store_dir
+    (default raw_data_path + '.store') from which the workers read the graphs
+    lazily. The store is converted anew if the pickle changes.
 
-    job_args = job_args_list(raw_data_path)
+    If filtrations (names or (name, kwargs) pairs of utils.filtrations) is
+    given, the diagrams of each filtration are written to 'data'/<i>/<filtration>
+    instead of the degree filtration diagrams to 'data'/<i>.
+    """
+    store_dir = str(raw_data_path) + '.store' if store_dir is None else str(store_dir)
+    if not GraphStore.is_current(store_dir, raw_data_path):
+        convert_pickle_to_graph_store(raw_data_path, store_dir)
+
+    n_graphs = len(GraphStore.open(store_dir))
+    job_args = job_args_iter(store_dir, filtrations)
 
-    progress = SimpleProgressCounter(len(job_args))
-    progress.display()
     n_cores = min(multiprocessing.cpu_count() - 1, max_cpu)
+    progress = ProgressMetrics(n_graphs, n_workers=n_cores)
+    progress.start()
 
     with h5py.File(output_path, 'w') as h5file:
 
         grp_data = h5file.create_group('data')
         ds_target = h5file.create_dataset('target',
                                           dtype=int,
-                                          shape=(len(job_args),))
+                                          shape=(n_graphs,))
 
         ds_max_degree = h5file.create_dataset('max_degree',
                                              dtype=float,
-                                             shape=(len(job_args),))
+                                             shape=(n_graphs,))
+
+        ds_n_points = create_n_points_datasets(h5file, n_graphs,
+                                               None if filtrations is None else filtration_names(filtrations))
 
         ds_read_me = h5file.create_dataset('readme', (1,), dtype=h5py.special_dtype(vlen=str))
         read_me_txt = \
@@ -115,21 +162,20 @@ def run(raw_data_path, output_path, max_cpu=10):
 
         with multiprocessing.Pool(n_cores) as p:
 
-            for ret_val in p.imap_unordered(job, job_args):
+            for ret_val in ordered_imap(p, job, job_args, window=4 * n_cores):
                 graph_id = ret_val['graph_id']
-                dim_0 = ret_val['dim_0']
-                dim_0_ess = ret_val['dim_0_ess']
-                dim_1_ess = ret_val['dim_1_ess']
+                dgms = ret_val['dgms']
                 label = ret_val['label']
                 max_degree = ret_val['max_degree']
 
-                grp_index = grp_data.create_group(str(graph_id))
+                with progress.stage('write'):
+                    grp_index = grp_data.create_group(str(graph_id))
+                    n_bytes = write_diagrams(grp_index, dgms, ds_n_points, graph_id)
 
-                grp_index.create_dataset('dim_0', data=dim_0)
-                grp_index.create_dataset('dim_0_ess', data=dim_0_ess)
-                grp_index.create_dataset('dim_1_ess', data=dim_1_ess)
+                    ds_target[graph_id] = label
+                    ds_max_degree[graph_id] = max_degree
 
-                ds_target[graph_id] = label
-                ds_max_degree[graph_id] = max_degree
+                progress.add_stage_times(ret_val['timings'])
+                progress.trigger_progress(n_bytes=n_bytes)
 
-                progress.trigger_progress()
+    progress.finish(summary_path=str(output_path) + '.metrics.json')
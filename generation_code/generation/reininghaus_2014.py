@@ -1,9 +1,13 @@
+import multiprocessing
+import time
+
 import h5py
 import numpy as np
 
-from pershombox._software_backends.dipha_adapter import _PersistenceDiagramFile
 from collections import defaultdict
 from .path_config import data_raw_path, data_generated_path
+from .utils.dipha import read_persistence_diagram_file, points_of_dimension
+from .utils.gui import ProgressMetrics
 
 
 def get_meta_from_file_path(path):
@@ -14,11 +18,11 @@ def get_meta_from_file_path(path):
 
 
 def read_dgms_from_file(path):
-    with open(path, 'rb') as f:
-        points = _PersistenceDiagramFile.load_from_binary_file(f).points
+    pairs = read_persistence_diagram_file(path)
 
-    dgm_0 = [p[1:] for p in points if p[0] == 0] + [p[1:] for p in points if p[0] == -1]
-    dgm_1 = [p[1:] for p in points if p[0] == 1]
+    # essential classes of dimension 0 are appended after the others
+    dgm_0 = points_of_dimension(pairs, 0)
+    dgm_1 = points_of_dimension(pairs, 1, essential=False)
 
     return dgm_0, dgm_1
 
@@ -26,11 +30,26 @@ def read_dgms_from_file(path):
 readme = \
 """
 'data': access = <id>/<freq>/<barcode dim>
-'target': 'target'[i] = <label of 'data'[i]> 
+'target': 'target'[i] = <label of 'data'[i]>
+'id_freq': 'id_freq'[j] = (<id>, <freq>), the samples of 'data' as flat table sorted by id and freq
+'n_points': 'n_points'/<barcode dim>[j] = number of points of 'data'/<id>/<freq>/<barcode dim>
+            with (<id>, <freq>) = 'id_freq'[j]
 """
 
 
-def convert_folder_to_hdf5_file(sub_path, output_file_name):
+def job(args):
+    id, freq, file_path = args
+    t_start = time.perf_counter()
+    dim_0, dim_1 = read_dgms_from_file(file_path)
+
+    return {'id': id,
+            'freq': freq,
+            'dim_0': dim_0,
+            'dim_1': dim_1,
+            'timings': {'read': time.perf_counter() - t_start}}
+
+
+def convert_folder_to_hdf5_file(sub_path, output_file_name, max_cpu=10):
     data_path = data_raw_path.joinpath(sub_path)
     output_path = data_generated_path.joinpath(output_file_name)
 
@@ -42,21 +61,50 @@ def convert_folder_to_hdf5_file(sub_path, output_file_name):
     label_file_path = data_path.joinpath('labels.txt')
     labels = np.loadtxt(str(label_file_path))
 
+    job_args = sorted((id, freq, str(file_path))
+                      for id, files_by_freq in gathered_files_by_id_by_freq.items()
+                      for freq, file_path in files_by_freq.items())
+    id_freq = np.array([(id, freq) for id, freq, _ in job_args], dtype='i8').reshape(-1, 2)
+    row_of_id_freq = {(id, freq): row for row, (id, freq, _) in enumerate(job_args)}
+
+    n_cores = max(1, min(multiprocessing.cpu_count() - 1, max_cpu))
+    progress = ProgressMetrics(len(job_args), n_workers=n_cores, worker_stages=('read',))
+    progress.start()
+
     with h5py.File(output_path, 'w') as f:
         grp_data = f.create_group('data')
         ds_target = f.create_dataset('target', dtype='i8', shape=(len(gathered_files_by_id_by_freq),))
+        f.create_dataset('id_freq', data=id_freq)
 
-        f.attrs['readme'] = readme
+        grp_n_points = f.create_group('n_points')
+        ds_n_points = {k: grp_n_points.create_dataset(k, dtype='i8', shape=(len(job_args),))
+                       for k in ('0', '1')}
 
-        for id, files_by_freq in gathered_files_by_id_by_freq.items():
+        f.attrs['readme'] = readme
 
+        for id in gathered_files_by_id_by_freq:
             ds_target[id] = labels[id] - 1
-            grp_data_id = grp_data.create_group(str(id))
+            grp_data.create_group(str(id))
+
+        with multiprocessing.Pool(n_cores) as p:
+
+            for ret_val in p.imap_unordered(job, job_args, chunksize=16):
+                id = ret_val['id']
+                freq = ret_val['freq']
+                dim_0 = ret_val['dim_0']
+                dim_1 = ret_val['dim_1']
+
+                with progress.stage('write'):
+                    grp_data_id_freq = grp_data[str(id)].create_group(str(freq))
+
+                    grp_data_id_freq.create_dataset('0', data=dim_0)
+                    grp_data_id_freq.create_dataset('1', data=dim_1)
 
-            for freq, file_path in files_by_freq.items():
-                grp_data_id_freq = grp_data_id.create_group(str(freq))
+                    row = row_of_id_freq[(id, freq)]
+                    ds_n_points['0'][row] = len(dim_0)
+                    ds_n_points['1'][row] = len(dim_1)
 
-                dim_0, dim_1 = read_dgms_from_file(file_path)
+                progress.add_stage_times(ret_val['timings'])
+                progress.trigger_progress(n_bytes=dim_0.nbytes + dim_1.nbytes)
 
-                grp_data_id_freq.create_dataset('0', data=np.array(dim_0))
-                grp_data_id_freq.create_dataset('1', data=np.array(dim_1))
+    progress.finish(summary_path=str(output_path) + '.metrics.json')
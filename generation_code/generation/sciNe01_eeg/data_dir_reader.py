@@ -1,8 +1,8 @@
+import json
+import multiprocessing
 import numpy as np
 import h5py
-import glob
 import os
-from collections import namedtuple
 
 
 GROUP_IDS = ['control', 'patient']
@@ -57,49 +57,113 @@ def down_sample_from_1000_to_250_timestamps(data):
     return np.stack(aggregated_slices, axis=0)
 
 
+# subjects/runs are read from the file headers, every run is divided into 6 sub-runs
+N_SUB_RUNS = 6
+
+SAMPLE_DEF_DTYPE = np.dtype([('file', 'i4'),
+                             ('label', 'i1'),
+                             ('group', 'i1'),
+                             ('run', 'i2'),
+                             ('sub_run', 'i1')])
+
+
+def read_mat_header(file_path: str):
+    """
+    Returns {label: shape} of the label datasets, (n_time_stamps, n_sensors,
+    n_runs), without reading any data.
+    """
+    with h5py.File(file_path, 'r') as f:
+        return {label: list(f[label].shape) for label in LABEL_IDS if label in f}
+
+
+def _file_entry(path: str):
+    stat = os.stat(path)
+    return {'name': os.path.basename(path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
 class SciNe01DataDirReader:
     group_ids = GROUP_IDS
     label_ids = LABEL_IDS
 
-    sample_def = namedtuple('sample_def', ('file_path', 'subject_id', 'label', 'group', 'run', 'sub_run'))
-
     def __init__(self, data_dir: str,
                  omit_sub_run_0=True,
-                 down_sample_higher_resolution_samples=True):
+                 down_sample_higher_resolution_samples=True,
+                 manifest_path=None,
+                 n_workers: int = None):
+        """
+        The .mat headers of all files are read once (by n_workers processes)
+        and, if manifest_path is given, cached there as json. Only files which
+        were added or changed since are read again.
+        """
         self.down_sample_higher_resolution_samples = down_sample_higher_resolution_samples
         self.data_dir = str(data_dir)
         assert os.path.isdir(self.data_dir)
         self.omit_sub_run_0 = omit_sub_run_0
 
-        self._sample_defs = self._init_list_of_sample_defs()
-
-    def _init_list_of_sample_defs(self):
-        list_of_sample_defs = []
-
-        file_paths_metas = glob.glob(os.path.join(self.data_dir, '*.mat'))
-        file_paths_metas = [(os.path.normpath(p),
-                       self._meta_info_from_file_path(p)) for p in file_paths_metas]
-        sorted(file_paths_metas, key=lambda x: x[1]['subject_id'])
-
-        for path, meta in file_paths_metas:
-
-            subject_id = meta['subject_id']
-            group = meta['group']
-
-            # one subject has many runs with different labels ...
-            for label in self.label_ids:
-
-                # ... one subject has per label 25 runs ...
-                for run in range(25):
-
-                    # ... divided into 6 sub-runs
-                    for sub_run in range(6):
-                        if self.omit_sub_run_0 and sub_run == 0:
-                            continue
-
-                        list_of_sample_defs.append(self.sample_def(path, subject_id, label, group, run, sub_run))
-
-        return list_of_sample_defs
+        self.files = self._load_or_read_headers(manifest_path, n_workers)
+        self.file_paths = [os.path.normpath(os.path.join(self.data_dir, f['name'])) for f in self.files]
+        self._sample_defs = self._init_sample_defs()
+
+    def _load_or_read_headers(self, manifest_path, n_workers):
+        cached = {}
+        if manifest_path is not None and os.path.isfile(str(manifest_path)):
+            with open(str(manifest_path), 'r') as f:
+                manifest = json.load(f)
+            if manifest['dir_path'] == os.path.abspath(self.data_dir):
+                cached = {(e['name'], e['size'], e['mtime_ns']): e for e in manifest['files']}
+
+        files = []
+        with os.scandir(self.data_dir) as it:
+            for entry in it:
+                meta = self._meta_info_from_file_path(entry.name)
+                if entry.name.endswith('.mat') and entry.is_file() and len(meta) > 0:
+                    files.append(dict(_file_entry(entry.path), **meta))
+
+        to_read = [f for f in files if (f['name'], f['size'], f['mtime_ns']) not in cached]
+        paths = [os.path.join(self.data_dir, f['name']) for f in to_read]
+        n_workers = min(multiprocessing.cpu_count(), 10) if n_workers is None else n_workers
+        if n_workers > 1 and len(paths) > 1:
+            with multiprocessing.Pool(min(n_workers, len(paths))) as p:
+                headers = p.map(read_mat_header, paths)
+        else:
+            headers = [read_mat_header(path) for path in paths]
+
+        for f, header in zip(to_read, headers):
+            f['shapes'] = header
+        for f in files:
+            if 'shapes' not in f:
+                f['shapes'] = cached[(f['name'], f['size'], f['mtime_ns'])]['shapes']
+
+        # the samples of a subject are consecutive, see subject_index_ranges
+        files = sorted(files, key=lambda f: (f['subject_id'], f['name']))
+
+        if manifest_path is not None and (len(to_read) > 0 or len(cached) != len(files)):
+            tmp_path = str(manifest_path) + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump({'dir_path': os.path.abspath(self.data_dir), 'files': files}, f)
+            os.replace(tmp_path, str(manifest_path))
+
+        return files
+
+    def _init_sample_defs(self):
+        first_sub_run = 1 if self.omit_sub_run_0 else 0
+        sub_runs = np.arange(first_sub_run, N_SUB_RUNS)
+
+        # one subject (file) has per label n_runs runs divided into sub-runs
+        blocks = [np.zeros(0, dtype=SAMPLE_DEF_DTYPE)]
+        for i_file, f in enumerate(self.files):
+            for i_label, label in enumerate(self.label_ids):
+                n_runs = f['shapes'][label][2] if label in f['shapes'] else 0
+
+                block = np.zeros(n_runs * len(sub_runs), dtype=SAMPLE_DEF_DTYPE)
+                block['file'] = i_file
+                block['label'] = i_label
+                block['group'] = int_group_from_str_group(f['group'])
+                block['run'] = np.repeat(np.arange(n_runs), len(sub_runs))
+                block['sub_run'] = np.tile(sub_runs, n_runs)
+                blocks.append(block)
+
+        return np.concatenate(blocks)
 
     def _meta_info_from_file_path(self, file_name: str):
         name = os.path.basename(file_name)
@@ -112,35 +176,65 @@ class SciNe01DataDirReader:
 
         return meta
 
+    @property
+    def sample_defs(self):
+        """
+        Structured array with the fields file (index of file_paths), label,
+        group, run and sub_run of every sample.
+        """
+        return self._sample_defs
+
+    @property
+    def subject_names(self):
+        # one file per subject
+        return [f['subject_id'] for f in self.files]
+
     @property
     def labels(self):
-        labels = [self._sample_defs[i].label for i in range(len(self))]
-        return labels
+        return np.array(self.label_ids)[self._sample_defs['label']].tolist()
+
+    @property
+    def subject_ids(self):
+        return np.array(self.subject_names)[self._sample_defs['file']].tolist()
+
+    @property
+    def subject_index_ranges(self):
+        """
+        Returns [(subject_id, start, stop), ...] such that the samples
+        start, ..., stop - 1 belong to subject_id.
+        """
+        subject = self._sample_defs['file']
+        if len(subject) == 0:
+            return []
+        starts = np.flatnonzero(np.concatenate([[True], subject[1:] != subject[:-1]]))
+        stops = np.concatenate([starts[1:], [len(subject)]])
+        names = self.subject_names
+        return [(names[subject[start]], int(start), int(stop)) for start, stop in zip(starts, stops)]
 
     def __len__(self):
         return len(self._sample_defs)
 
     def __getitem__(self, key):
         sample_def = self._sample_defs[key]
-
-        file_path = sample_def.file_path
-        f = h5py.File(file_path, 'r')
-
-        data = f[sample_def.label].value
-        data = data[:, :, sample_def.run]
-
-        n_time_stamps = data.shape[0]
-        sub_run_length = int(n_time_stamps / 6)
-        s = slice(sub_run_length * sample_def.sub_run, sub_run_length * (sample_def.sub_run + 1))
-
-        x = data[s, :]
+        file_path = self.file_paths[sample_def['file']]
+        subject_id = self.files[sample_def['file']]['subject_id']
+        label = self.label_ids[sample_def['label']]
+        run = int(sample_def['run'])
+        sub_run = int(sample_def['sub_run'])
+
+        with h5py.File(file_path, 'r') as f:
+            # only the run is read
+            ds = f[label]
+            n_time_stamps = ds.shape[0]
+            sub_run_length = int(n_time_stamps / N_SUB_RUNS)
+            x = ds[sub_run_length * sub_run:sub_run_length * (sub_run + 1), :, run]
 
         meta = {
-            'subject_id': sample_def.subject_id,
-            'group': sample_def.group,
-            'label': sample_def.label,
-            'run': sample_def.run,
-            'sub_run': sample_def.sub_run
+            'subject_id': subject_id,
+            'group': self.group_ids[sample_def['group']],
+            'label': label,
+            'run': run,
+            'sub_run': sub_run
             }
 
         assert x.shape[0] == 250 or x.shape[0] == 1000
@@ -148,3 +242,23 @@ class SciNe01DataDirReader:
             x = down_sample_from_1000_to_250_timestamps(x)
 
         return x, meta
+
+
+def write_subject_datasets(h5file, data_reader: SciNe01DataDirReader):
+    """
+    Writes 'subject'[i] = subject of 'data'[i] as int, 'subject_int_2_str' and
+    'subject_index_range'[s] = (start, stop) of the samples of subject s.
+    """
+    ranges = data_reader.subject_index_ranges
+    subject_int = {subject_id: s_int for s_int, (subject_id, _, _) in enumerate(ranges)}
+    assert len(subject_int) == len(ranges), 'samples of a subject are not consecutive'
+
+    h5file.create_dataset('subject', data=np.array([subject_int[s] for s in data_reader.subject_ids], dtype='i8'))
+    h5file.create_dataset('subject_index_range', data=np.array([(start, stop) for _, start, stop in ranges],
+                                                                dtype='i8').reshape(-1, 2))
+
+    ds_int_to_str_subject = h5file.create_dataset('subject_int_2_str',
+                                                  (len(ranges),),
+                                                  dtype=h5py.special_dtype(vlen=str))
+    for s_int, (subject_id, _, _) in enumerate(ranges):
+        ds_int_to_str_subject[s_int] = subject_id
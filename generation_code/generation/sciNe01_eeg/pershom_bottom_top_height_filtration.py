@@ -1,4 +1,5 @@
 import multiprocessing
+import time
 
 import h5py
 import numpy
@@ -9,10 +10,12 @@ from collections import defaultdict
 from .data_dir_reader import SciNe01DataDirReader, \
     int_group_from_str_group, \
     int_label_from_str_label, \
+    write_subject_datasets, \
     LABEL_IDS, \
     GROUP_IDS
 from ..path_config import data_raw_path, data_generated_path
-from ..utils.gui import SimpleProgressCounter
+from ..utils.gui import ProgressMetrics
+from ..utils.writer import ordered_imap
 from .data_dir_reader import SENSOR_CONFIGURATIONS
 
 
@@ -52,6 +55,7 @@ def pershom_of_timeseries(timeseries, filtration):
 
 def job(args):
     index, data, meta = args
+    t_start = time.perf_counter()
     dgms = defaultdict(list)
     for i_sensor in range(data.shape[1]):
         signal = data[:, i_sensor]
@@ -62,29 +66,38 @@ def job(args):
 
     return {'index': index,
             'dgms': dgms,
-            'meta': meta}
+            'meta': meta,
+            'timings': {'compute': time.perf_counter() - t_start}}
 
 
-def job_arg_iter(data_reader):
+def job_arg_iter(data_reader, progress=None):
     assert isinstance(data_reader, SciNe01DataDirReader)
     for index in range(len(data_reader)):
+        t_start = time.perf_counter()
         x, meta = data_reader[index]
+        if progress is not None:
+            progress.add_stage_time('read', time.perf_counter() - t_start)
         yield index, x, meta
 
 
 read_me_txt = \
-"""'data': access <index>/<filtration>/<sensor> \n'target': target[i] = label of 'data'[i]"""
+"""'data': access <index>/<filtration>/<sensor> \n'target': target[i] = label of 'data'[i] \n'subject': subject[i] = subject of 'data'[i], the samples are sorted by subject \n'subject_index_range': subject_index_range[s] = (start, stop) of the samples of subject s"""
 
 
-def run():
+def run(manifest_path=None):
+    """
+    manifest_path caches the headers of the raw .mat files for repeated runs,
+    see SciNe01DataDirReader.
+    """
     raw_data_dir = data_raw_path.joinpath('sciNe01_eeg')
     output_dir = data_generated_path.joinpath('sciNe01_eeg_pershom_bottom_top_filtration.h5')
 
-    data_reader = SciNe01DataDirReader(raw_data_dir)
+    data_reader = SciNe01DataDirReader(raw_data_dir, manifest_path=manifest_path)
 
-    progress = SimpleProgressCounter(len(data_reader))
-    progress.display()
     n_cores = min(multiprocessing.cpu_count() - 1, 10)
+    # samples are read in the parent, so only compute runs in the workers
+    progress = ProgressMetrics(len(data_reader), n_workers=n_cores, worker_stages=('compute',))
+    progress.start()
 
     with h5py.File(output_dir, 'w') as h5file:
 
@@ -105,6 +118,12 @@ def run():
                                            dtype='i8',
                                            shape=(len(data_reader),))
 
+        # n_points/<filtration>[i, sensor] = number of points in 'data'[i]/<filtration>/<sensor>
+        grp_n_points = h5file.create_group('n_points')
+        n_sensors = len(SENSOR_CONFIGURATIONS['all'])
+        ds_n_points = {k: grp_n_points.create_dataset(k, dtype='i8', shape=(len(data_reader), n_sensors))
+                       for k in ('top', 'bottom')}
+
         grp_sensor_cfg = h5file.create_group('sensor_configurations')
         for k, v in SENSOR_CONFIGURATIONS.items():
             grp_sensor_cfg.create_dataset(k, data=v, dtype='i8')
@@ -121,27 +140,38 @@ def run():
         for g_int, g_str in enumerate(GROUP_IDS):
             ds_int_to_str_group[g_int] = g_str
 
+        write_subject_datasets(h5file, data_reader)
+
         h5file.attrs['readme'] = read_me_txt
 
         with multiprocessing.Pool(n_cores) as p:
 
-            for ret_val in p.imap_unordered(job, job_arg_iter(data_reader)):
+            # the reader order is kept, hence the samples of a subject are written one after another
+            for ret_val in ordered_imap(p, job, job_arg_iter(data_reader, progress), window=4 * n_cores):
                 index = ret_val['index']
                 dgms = ret_val['dgms']
                 meta = ret_val['meta']
 
-                ds_target[index] = int_label_from_str_label(meta['label'])
-                ds_group[index] = int_group_from_str_group((meta['group']))
-                ds_run[index] = meta['run']
-                ds_sub_run[index] = meta['sub_run']
+                n_bytes = 0
+                with progress.stage('write'):
+                    ds_target[index] = int_label_from_str_label(meta['label'])
+                    ds_group[index] = int_group_from_str_group((meta['group']))
+                    ds_run[index] = meta['run']
+                    ds_sub_run[index] = meta['sub_run']
+
+                    grp_index = grp_data.create_group(str(index))
+
+                    for filt_name, dgm_list in dgms.items():
+                        grp_id_filt = grp_index.create_group(filt_name)
 
-                grp_index = grp_data.create_group(str(index))
+                        for i_sensor, dgm in enumerate(dgm_list):
+                            dgm = np.array(dgm, dtype=np.float32)
+                            grp_id_filt.create_dataset(str(i_sensor), data=dgm)
+                            n_bytes += dgm.nbytes
 
-                for filt_name, dgm_list in dgms.items():
-                    grp_id_filt = grp_index.create_group(filt_name)
+                        ds_n_points[filt_name][index] = [len(dgm) for dgm in dgm_list]
 
-                    for i_sensor, dgm in enumerate(dgm_list):
-                        dgm = np.array(dgm, dtype=np.float32)
-                        grp_id_filt.create_dataset(str(i_sensor), data=dgm)
+                progress.add_stage_times(ret_val['timings'])
+                progress.trigger_progress(n_bytes=n_bytes)
 
-                progress.trigger_progress()
+    progress.finish(summary_path=str(output_dir) + '.metrics.json')
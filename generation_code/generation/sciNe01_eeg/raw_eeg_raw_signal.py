@@ -6,10 +6,11 @@ import numpy as np
 from .data_dir_reader import SciNe01DataDirReader, \
     int_group_from_str_group, \
     int_label_from_str_label, \
+    write_subject_datasets, \
     LABEL_IDS, \
     GROUP_IDS
 from ..path_config import data_raw_path, data_generated_path
-from ..utils.gui import SimpleProgressCounter
+from ..utils.gui import ProgressMetrics
 from .data_dir_reader import SENSOR_CONFIGURATIONS
 
 # def job(args):
@@ -35,17 +36,21 @@ from .data_dir_reader import SENSOR_CONFIGURATIONS
 
 
 read_me_txt = \
-"""'data': access <index>/<sensor> \n'target': target[i] = label of 'data'[i]"""
+"""'data': access <index>/<sensor> \n'target': target[i] = label of 'data'[i] \n'subject': subject[i] = subject of 'data'[i], the samples are sorted by subject \n'subject_index_range': subject_index_range[s] = (start, stop) of the samples of subject s"""
 
 
-def run():
+def run(manifest_path=None):
+    """
+    manifest_path caches the headers of the raw .mat files for repeated runs,
+    see SciNe01DataDirReader.
+    """
     raw_data_dir = data_raw_path.joinpath('sciNe01_eeg')
     output_dir = data_generated_path.joinpath('sciNe01_eeg_raw_signal.h5')
 
-    data_reader = SciNe01DataDirReader(raw_data_dir)
+    data_reader = SciNe01DataDirReader(raw_data_dir, manifest_path=manifest_path)
 
-    progress = SimpleProgressCounter(len(data_reader))
-    progress.display()
+    progress = ProgressMetrics(len(data_reader), worker_stages=('read', 'write'))
+    progress.start()
 
     with h5py.File(output_dir, 'w') as h5file:
 
@@ -82,23 +87,29 @@ def run():
         for g_int, g_str in enumerate(GROUP_IDS):
             ds_int_to_str_group[g_int] = g_str
 
+        write_subject_datasets(h5file, data_reader)
+
         h5file.attrs['readme'] = read_me_txt
 
         # with multiprocessing.Pool(n_cores) as p:
 
         for index in range(len(data_reader)):
-            x, meta = data_reader[index]
+            with progress.stage('read'):
+                x, meta = data_reader[index]
+
+            with progress.stage('write'):
+                ds_target[index] = int_label_from_str_label(meta['label'])
+                ds_group[index] = int_group_from_str_group((meta['group']))
+                ds_run[index] = meta['run']
+                ds_sub_run[index] = meta['sub_run']
 
-            ds_target[index] = int_label_from_str_label(meta['label'])
-            ds_group[index] = int_group_from_str_group((meta['group']))
-            ds_run[index] = meta['run']
-            ds_sub_run[index] = meta['sub_run']
+                grp_index = grp_data.create_group(str(index))
 
-            grp_index = grp_data.create_group(str(index))
+                for i_sensor in range(x.shape[1]):
+                    signal = x[:, i_sensor]
+                    signal = np.array(signal, dtype=np.float32)
+                    grp_index.create_dataset(str(i_sensor), data=signal)
 
-            for i_sensor in range(x.shape[1]):
-                signal = x[:, i_sensor]
-                signal = np.array(signal, dtype=np.float32)
-                grp_index.create_dataset(str(i_sensor), data=signal)
+            progress.trigger_progress(n_bytes=x.shape[0] * x.shape[1] * np.dtype(np.float32).itemsize)
 
-            progress.trigger_progress()
+    progress.finish(summary_path=str(output_dir) + '.metrics.json')
@@ -0,0 +1,70 @@
+"""
+Reader for DIPHA persistence diagram files.
+
+Layout (little endian):
+
+    int64   magic number, 8067171840
+    int64   file type, 2 for persistence diagrams
+    int64   number of pairs n
+    n times (int64 dim, float64 birth, float64 death)
+
+Essential classes of dimension d are stored with dimension -d - 1.
+"""
+import numpy as np
+
+
+DIPHA_MAGIC_NUMBER = 8067171840
+DIPHA_PERSISTENCE_DIAGRAM = 2
+
+HEADER_DTYPE = np.dtype('<i8')
+HEADER_SIZE = 3 * HEADER_DTYPE.itemsize
+PAIR_DTYPE = np.dtype([('dim', '<i8'), ('birth', '<f8'), ('death', '<f8')])
+
+
+class DiphaFileError(Exception):
+    pass
+
+
+def read_persistence_diagram_file(path, mmap=False):
+    """
+    Returns the pairs of the file as structured array with fields dim, birth
+    and death. If mmap is True the pairs are memory mapped instead of read.
+    """
+    path = str(path)
+    with open(path, 'rb') as f:
+        header = np.fromfile(f, dtype=HEADER_DTYPE, count=3)
+
+        if len(header) < 3 or header[0] != DIPHA_MAGIC_NUMBER:
+            raise DiphaFileError('{} is not a DIPHA file.'.format(path))
+
+        if header[1] != DIPHA_PERSISTENCE_DIAGRAM:
+            raise DiphaFileError('{} is not a DIPHA persistence diagram file.'.format(path))
+
+        n_pairs = int(header[2])
+
+        if mmap:
+            pairs = np.memmap(path, dtype=PAIR_DTYPE, mode='r', offset=HEADER_SIZE, shape=(n_pairs,))
+        else:
+            pairs = np.fromfile(f, dtype=PAIR_DTYPE, count=n_pairs)
+
+    if len(pairs) != n_pairs:
+        raise DiphaFileError('{} is truncated, expected {} pairs got {}.'.format(path, n_pairs, len(pairs)))
+
+    return pairs
+
+
+def points_of_dimension(pairs, dim: int, essential: bool = None):
+    """
+    Returns the (birth, death) points of dimension dim as (n, 2) array. If
+    essential is None both, the non essential and the essential points are
+    returned (in this order).
+    """
+    if essential is None:
+        mask = (pairs['dim'] == dim) | (pairs['dim'] == -dim - 1)
+        # the stable sort puts the non essential points first and keeps the file order otherwise
+        selected = pairs[mask]
+        selected = selected[np.argsort(selected['dim'] < 0, kind='stable')]
+    else:
+        selected = pairs[pairs['dim'] == (-dim - 1 if essential else dim)]
+
+    return np.stack([selected['birth'], selected['death']], axis=1)
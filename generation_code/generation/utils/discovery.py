@@ -0,0 +1,104 @@
+"""
+Discovery of per sample raw files which belong together by an id, e.g.,
+<id>.metis and <id>.eigenvalues. The directory is listed once by os.scandir
+instead of once per glob and the result can be cached as manifest, which pays
+off on network file systems where listing 100k files takes minutes.
+"""
+import json
+import os
+
+from collections import defaultdict
+from pathlib import Path
+
+
+class DiscoveryError(Exception):
+    pass
+
+
+def scan_files_by_extension(dir_path, extensions):
+    """
+    Returns {extension: [file names]} of the files in dir_path with one of the
+    given extensions (without dot), in one pass over the directory.
+    """
+    extensions = set(extensions)
+    names_by_extension = {ext: [] for ext in extensions}
+    with os.scandir(str(dir_path)) as it:
+        for entry in it:
+            ext = entry.name.rpartition('.')[2]
+            if ext in extensions and entry.is_file():
+                names_by_extension[ext].append(entry.name)
+
+    return names_by_extension
+
+
+def _mismatch_message(dir_path, missing, duplicates, max_listed=20):
+    lines = ['Raw files in {} do not match:'.format(dir_path)]
+    for (id, kind), names in sorted(duplicates.items(), key=str)[:max_listed]:
+        lines.append('  id {}: several {} files {}'.format(id, kind, names))
+    for id, kind in sorted(missing, key=str)[:max_listed]:
+        lines.append('  id {}: no {} file'.format(id, kind))
+    n_problems = len(duplicates) + len(missing)
+    if n_problems > 2 * max_listed:
+        lines.append('  ... {} problems in total'.format(n_problems))
+    return '\n'.join(lines)
+
+
+def discover_files_by_id(dir_path, id_from_path, extensions_by_kind: dict):
+    """
+    extensions_by_kind: e.g. {'graph': 'metis', 'eigenvalues': 'eigenvalues'}.
+    id_from_path: maps the path (pathlib.Path) of a file to its id.
+
+    Returns {id: {kind: file name}}. Raises DiscoveryError listing all ids for
+    which a kind is missing or occurs several times.
+    """
+    dir_path = Path(dir_path)
+    kind_of_extension = {ext: kind for kind, ext in extensions_by_kind.items()}
+    names_by_extension = scan_files_by_extension(dir_path, kind_of_extension)
+
+    names_by_id_kind = defaultdict(list)
+    for ext, names in names_by_extension.items():
+        for name in names:
+            names_by_id_kind[(id_from_path(dir_path.joinpath(name)), kind_of_extension[ext])].append(name)
+
+    ids = {id for id, _ in names_by_id_kind}
+    missing = [(id, kind) for id in ids for kind in extensions_by_kind if (id, kind) not in names_by_id_kind]
+    duplicates = {k: v for k, v in names_by_id_kind.items() if len(v) > 1}
+    if len(missing) > 0 or len(duplicates) > 0:
+        raise DiscoveryError(_mismatch_message(dir_path, missing, duplicates))
+
+    files_by_id = defaultdict(dict)
+    for (id, kind), names in names_by_id_kind.items():
+        files_by_id[id][kind] = names[0]
+
+    return dict(files_by_id)
+
+
+def load_or_discover_files_by_id(dir_path, id_from_path, extensions_by_kind: dict, manifest_path=None):
+    """
+    Like discover_files_by_id but, if manifest_path is given, the result is
+    read from this json file as long as it was written for the same directory
+    and extensions and the directory was not modified since (its mtime
+    changes if files are added, removed or renamed). Otherwise the directory is
+    scanned and the manifest (re)written.
+    """
+    dir_path = str(dir_path)
+    key = {'dir_path': os.path.abspath(dir_path),
+           'dir_mtime_ns': os.stat(dir_path).st_mtime_ns,
+           'extensions_by_kind': extensions_by_kind}
+
+    if manifest_path is not None and os.path.isfile(str(manifest_path)):
+        with open(str(manifest_path), 'r') as f:
+            manifest = json.load(f)
+        if manifest['key'] == key:
+            # json keys are strings, the ids are restored from the entries
+            return {id: files for id, files in manifest['files_by_id']}
+
+    files_by_id = discover_files_by_id(dir_path, id_from_path, extensions_by_kind)
+
+    if manifest_path is not None:
+        tmp_path = str(manifest_path) + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'key': key, 'files_by_id': list(files_by_id.items())}, f)
+        os.replace(tmp_path, str(manifest_path))
+
+    return files_by_id
@@ -0,0 +1,219 @@
+"""
+Registry of graph filtrations. A filtration is a function
+
+    filtration(graph: Graph, **kwargs) -> (vertex_values, edge_values)
+
+where vertex_values[i] is the value of vertex i and edge_values[j] the value of
+graph.edges[j]. Edge values must not be smaller than the values of their
+vertices. Intermediate results (adjacency, degrees, spectrum, ...) are cached
+on the Graph such that several filtrations of the same graph share them.
+
+A name may be suffixed with ':superlevel' to get the superlevel set filtration
+of the negated function.
+"""
+import numpy as np
+import scipy.sparse as sp
+
+from scipy.sparse.csgraph import laplacian, shortest_path
+from scipy.sparse.linalg import eigsh, expm_multiply
+
+
+FILTRATIONS = {}
+SUPERLEVEL_SUFFIX = ':superlevel'
+
+
+def register_filtration(name):
+    def register(fn):
+        FILTRATIONS[name] = fn
+        return fn
+    return register
+
+
+class Graph:
+    def __init__(self, n_vertices: int, edges):
+        """
+        edges: (m, 2) array of vertex indices in 0..n_vertices-1, with u < v and
+        without duplicates.
+        """
+        self.n_vertices = int(n_vertices)
+        self.edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+        self._cache = {}
+
+    @classmethod
+    def from_edge_list(cls, n_vertices, edges):
+        edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+        edges = np.sort(edges, axis=1)
+        edges = edges[edges[:, 0] != edges[:, 1]]
+        return cls(n_vertices, np.unique(edges, axis=0))
+
+    @classmethod
+    def from_csr(cls, node_ids, indptr, indices):
+        """
+        Builds the graph from the (possibly asymmetric) neighbor lists of a
+        GraphStore, node_ids are mapped to 0..n-1.
+        """
+        node_ids = np.asarray(node_ids)
+        sorter = np.argsort(node_ids)
+        rows = np.repeat(np.arange(len(node_ids)), np.diff(indptr))
+        cols = sorter[np.searchsorted(node_ids, indices, sorter=sorter)]
+        return cls.from_edge_list(len(node_ids), np.stack([rows, cols], axis=1))
+
+    def cached(self, key, fn):
+        if key not in self._cache:
+            self._cache[key] = fn()
+        return self._cache[key]
+
+    @property
+    def adjacency(self) -> sp.csr_matrix:
+        def build():
+            u, v = self.edges[:, 0], self.edges[:, 1]
+            data = np.ones(2 * len(u))
+            return sp.csr_matrix((data, (np.concatenate([u, v]), np.concatenate([v, u]))),
+                                 shape=(self.n_vertices, self.n_vertices))
+        return self.cached('adjacency', build)
+
+    @property
+    def degree(self):
+        return self.cached('degree', lambda: np.asarray(self.adjacency.sum(axis=1)).ravel())
+
+    @property
+    def toplices(self):
+        return self.cached('toplices',
+                           lambda: [(i,) for i in range(self.n_vertices)] + [tuple(e) for e in self.edges.tolist()])
+
+    def edge_max(self, vertex_values):
+        if len(self.edges) == 0:
+            return np.zeros(0)
+        return np.maximum(vertex_values[self.edges[:, 0]], vertex_values[self.edges[:, 1]])
+
+    def laplacian_eigenvalues(self, k: int, which: str = 'smallest', normed=False):
+        """
+        Returns the k smallest or largest eigenvalues of the sparse graph
+        Laplacian in ascending order. Small graphs are solved densely.
+        """
+        assert which in ('smallest', 'largest')
+
+        def compute():
+            n = self.n_vertices
+            if n <= max(2 * k, 64):
+                eigenvalues = np.linalg.eigvalsh(laplacian(self.adjacency, normed=normed).toarray())
+                return eigenvalues[:k] if which == 'smallest' else eigenvalues[max(n - k, 0):]
+
+            L = laplacian(self.adjacency.astype(float), normed=normed).tocsc()
+            if which == 'smallest':
+                # L is positive semidefinite, shift-invert around a point slightly below 0
+                eigenvalues = eigsh(L, k=k, sigma=-1e-3, which='LM', return_eigenvectors=False)
+            else:
+                eigenvalues = eigsh(L, k=k, which='LA', return_eigenvectors=False)
+            return np.sort(eigenvalues)
+
+        return self.cached(('laplacian_eigenvalues', k, which, normed), compute)
+
+
+@register_filtration('degree')
+def degree_filtration(graph: Graph):
+    vertex_values = graph.degree
+    return vertex_values, graph.edge_max(vertex_values)
+
+
+@register_filtration('jaccard')
+def jaccard_filtration(graph: Graph):
+    """
+    Edges are weighted by their Jaccard distance 1 - |N(u) & N(v)| / |N(u) | N(v)|,
+    vertices enter with their cheapest edge.
+    """
+    if len(graph.edges) == 0:
+        return np.zeros(graph.n_vertices), np.zeros(0)
+
+    u, v = graph.edges[:, 0], graph.edges[:, 1]
+    common = graph.cached('common_neighbors',
+                          lambda: np.asarray((graph.adjacency @ graph.adjacency)[u, v]).ravel())
+    union = graph.degree[u] + graph.degree[v] - common
+    edge_values = 1. - common / np.maximum(union, 1)
+
+    vertex_values = np.full(graph.n_vertices, np.inf)
+    np.minimum.at(vertex_values, u, edge_values)
+    np.minimum.at(vertex_values, v, edge_values)
+    vertex_values[np.isinf(vertex_values)] = 0.
+
+    return vertex_values, edge_values
+
+
+@register_filtration('heat_kernel_signature')
+def heat_kernel_signature_filtration(graph: Graph, t: float = 1.0, block_size: int = 256):
+    """
+    Heat kernel signature, the diagonal of exp(-t * L) of the normalized
+    Laplacian L. It is computed exactly from the sparse L by applying the
+    exponential to block_size unit vectors at a time, without densifying L or
+    its spectrum.
+    """
+    n = graph.n_vertices
+    L = laplacian(graph.adjacency.astype(float), normed=True).tocsc()
+    vertex_values = np.zeros(n)
+    for start in range(0, n, block_size):
+        sources = np.arange(start, min(start + block_size, n))
+        unit_vectors = np.zeros((n, len(sources)))
+        unit_vectors[sources, np.arange(len(sources))] = 1.
+        vertex_values[sources] = expm_multiply(-t * L, unit_vectors)[sources, np.arange(len(sources))]
+
+    return vertex_values, graph.edge_max(vertex_values)
+
+
+@register_filtration('closeness')
+def closeness_filtration(graph: Graph, block_size: int = 256):
+    """
+    Closeness centrality within the connected component of the vertex. The
+    distances are found by breadth first searches from block_size vertices at
+    a time, which needs O(block_size * n_vertices) memory instead of the full
+    distance matrix.
+    """
+    n = graph.n_vertices
+    vertex_values = np.zeros(n)
+    for start in range(0, n, block_size):
+        sources = np.arange(start, min(start + block_size, n))
+        distances = shortest_path(graph.adjacency, unweighted=True, indices=sources).reshape(len(sources), n)
+        reachable = np.isfinite(distances)
+        n_reachable = reachable.sum(axis=1) - 1
+        total = np.where(reachable, distances, 0).sum(axis=1)
+        vertex_values[sources] = np.where(total > 0, n_reachable / np.maximum(total, 1), 0.)
+
+    return vertex_values, graph.edge_max(vertex_values)
+
+
+def compute_filtration(graph: Graph, name: str, **kwargs):
+    if name.endswith(SUPERLEVEL_SUFFIX):
+        vertex_values, edge_values = FILTRATIONS[name[:-len(SUPERLEVEL_SUFFIX)]](graph, **kwargs)
+        vertex_values = -vertex_values
+        # negated edges may enter before their vertices, so they are lifted
+        return vertex_values, np.maximum(-edge_values, graph.edge_max(vertex_values))
+
+    return FILTRATIONS[name](graph, **kwargs)
+
+
+def filtration_names(filtrations):
+    return [f if isinstance(f, str) else f[0] for f in filtrations]
+
+
+def persistence_diagrams_of_filtrations(graph: Graph, filtrations):
+    """
+    filtrations: names or (name, kwargs) pairs. Returns for every filtration a
+    dict with the keys 'dim_0', 'dim_0_ess' and 'dim_1_ess', as written by the
+    graph generators.
+    """
+    from pershombox import toplex_persistence_diagrams
+
+    dgms = {}
+    for filtration in filtrations:
+        name, kwargs = (filtration, {}) if isinstance(filtration, str) else filtration
+        vertex_values, edge_values = compute_filtration(graph, name, **kwargs)
+        filtration_values = np.concatenate([vertex_values, edge_values]).tolist()
+
+        dgms_by_dim = toplex_persistence_diagrams(graph.toplices, filtration_values, deessentialize=False)
+        dgm_0 = np.array(dgms_by_dim[0], dtype=float).reshape(-1, 2)
+        dgm_1 = np.array(dgms_by_dim[1], dtype=float).reshape(-1, 2) if len(dgms_by_dim) > 1 else np.zeros((0, 2))
+
+        dgms[name] = {'dim_0': dgm_0[np.isfinite(dgm_0[:, 1])],
+                      'dim_0_ess': dgm_0[np.isinf(dgm_0[:, 1]), 0],
+                      'dim_1_ess': dgm_1[np.isinf(dgm_1[:, 1]), 0]}
+
+    return dgms
@@ -1,3 +1,5 @@
+import numpy as np
+
 from collections import defaultdict
 
 
@@ -35,4 +37,40 @@ def read_graph_from_metis_file(file_path):
 
     degree = [degree[i] for i in range(len(degree))]
 
-    return vertices, list(edges), degree
\ No newline at end of file
+    return vertices, list(edges), degree
+
+
+def read_csr_from_metis_file(file_path):
+    """
+    Reads the neighbor lists of a METIS graph file in bulk. Returns
+    (n_vertices, indptr, indices) where indices[indptr[k]:indptr[k + 1]] are
+    the neighbor ids of vertex k as written in the file.
+    """
+    with open(file_path, 'r') as f:
+        header = f.readline().split()
+        n_vertices, n_edges = int(header[0]), int(header[1])
+        lines = f.read().splitlines()
+
+    # blank lines at the end of the file beyond the last vertex
+    while len(lines) > n_vertices and lines[-1].strip() == '':
+        lines.pop()
+    assert len(lines) == n_vertices
+
+    degrees = np.fromiter((len(line.split()) for line in lines), dtype=np.int64, count=n_vertices)
+    indptr = np.zeros(n_vertices + 1, dtype=np.int64)
+    np.cumsum(degrees, out=indptr[1:])
+    indices = np.array(' '.join(lines).split(), dtype=np.int64)
+    assert len(indices) == indptr[-1]
+    # every edge is listed by both of its vertices
+    assert indptr[-1] == 2 * n_edges
+
+    return n_vertices, indptr, indices
+
+
+def read_eigenvalue_file(file_path):
+    """
+    Reads whitespace separated floats, much faster than np.loadtxt. Raises
+    ValueError on a token which is not a float.
+    """
+    with open(str(file_path), 'r') as f:
+        return np.array(f.read().split(), dtype=float)
@@ -0,0 +1,170 @@
+"""
+On disk store of many small graphs as CSR arrays, i.e., for the vertices of all
+graphs concatenated
+
+    node_ids[k]                        id of vertex k in its graph
+    indices[indptr[k]:indptr[k + 1]]   ids of the neighbors of vertex k
+
+and per graph g
+
+    graph_offsets[g]:graph_offsets[g + 1]   vertices of graph g
+    graph_ids[g], labels[g]
+
+Every array is a .npy file in the store directory and is memory mapped on
+first access, hence opening a store costs nothing and reading a graph touches
+only its slices. source.json records size and mtime of the file the store was
+converted from.
+"""
+import json
+import os
+import shutil
+
+import numpy as np
+
+
+def _source_stamp(source_path):
+    stat = os.stat(str(source_path))
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def _dir_stamp(store_dir):
+    # a rewritten store is a new directory
+    try:
+        stat = os.stat(store_dir)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns
+
+
+class GraphStore:
+    array_names = ('node_ids', 'indptr', 'indices', 'graph_offsets', 'graph_ids', 'labels')
+    source_file_name = 'source.json'
+
+    _opened = {}
+
+    def __init__(self, store_dir):
+        self.store_dir = str(store_dir)
+        self._arrays = None
+        self._dir_stamp = _dir_stamp(self.store_dir)
+
+    @classmethod
+    def open(cls, store_dir):
+        """
+        Returns a store which is cached per process, e.g., in pool workers, until
+        store_dir is rewritten.
+        """
+        store_dir = str(store_dir)
+        store = cls._opened.get(store_dir)
+        if store is None or store._dir_stamp != _dir_stamp(store_dir):
+            store = cls._opened[store_dir] = cls(store_dir)
+        return store
+
+    @classmethod
+    def exists(cls, store_dir):
+        return all(os.path.isfile(os.path.join(str(store_dir), name + '.npy')) for name in cls.array_names)
+
+    @classmethod
+    def is_current(cls, store_dir, source_path):
+        """
+        True if the store exists and was converted from source_path as it is now.
+        """
+        source_file_path = os.path.join(str(store_dir), cls.source_file_name)
+        if not cls.exists(store_dir) or not os.path.isfile(source_file_path):
+            return False
+        with open(source_file_path, 'r') as f:
+            return json.load(f) == _source_stamp(source_path)
+
+    @classmethod
+    def write(cls, store_dir, graphs, source_path=None):
+        """
+        graphs: iterable of (graph_id, label, node_ids, neighbor_lists) where
+        neighbor_lists[k] are the neighbor ids of node_ids[k]. If source_path is
+        given, its size and mtime are recorded, see is_current.
+        The store is written to a temporary directory which is renamed at the end.
+        """
+        store_dir = str(store_dir)
+        tmp_dir = store_dir + '.tmp'
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+
+        node_ids, degrees, indices = [], [], []
+        graph_offsets, graph_ids, labels = [0], [], []
+
+        for graph_id, label, graph_node_ids, neighbor_lists in graphs:
+            node_ids.append(np.asarray(graph_node_ids, dtype=np.int64))
+            degrees.append(np.fromiter((len(n) for n in neighbor_lists), dtype=np.int64, count=len(neighbor_lists)))
+            indices.extend(np.asarray(n, dtype=np.int64) for n in neighbor_lists)
+            graph_offsets.append(graph_offsets[-1] + len(graph_node_ids))
+            graph_ids.append(graph_id)
+            labels.append(label)
+
+        degrees = np.concatenate(degrees) if len(degrees) > 0 else np.zeros(0, dtype=np.int64)
+        indptr = np.zeros(len(degrees) + 1, dtype=np.int64)
+        np.cumsum(degrees, out=indptr[1:])
+
+        arrays = {
+            'node_ids': np.concatenate(node_ids) if len(node_ids) > 0 else np.zeros(0, dtype=np.int64),
+            'indptr': indptr,
+            'indices': np.concatenate(indices) if len(indices) > 0 else np.zeros(0, dtype=np.int64),
+            'graph_offsets': np.array(graph_offsets, dtype=np.int64),
+            'graph_ids': np.array(graph_ids, dtype=np.int64),
+            'labels': np.array(labels, dtype=np.int64),
+        }
+
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_dir, name + '.npy'), array)
+
+        if source_path is not None:
+            with open(os.path.join(tmp_dir, cls.source_file_name), 'w') as f:
+                json.dump(_source_stamp(source_path), f)
+
+        shutil.rmtree(store_dir, ignore_errors=True)
+        os.rename(tmp_dir, store_dir)
+
+        return cls(store_dir)
+
+    def __getstate__(self):
+        # only the path is sent to pool workers
+        return {'store_dir': self.store_dir}
+
+    def __setstate__(self, state):
+        self.store_dir = state['store_dir']
+        self._arrays = None
+        self._dir_stamp = _dir_stamp(self.store_dir)
+
+    @property
+    def arrays(self):
+        if self._arrays is None:
+            self._arrays = {name: np.load(os.path.join(self.store_dir, name + '.npy'), mmap_mode='r')
+                            for name in self.array_names}
+        return self._arrays
+
+    def __len__(self):
+        return len(self.arrays['graph_ids'])
+
+    def graph_id(self, index: int):
+        return int(self.arrays['graph_ids'][index])
+
+    def label(self, index: int):
+        return int(self.arrays['labels'][index])
+
+    def csr(self, index: int):
+        """
+        Returns (node_ids, indptr, indices) of the graph where indptr is
+        relative to the returned indices.
+        """
+        a = self.arrays
+        start, stop = a['graph_offsets'][index], a['graph_offsets'][index + 1]
+        indptr = np.array(a['indptr'][start:stop + 1])
+        indices = np.array(a['indices'][indptr[0]:indptr[-1]])
+        return np.array(a['node_ids'][start:stop]), indptr - indptr[0], indices
+
+    def graph_dict(self, index: int):
+        """
+        Returns the graph in the format of the reddit pickles,
+        {node_id: {'neighbors': [...]}}.
+        """
+        node_ids, indptr, indices = self.csr(index)
+        indices = indices.tolist()
+        return {node_id: {'neighbors': indices[indptr[k]:indptr[k + 1]]}
+                for k, node_id in enumerate(node_ids.tolist())}
@@ -1,13 +1,19 @@
 import datetime
+import json
 import sys
 import time
 
+from collections import defaultdict
+from contextlib import contextmanager
+
 
 class SimpleProgressCounter:
-    def __init__(self, max=100, caption=None):
+    def __init__(self, max=100, caption=None, min_interval=0.5):
         self.state = 0
         self.max = max
+        self.min_interval = min_interval
         self._time_progress_triggered_first_time = None
+        self._time_last_display = 0.
         self._displayed_once = False
 
         self._suffix = ""
@@ -24,6 +30,7 @@ class SimpleProgressCounter:
 
         print(self._suffix + self.value + '               ', end='\r')
         sys.stdout.flush()
+        self._time_last_display = time.time()
 
     def trigger_progress(self):
         self.state += 1
@@ -38,4 +45,137 @@ class SimpleProgressCounter:
             text += '   Remaining time: {}'.format(str(datetime.timedelta(seconds=int(estimated_remaining_time))))
 
         self.value = text
-        self.display()
+
+        if self.state == self.max or time.time() - self._time_last_display >= self.min_interval:
+            self.display()
+
+
+class ProgressMetrics:
+    """
+    Progress display and throughput metrics of a generator run.
+
+    The display is rate limited to one line every min_interval seconds. If the
+    stream is not a terminal (e.g. cluster logs) full lines are printed every
+    log_interval seconds instead of overwriting the current line.
+
+    Stage times measured in the parent process are recorded with the stage
+    context manager, times measured in the workers are added with
+    add_stage_time. Worker utilization is the sum of the times of the stages
+    in worker_stages relative to the wall time of n_workers.
+    """
+    def __init__(self,
+                 max: int = None,
+                 caption: str = None,
+                 n_workers: int = 1,
+                 worker_stages=('read', 'compute'),
+                 min_interval: float = 1.0,
+                 log_interval: float = 60.0,
+                 stream=None):
+        self.max = max
+        self.caption = caption
+        self.n_workers = n_workers
+        self.worker_stages = tuple(worker_stages)
+        self.stream = sys.stdout if stream is None else stream
+
+        is_tty = hasattr(self.stream, 'isatty') and self.stream.isatty()
+        self._interactive = is_tty
+        self.min_interval = min_interval if is_tty else log_interval
+
+        self.n_jobs = 0
+        self.n_bytes = 0
+        self.stage_times = defaultdict(float)
+        self.stage_counts = defaultdict(int)
+
+        self._t_start = time.time()
+        self._t_last_display = 0.
+
+    def start(self):
+        self._t_start = time.time()
+        self.display(force=True)
+
+    @property
+    def elapsed(self):
+        return time.time() - self._t_start
+
+    @contextmanager
+    def stage(self, name: str):
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_stage_time(name, time.perf_counter() - t)
+
+    def add_stage_time(self, name: str, seconds: float):
+        self.stage_times[name] += seconds
+        self.stage_counts[name] += 1
+
+    def add_stage_times(self, timings: dict):
+        for name, seconds in timings.items():
+            self.add_stage_time(name, seconds)
+
+    def trigger_progress(self, n_jobs: int = 1, n_bytes: int = 0):
+        self.n_jobs += n_jobs
+        self.n_bytes += n_bytes
+        self.display(force=self.n_jobs == self.max)
+
+    def _text(self):
+        elapsed = max(self.elapsed, 1e-9)
+        jobs_per_s = self.n_jobs / elapsed
+
+        text = 'Jobs done: {}/{}'.format(self.n_jobs, '?' if self.max is None else self.max)
+        text += '   {:.1f} jobs/s'.format(jobs_per_s)
+
+        if self.n_bytes > 0:
+            text += '   {:.1f} MB/s'.format(self.n_bytes / elapsed / 1e6)
+
+        if self.max is not None and self.n_jobs > 0:
+            remaining = (self.max - self.n_jobs) / jobs_per_s
+            text += '   Remaining time: {}'.format(str(datetime.timedelta(seconds=int(remaining))))
+
+        if self.caption is not None:
+            text = self.caption + '   ...   ' + text
+
+        return text
+
+    def display(self, force=False):
+        now = time.time()
+        if not force and now - self._t_last_display < self.min_interval:
+            return
+
+        self._t_last_display = now
+        if self._interactive:
+            print(self._text() + '               ', end='\r', file=self.stream)
+        else:
+            print(self._text(), file=self.stream)
+        self.stream.flush()
+
+    def summary(self):
+        elapsed = self.elapsed
+        worker_time = sum(self.stage_times[k] for k in self.worker_stages if k in self.stage_times)
+
+        return {
+            'caption': self.caption,
+            'n_jobs': self.n_jobs,
+            'n_bytes': self.n_bytes,
+            'elapsed_s': elapsed,
+            'jobs_per_s': self.n_jobs / elapsed if elapsed > 0 else None,
+            'bytes_per_s': self.n_bytes / elapsed if elapsed > 0 else None,
+            'n_workers': self.n_workers,
+            'worker_utilization': worker_time / (elapsed * self.n_workers) if elapsed > 0 else None,
+            'stages': {k: {'total_s': v,
+                           'count': self.stage_counts[k],
+                           'mean_s': v / self.stage_counts[k]}
+                       for k, v in self.stage_times.items()}
+        }
+
+    def finish(self, summary_path=None):
+        self.display(force=True)
+        if self._interactive:
+            print('', file=self.stream)
+
+        summary = self.summary()
+        if summary_path is not None:
+            with open(str(summary_path), 'w') as f:
+                json.dump(summary, f, indent=2)
+
+        return summary
@@ -0,0 +1,59 @@
+import itertools
+
+from collections import deque
+
+
+DIAGRAM_KEYS = ('dim_0', 'dim_0_ess', 'dim_1_ess')
+
+
+def create_n_points_datasets(h5file, n_samples, filtration_names=None, keys=DIAGRAM_KEYS):
+    """
+    Creates 'n_points'/<key> or, if filtration_names is given,
+    'n_points'/<filtration>/<key>. Returns them by (filtration name or None, key).
+    """
+    names = [None] if filtration_names is None else list(filtration_names)
+    grp_n_points = h5file.create_group('n_points')
+
+    return {(name, k): grp_n_points.create_dataset(k if name is None else name + '/' + k,
+                                                   dtype='i8',
+                                                   shape=(n_samples,))
+            for name in names for k in keys}
+
+
+def write_diagrams(grp_index, dgms, ds_n_points, index):
+    """
+    dgms: {filtration name or None: {key: diagram}}, the diagrams of None are
+    written directly to grp_index, the others to grp_index/<filtration>.
+    Returns the number of written bytes.
+    """
+    n_bytes = 0
+    for name, dgms_of_filtration in dgms.items():
+        grp = grp_index if name is None else grp_index.create_group(name)
+
+        for k, dgm in dgms_of_filtration.items():
+            grp.create_dataset(k, data=dgm)
+            ds_n_points[(name, k)][index] = len(dgm)
+            n_bytes += dgm.nbytes
+
+    return n_bytes
+
+
+def ordered_imap(pool, func, iterable, window: int):
+    """
+    Like pool.imap the results are yielded in the order of iterable, such that
+    the groups are written in index order and the file can be read
+    sequentially. Unlike pool.imap at most window tasks are submitted and not
+    yet consumed: finished results wait in this reorder window for the earlier
+    ones, and a slow task stalls the submission of new ones (back-pressure)
+    instead of letting arguments and results pile up in memory.
+    """
+    assert window >= 1
+    args_iter = iter(iterable)
+    pending = deque(pool.apply_async(func, (args,)) for args in itertools.islice(args_iter, window))
+
+    while len(pending) > 0:
+        ret_val = pending.popleft().get()
+        # refill before yielding such that the workers keep busy while the result is written
+        for args in itertools.islice(args_iter, 1):
+            pending.append(pool.apply_async(func, (args,)))
+        yield ret_val
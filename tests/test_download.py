@@ -0,0 +1,133 @@
+import hashlib
+import http.server
+import os
+import re
+import threading
+
+import pytest
+
+from chofer_tda_datasets.utils.download import download_file, DownloadError, UnverifiedDownloadWarning
+
+
+DATA = os.urandom(3 * 1024 ** 2 + 123)
+SHA256 = hashlib.sha256(DATA).hexdigest()
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    """
+    Serves DATA with range requests. The first truncate_first responses are
+    cut off after half of their bytes.
+    """
+    def do_GET(self):
+        server = self.server
+        start, end = 0, len(DATA) - 1
+        match = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+        if match is not None and server.accepts_ranges:
+            start = int(match.group(1))
+            end = int(match.group(2)) if match.group(2) else end
+
+        body = DATA[start:end + 1]
+        with server.lock:
+            server.ranges.append((start, end))
+            truncate = server.truncate_first > 0 and len(body) > 1
+            server.truncate_first -= int(truncate)
+
+        self.send_response(206 if match is not None and server.accepts_ranges else 200)
+        if match is not None and server.accepts_ranges:
+            self.send_header('Content-Range', 'bytes {}-{}/{}'.format(start, end, len(DATA)))
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+
+        body = body[:len(body) // 2] if truncate else body
+        server.n_bytes_served += len(body)
+        self.wfile.write(body)
+        if truncate:
+            self.close_connection = True
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    server.lock = threading.Lock()
+    server.ranges = []
+    server.accepts_ranges = True
+    server.truncate_first = 0
+    server.n_bytes_served = 0
+    server.url = 'http://127.0.0.1:{}/file'.format(server.server_address[1])
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _read(path):
+    with open(str(path), 'rb') as f:
+        return f.read()
+
+
+@pytest.mark.parametrize('n_parts', [1, 4])
+def test_download_verified(server, tmp_path, n_parts):
+    destination = tmp_path.joinpath('file')
+    summary = download_file(server.url, destination, sha256=SHA256, n_parts=n_parts, show_progress=False)
+
+    assert _read(destination) == DATA
+    assert summary['sha256'] == SHA256 and summary['n_parts'] == n_parts
+    assert not os.path.exists(str(destination) + '.part')
+    assert not os.path.exists(str(destination) + '.part.state')
+
+
+def test_parallel_parts_are_ranges(server, tmp_path):
+    download_file(server.url, tmp_path.joinpath('file'), sha256=SHA256, n_parts=3, show_progress=False)
+
+    # the probe and one range per part
+    ends = sorted(end for start, end in server.ranges[1:])
+    assert len(ends) == 3 and ends[-1] == len(DATA) - 1
+
+
+def test_resume_requests_only_missing_bytes(server, tmp_path):
+    destination = tmp_path.joinpath('file')
+    with open(str(destination) + '.part', 'wb') as f:
+        f.write(DATA[:1024 ** 2])
+
+    download_file(server.url, destination, sha256=SHA256, show_progress=False)
+
+    assert _read(destination) == DATA
+    assert server.ranges[-1] == (1024 ** 2, len(DATA) - 1)
+
+
+@pytest.mark.parametrize('n_parts', [1, 2])
+def test_retry_after_closed_connection(server, tmp_path, n_parts):
+    server.truncate_first = 1 + n_parts
+    destination = tmp_path.joinpath('file')
+    download_file(server.url, destination, sha256=SHA256, n_parts=n_parts, show_progress=False)
+
+    assert _read(destination) == DATA and server.truncate_first == 0
+
+
+def test_without_range_support(server, tmp_path):
+    server.accepts_ranges = False
+    destination = tmp_path.joinpath('file')
+    with open(str(destination) + '.part', 'wb') as f:
+        f.write(b'stale')
+
+    summary = download_file(server.url, destination, sha256=SHA256, n_parts=4, show_progress=False)
+
+    assert _read(destination) == DATA and summary['n_parts'] == 1
+
+
+def test_checksum_mismatch(server, tmp_path):
+    destination = tmp_path.joinpath('file')
+    with pytest.raises(DownloadError):
+        download_file(server.url, destination, sha256='0' * 64, show_progress=False)
+
+    assert not os.path.exists(str(destination))
+    assert not os.path.exists(str(destination) + '.part')
+
+
+def test_missing_checksum_warns(server, tmp_path):
+    with pytest.warns(UnverifiedDownloadWarning, match=SHA256):
+        download_file(server.url, tmp_path.joinpath('file'), show_progress=False)
@@ -0,0 +1,37 @@
+import sys
+
+import numpy as np
+
+from pathlib import Path
+from scipy.sparse.csgraph import laplacian, shortest_path
+
+sys.path.insert(0, str(Path(__file__).parents[1].joinpath('generation_code')))
+from generation.utils.filtrations import Graph, compute_filtration  # noqa: E402
+
+
+def _random_graph(n_vertices, seed=0):
+    rng = np.random.RandomState(seed)
+    return Graph.from_edge_list(n_vertices, rng.randint(n_vertices, size=(3 * n_vertices, 2)))
+
+
+def test_heat_kernel_signature_matches_dense():
+    # larger than block_size, such that several blocks are computed
+    graph = _random_graph(300)
+    for t in (0.1, 1., 10.):
+        eigenvalues, eigenvectors = np.linalg.eigh(laplacian(graph.adjacency, normed=True).toarray())
+        expected = (eigenvectors ** 2) @ np.exp(-t * eigenvalues)
+
+        vertex_values, edge_values = compute_filtration(graph, 'heat_kernel_signature', t=t, block_size=64)
+        np.testing.assert_allclose(vertex_values, expected, rtol=1e-8, atol=1e-12)
+        assert np.all(edge_values >= vertex_values[graph.edges].max(axis=1) - 1e-12)
+
+
+def test_closeness_matches_all_pairs():
+    graph = _random_graph(200)
+    distances = shortest_path(graph.adjacency, unweighted=True)
+    reachable = np.isfinite(distances)
+    total = np.where(reachable, distances, 0).sum(axis=1)
+    expected = np.where(total > 0, (reachable.sum(axis=1) - 1) / np.maximum(total, 1), 0.)
+
+    vertex_values, _ = compute_filtration(graph, 'closeness', block_size=17)
+    np.testing.assert_allclose(vertex_values, expected)
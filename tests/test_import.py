@@ -0,0 +1,18 @@
+import subprocess
+import sys
+
+from pathlib import Path
+
+
+def test_import_does_not_load_h5py_or_requests():
+    # a fresh interpreter, this one may have imported them already
+    script = "import sys, chofer_tda_datasets; print('h5py' in sys.modules, 'requests' in sys.modules)"
+    output = subprocess.check_output([sys.executable, '-c', script], cwd=str(Path(__file__).parents[1]))
+    assert output.decode().split() == ['False', 'False']
+
+
+def test_dataset_classes_are_imported_on_access():
+    script = "import chofer_tda_datasets; print(chofer_tda_datasets.Reddit12kJmlr.__name__, " \
+             "sorted(set(chofer_tda_datasets.__all__) - set(dir(chofer_tda_datasets))))"
+    output = subprocess.check_output([sys.executable, '-c', script], cwd=str(Path(__file__).parents[1]))
+    assert output.decode().strip() == 'Reddit12kJmlr []'
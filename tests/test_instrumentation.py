@@ -0,0 +1,48 @@
+import multiprocessing
+
+import pytest
+
+from chofer_tda_datasets.utils import instrumentation
+
+
+def _read(i):
+    with instrumentation.timed('read'):
+        pass
+    return i
+
+
+@pytest.fixture
+def dump_dir(tmp_path):
+    yield str(tmp_path)
+    # without dump_dir again
+    instrumentation.enable()
+    instrumentation.disable()
+    instrumentation.reset()
+
+
+@pytest.mark.parametrize('clean_exit', [True, False])
+def test_workers_are_aggregated(dump_dir, clean_exit):
+    instrumentation.enable(dump_dir=dump_dir, dump_every=1)
+    ctx = multiprocessing.get_context('fork')
+    if clean_exit:
+        pool = ctx.Pool(3)
+        pool.map(_read, range(65), chunksize=1)
+        pool.close()
+        pool.join()
+    else:
+        # terminates the workers, only the dumps while running are kept
+        with ctx.Pool(3) as pool:
+            pool.map(_read, range(65), chunksize=1)
+
+    instrumentation.disable()
+    assert instrumentation.aggregate(dump_dir)['stages']['read']['count'] == 65
+
+
+def test_timed_records_raising_block():
+    instrumentation.reset()
+    with pytest.raises(ValueError):
+        with instrumentation.timed('failing'):
+            raise ValueError()
+
+    assert instrumentation.snapshot()['stages']['failing']['count'] == 1
+    instrumentation.reset()